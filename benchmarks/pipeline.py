@@ -0,0 +1,247 @@
+# Pipeline Benchmark - Times every stage of setlist generation on synthetic catalogs of growing size, so a change that
+# makes a stage slower (or hungrier) shows up.
+# usage: python benchmarks/pipeline.py [--sizes 100 1000 10000 100000] [--repeat 3] [--seed 0] [--threshold 20]
+#                                      [--min-ms 1] [--history FILE] [--no-gui] [--no-headless]
+# For each size it makes a catalog with synthetic_catalog.py and measures (median of --repeat runs, plus the peak
+# memory of one more run under tracemalloc):
+#   parse_csv: loading the csv with no catalog cache     load_cached: loading it again through the cache
+#   make_setlist, candidates (best of 20), sort_clusters, optimize_order, render_text, render_formats (every renderer)
+#   show_active_songs, library_toggle (exclude 100 songs and build the pool)
+#   search_build: building the search index          search_query: a few searches as they are typed, with a filter
+#   history_load: the recency weights from a play history of 1500 gigs, read through its summary
+#   constrained: 20 candidates that follow a few rules (1 tuning change, artist spacing, no Misc segues), ordered
+#   gui_refresh: handing a new library to the Includes/Excludes table and repainting the first 50 rows after a toggle
+#   headless: `main.py generate --count 10` in a fresh process, with its peak resident memory
+# Results are appended as one JSON line (with the git commit) to the history file. Every stage is compared with the
+# last run in the history, and the exit code is 1 if any got more than --threshold percent
+# (and at least --min-ms) slower.
+
+import argparse
+import datetime
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+sys.path.insert(0, SRC)
+
+import numpy as np
+from synthetic_catalog import write_catalog
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+# Median time of run() in ms over repeat runs, then the peak memory of one more run in KB
+def measure(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(median_ms=statistics.median(times), min_ms=min(times), peak_kb=peak / 1024)
+
+# The in-process stages for one catalog, as name -> function
+def pipeline_stages(csv_path, seed, gui):
+    import catalog
+    from setlist_math import make_setlist, make_setlist_candidates, sort_sample_into_clusters, write_setlist_to_string, show_active_songs, catalog_arrays
+    from song_library import SongLibrary
+    from ordering import order_setlist
+    from renderers import RENDERERS, render_setlist
+    from song_search import SongIndex
+    import play_history
+    from set_constraints import check_constraints, make_constrained_candidates, constrained_order
+
+    def parse_csv():
+        catalog.clear_loaded_catalogs()
+        try:
+            os.remove(catalog.cache_path(csv_path))
+        except FileNotFoundError:
+            pass
+        catalog.load_catalog(csv_path)
+
+    def load_cached():
+        catalog.clear_loaded_catalogs()
+        catalog.load_catalog(csv_path)
+
+    df = catalog.load_catalog(csv_path)
+    active = df[df["Active"] == True].reset_index(drop=True)
+    rng = np.random.default_rng(seed)
+    setlist = make_setlist(active, 54, 1.2, 0.8, [], rng=rng)
+    times, moods, _ = catalog_arrays(setlist)
+    library = SongLibrary.from_csv(csv_path)
+    toggled = rng.choice(len(library), size=min(100, len(library)), replace=False)
+
+    def render_formats():
+        for name in RENDERERS:
+            render_setlist(setlist, io.StringIO(), name)
+
+    index = SongIndex(df)
+
+    def search_query():
+        for text in ("l", "lo", "lov", "love", "love n"):
+            index.search(text, {"Tuning": ["Drop D"]})
+
+    # Four years of gigs, 20 songs each
+    if play_history.history_fingerprint(csv_path) is None:
+        names = np.asarray(df["Song"])
+        first_day = datetime.date(2020, 1, 1)
+        for day in range(1500):
+            play_history.record_play(csv_path, names[rng.integers(0, len(names), 20)], first_day + datetime.timedelta(days=day))
+
+    def history_load():
+        play_history.clear_loaded_history()
+        play_history.recency_multipliers(csv_path, df["Song"])
+
+    rules = check_constraints(dict(max_tuning_changes=1, artist_spacing=2, max_per_artist=2, no_misc_segues=True))
+
+    def constrained():
+        for _, candidate in make_constrained_candidates(library, 54, 1.2, 0.8, n_candidates=20, top_k=10, constraints=rules, rng=rng):
+            constrained_order(sort_sample_into_clusters(candidate, 2), rules)
+
+    def library_toggle():
+        library.exclude(toggled)
+        library.active_pool()
+        library.remove(toggled)
+
+    stages = dict(
+        parse_csv=parse_csv,
+        load_cached=load_cached,
+        make_setlist=lambda: make_setlist(active, 54, 1.2, 0.8, [], rng=rng),
+        candidates=lambda: make_setlist_candidates(active, 54, 1.2, 0.8, [], n_candidates=20, top_k=10, rng=rng),
+        sort_clusters=lambda: sort_sample_into_clusters(setlist.copy(), 2),
+        optimize_order=lambda: order_setlist(times, setlist["Key"], setlist["Tuning"], moods, set_time=60, rng=rng),
+        render_text=lambda: write_setlist_to_string(setlist),
+        render_formats=render_formats,
+        show_active_songs=lambda: show_active_songs(df),
+        library_toggle=library_toggle,
+        search_build=lambda: SongIndex(df),
+        search_query=search_query,
+        history_load=history_load,
+        constrained=constrained,
+    )
+    if gui:
+        from PyQt5.QtCore import Qt
+        from gui import SongTableModel
+        model = SongTableModel()
+
+        def gui_refresh():
+            model.set_library(library.copy())
+            model.rows_changed(library.exclude(toggled))
+            for row in range(min(50, model.rowCount())):
+                for column in range(model.columnCount()):
+                    model.data(model.index(row, column))
+                    model.data(model.index(row, column), Qt.ForegroundRole) # The include/exclude colours
+            library.remove(toggled)
+        stages["gui_refresh"] = gui_refresh
+    return stages
+
+# Runs main.py generate in a fresh process. Returns the wall time in ms and the peak resident memory of the process in KB
+def run_headless(csv_path, out):
+    command = [sys.executable, os.path.join(SRC, "main.py"), "generate", "--csv", csv_path, "--out", out, "--count", "10", "--seed", "0"]
+    result = subprocess.run([sys.executable, "-c", HEADLESS_SNIPPET, *command], capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"headless generate failed: {result.stderr.strip()}")
+    wall_ms, peak_kb = result.stdout.split()
+    return float(wall_ms), float(peak_kb)
+
+# Runs the command as its only child, so RUSAGE_CHILDREN is the peak of that one process (ru_maxrss is KB on Linux)
+HEADLESS_SNIPPET = """
+import resource, subprocess, sys, time
+start = time.perf_counter()
+subprocess.run(sys.argv[1:], check=True, stdout=subprocess.DEVNULL)
+print((time.perf_counter() - start) * 1000, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+"""
+
+def last_record(history):
+    try:
+        with open(history) as file:
+            lines = [line for line in file if line.strip()]
+    except FileNotFoundError:
+        return None
+    for line in reversed(lines):
+        try:
+            return json.loads(line)
+        except ValueError:
+            continue
+    return None
+
+# Stages that got more than threshold percent (and min_ms) slower than in the previous record, as (size, stage, before, after).
+# min_ms keeps timer noise on the very fast stages from counting
+def regressions(previous, record, threshold, min_ms):
+    found = []
+    for size, stages in record["results"].items():
+        before = previous["results"].get(size, {}) if previous else {}
+        for stage, result in stages.items():
+            if stage not in before:
+                continue
+            slower = result["median_ms"] - before[stage]["median_ms"]
+            if slower > before[stage]["median_ms"] * threshold / 100 and slower >= min_ms:
+                found.append((size, stage, before[stage]["median_ms"], result["median_ms"]))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the setlist pipeline on synthetic catalogs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000], help="catalog sizes (default: 100 1000 10000 100000)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the catalogs and the sampling (default: 0)")
+    parser.add_argument("--threshold", type=float, default=20, help="percent slowdown that counts as a regression (default: 20)")
+    parser.add_argument("--min-ms", type=float, default=1, help="smallest slowdown in ms that counts as a regression (default: 1)")
+    parser.add_argument("--history", default=os.path.join(ROOT, "benchmarks", "pipeline_history.jsonl"), help="file to append the results to")
+    parser.add_argument("--no-gui", action="store_true", help="skip the GUI list refresh")
+    parser.add_argument("--no-headless", action="store_true", help="skip the end-to-end headless run")
+    args = parser.parse_args()
+
+    import warnings
+    warnings.filterwarnings("ignore")
+    gui = not args.no_gui
+    if gui:
+        if sys.platform.startswith("linux") and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+            os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        try:
+            from PyQt5.QtWidgets import QApplication
+            app = QApplication.instance() or QApplication(sys.argv)
+        except ImportError:
+            print("Skipping the GUI list refresh (PyQt5 is not installed)")
+            gui = False
+
+    record = dict(date=datetime.datetime.now().isoformat(timespec="seconds"), commit=git_commit(), python=sys.version.split()[0],
+                  seed=args.seed, repeat=args.repeat, results={})
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["SETLIST_CACHE_DIR"] = os.path.join(directory, "cache") # Never touch the real catalog cache
+        for size in args.sizes:
+            csv_path = write_catalog(size, os.path.join(directory, f"songs_{size}.csv"), seed=args.seed)
+            results = {}
+            for stage, run in pipeline_stages(csv_path, args.seed, gui).items():
+                results[stage] = measure(run, args.repeat)
+            if not args.no_headless:
+                runs = [run_headless(csv_path, os.path.join(directory, "out")) for _ in range(args.repeat)]
+                results["headless"] = dict(median_ms=statistics.median(wall for wall, _ in runs), min_ms=min(wall for wall, _ in runs),
+                                           peak_kb=max(peak for _, peak in runs))
+            record["results"][str(size)] = results
+            print(f"{size} songs:")
+            for stage, result in results.items():
+                print(f"  {stage:18} {result['median_ms']:10.2f} ms  (peak {result['peak_kb'] / 1024:8.1f} MB)")
+
+    found = regressions(last_record(args.history), record, args.threshold, args.min_ms)
+    with open(args.history, "a") as file:
+        file.write(json.dumps(record) + "\n")
+    for size, stage, before, after in found:
+        print(f"Regression: {stage} on {size} songs went from {before:.2f} ms to {after:.2f} ms")
+    return 1 if found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
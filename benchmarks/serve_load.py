@@ -0,0 +1,145 @@
+# Serve Load Test - Hammers a local `main.py serve` with concurrent clients and reports latency and throughput.
+# usage: python benchmarks/serve_load.py [--csv songs.csv | --songs 10000] [--clients 8] [--requests 400]
+#                                        [--mix generate=1,toggle=3,songs=1] [--cached] [--url http://127.0.0.1:8765]
+# Without --url it starts a server on a free port (with the catalog warmed up) and stops it at the end. Without --csv
+# it makes a synthetic catalog with synthetic_catalog.py. Every client opens its own session and keeps one
+# keep-alive connection, then the clients send --requests requests between them, picked by the --mix weights:
+#   generate: a run with a new seed (or the same seed every time with --cached, to measure the result cache)
+#   toggle: excludes or includes a random song       songs: reads a page of the song list
+# Prints p50, p99 and max latency per request type and overall, and the requests per second.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+class Client:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def post(self, path, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.writer.write(f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+        await self.writer.drain()
+        head = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(head[0].split(" ")[1])
+        length = next(int(line.split(":", 1)[1]) for line in head[1:] if line.lower().startswith("content-length:"))
+        text = (await self.reader.readexactly(length)).decode("utf-8")
+        if status != 200:
+            raise RuntimeError(f"{path} failed with {status}: {text}")
+        return json.loads(text) if text.startswith("{") else text
+
+    def close(self):
+        self.writer.close()
+
+# Picks request types by weight, e.g. "generate=1,toggle=3"
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("generate", "toggle", "songs"):
+            raise ValueError(f"Unknown request type {name.strip()!r}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+async def run_client(client_id, host, port, song_file, jobs, mix, cached, latencies):
+    client = Client(host, port)
+    await client.connect()
+    session = (await client.post("/session", dict(song_file=song_file)))["session"]
+    total = (await client.post("/songs", dict(session=session, limit=0)))["total"]
+    rng = random.Random(client_id)
+    names, weights = list(mix), list(mix.values())
+    while jobs:
+        jobs.pop()
+        kind = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        if kind == "generate":
+            await client.post("/generate", dict(session=session, seed=0 if cached else rng.randrange(1 << 31)))
+        elif kind == "toggle":
+            await client.post(rng.choice(["/exclude", "/include", "/remove"]), dict(session=session, songs=[rng.randrange(total)]))
+        else:
+            await client.post("/songs", dict(session=session, offset=rng.randrange(max(total - 50, 1)), limit=50))
+        latencies.setdefault(kind, []).append((time.perf_counter() - start) * 1000)
+    client.close()
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+def report(latencies, seconds):
+    everything = [value for values in latencies.values() for value in values]
+    print(f"{'request':10} {'count':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind, values in sorted(latencies.items()) + [("all", everything)]:
+        print(f"{kind:10} {len(values):6d} {statistics.median(values):9.2f} {percentile(values, 99):9.2f} {max(values):9.2f}")
+    print(f"{len(everything) / seconds:.1f} requests per second ({len(everything)} in {seconds:.2f} s)")
+
+# Starts main.py serve on a free port and waits until it is listening. Returns the process and the port
+def start_server(song_file, workers):
+    command = [sys.executable, os.path.join(SRC, "main.py"), "serve", "--port", "0", "--csv", song_file]
+    if workers:
+        command += ["--workers", str(workers)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("Serving on"):
+        process.kill()
+        raise RuntimeError("The server did not start")
+    return process, int(line.strip().rsplit(":", 1)[1])
+
+async def load_test(host, port, song_file, args):
+    latencies = {}
+    jobs = list(range(args.requests))
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(i, host, port, song_file, jobs, parse_mix(args.mix), args.cached, latencies) for i in range(args.clients)))
+    return latencies, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for main.py serve")
+    parser.add_argument("--csv", help="song file to use (default: a synthetic catalog)")
+    parser.add_argument("--songs", type=int, default=10000, help="size of the synthetic catalog (default: 10000)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients (default: 8)")
+    parser.add_argument("--requests", type=int, default=400, help="requests in total (default: 400)")
+    parser.add_argument("--mix", default="generate=1,toggle=3,songs=1", help="request types and weights (default: generate=1,toggle=3,songs=1)")
+    parser.add_argument("--cached", action="store_true", help="use the same seed for every generate request")
+    parser.add_argument("--workers", type=int, help="generation threads of the started server (default: one per CPU)")
+    parser.add_argument("--url", help="test a server that is already running instead of starting one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        song_file = args.csv
+        if song_file is None:
+            sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+            from synthetic_catalog import write_catalog
+            song_file = write_catalog(args.songs, os.path.join(directory, f"songs_{args.songs}.csv"))
+        song_file = os.path.abspath(song_file)
+        process = None
+        if args.url:
+            host, _, port = args.url.split("://")[-1].rstrip("/").partition(":")
+            port = int(port or 80)
+        else:
+            os.environ.setdefault("SETLIST_CACHE_DIR", os.path.join(directory, "cache"))
+            process, port = start_server(song_file, args.workers)
+            host = "127.0.0.1"
+        try:
+            latencies, seconds = asyncio.run(load_test(host, port, song_file, args))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+    report(latencies, seconds)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# Startup Benchmark - Measures how long a cold start takes, so slow imports sneaking back in get caught.
+# usage: python benchmarks/startup.py [--csv songs.csv] [--runs 5] [--budget-ms 300] [--history FILE] [--no-gui]
+# Each run is a fresh Python process. It measures:
+#   cli: wall-clock time from starting `main.py generate` until the first setlist file is reported
+#   gui: wall-clock time from starting Python until the main window has been shown (offscreen if there is no display)
+# It also runs the headless command once with `python -X importtime` and lists the slowest imports.
+# The catalog cache is warmed up first, so "cold" means a cold process, not a missing cache.
+# Results are appended as one JSON line to the history file, and the exit code is 1 if the median headless start is
+# over the budget.
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+MAIN = os.path.join(SRC, "main.py")
+
+GUI_SNIPPET = """
+import sys
+sys.path.insert(0, {src!r})
+from gui import QApplication, SetlistGeneratorWindow
+app = QApplication(sys.argv)
+window = SetlistGeneratorWindow()
+app.processEvents()
+print("shown", flush=True)
+"""
+
+# Time from starting the command until it prints its first line
+def time_to_first_line(command, env):
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env, text=True)
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    process.communicate()
+    if not line or process.returncode:
+        raise RuntimeError(f"{' '.join(command)} failed")
+    return elapsed * 1000
+
+def cli_command(csv, out):
+    return [sys.executable, MAIN, "generate", "--csv", csv, "--out", out, "--count", "1"]
+
+# The slowest imports of a command, by cumulative time, from -X importtime
+def slowest_imports(command, env, count=10):
+    result = subprocess.run([command[0], "-X", "importtime"] + command[1:], capture_output=True, env=env, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        # Lines look like "import time:   self [us] | cumulative | imported package", with a header line first
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, module = line[len("import time:"):].split("|")
+        imports.append((int(cumulative), int(own), module.strip()))
+    imports.sort(reverse=True)
+    return [dict(module=module, cumulative_ms=cumulative / 1000, self_ms=own / 1000) for cumulative, own, module in imports[:count]]
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark for the setlist generator")
+    parser.add_argument("--csv", default=os.path.join(ROOT, "songs.csv"), help="song csv file (default: songs.csv)")
+    parser.add_argument("--runs", type=int, default=5, help="runs per measurement (default: 5)")
+    parser.add_argument("--budget-ms", type=float, default=300, help="fail if the median headless start is slower (default: 300)")
+    parser.add_argument("--history", default=os.path.join(ROOT, "benchmarks", "startup_history.jsonl"), help="file to append the results to")
+    parser.add_argument("--no-gui", action="store_true", help="skip the GUI measurement")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if sys.platform.startswith("linux") and not env.get("DISPLAY") and not env.get("WAYLAND_DISPLAY"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    record = dict(date=datetime.datetime.now().isoformat(timespec="seconds"), python=sys.version.split()[0], csv=os.path.basename(args.csv), runs=args.runs)
+    with tempfile.TemporaryDirectory() as out:
+        command = cli_command(args.csv, out)
+        time_to_first_line(command, env) # Warm up the catalog cache
+        cli_times = [time_to_first_line(command, env) for _ in range(args.runs)]
+        record["cli_ms"] = dict(median=statistics.median(cli_times), min=min(cli_times), max=max(cli_times))
+        record["cli_imports"] = slowest_imports(command, env)
+
+    if not args.no_gui:
+        gui_command = [sys.executable, "-c", GUI_SNIPPET.format(src=SRC)]
+        try:
+            gui_times = [time_to_first_line(gui_command, env) for _ in range(args.runs)]
+            record["gui_ms"] = dict(median=statistics.median(gui_times), min=min(gui_times), max=max(gui_times))
+        except RuntimeError:
+            print("Skipping the GUI measurement (could not start the GUI)")
+
+    print(f"Headless generate, first result: median {record['cli_ms']['median']:.0f} ms (min {record['cli_ms']['min']:.0f}, max {record['cli_ms']['max']:.0f})")
+    if "gui_ms" in record:
+        print(f"GUI, first window: median {record['gui_ms']['median']:.0f} ms (min {record['gui_ms']['min']:.0f}, max {record['gui_ms']['max']:.0f})")
+    print("Slowest imports of the headless run (cumulative):")
+    for entry in record["cli_imports"]:
+        print(f"  {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+
+    with open(args.history, "a") as file:
+        file.write(json.dumps(record) + "\n")
+
+    if record["cli_ms"]["median"] > args.budget_ms:
+        print(f"Headless start is over the budget of {args.budget_ms:.0f} ms!")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
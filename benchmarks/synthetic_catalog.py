@@ -0,0 +1,56 @@
+# Synthetic Catalog - Makes song catalogs of any size with the same columns as songs.csv, for the benchmarks.
+# usage: python benchmarks/synthetic_catalog.py 10000 songs_10k.csv [--seed 0]
+# The same size and seed always give the same catalog. The columns look like a real band's catalog:
+#   Time: mostly 3 to 6 minutes with a long tail of jams, in half minutes
+#   Mood: 1 to 10, bunched around 6
+#   Tuning: mostly E Standard, then Drop D, Eb Standard and a few rarer ones
+#   Key: one of the 12 keys, or Misc for about 15% of the songs
+#   Artist: a few artists with lots of songs and many with a few, plus about 10% originals ("OG")
+#   Active: about 90% True
+
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+
+KEYS = ["C", "C#", "D", "Eb", "E", "F", "F#", "G", "G#", "A", "Bb", "B", "Misc"]
+KEY_WEIGHTS = [0.08, 0.04, 0.1, 0.05, 0.12, 0.05, 0.04, 0.1, 0.04, 0.1, 0.05, 0.08, 0.15]
+TUNINGS = ["E Standard", "Drop D", "Eb Standard", "D Standard", "Open G", "Drop C"]
+TUNING_WEIGHTS = [0.7, 0.13, 0.09, 0.04, 0.02, 0.02]
+WORDS = ["Love", "Night", "Fire", "River", "Dream", "Road", "Heart", "Blue", "Home", "Rain", "Light", "Gold", "Wild", "Song", "Sky", "Time"]
+
+def make_catalog(n, seed=0):
+    rng = np.random.default_rng(seed)
+    artists = max(n // 8, 1)
+    # Zipf-like: artist k gets about 1/k of the songs
+    artist_weights = 1 / np.arange(1, artists + 1)
+    artist = rng.choice(artists, size=n, p=artist_weights / artist_weights.sum())
+    artist_names = np.array([f"Artist {i}" for i in range(artists)], dtype=object)[artist]
+    artist_names[rng.random(n) < 0.1] = "OG"
+    words = np.array(WORDS, dtype=object)
+    songs = np.char.add(np.char.add(words[rng.integers(len(WORDS), size=n)].astype(str), " "), words[rng.integers(len(WORDS), size=n)].astype(str))
+    return pd.DataFrame(dict(
+        Song=[f"{song} {i}" for i, song in enumerate(songs)], # Numbered, so every name is unique
+        Artist=artist_names,
+        Key=rng.choice(KEYS, size=n, p=KEY_WEIGHTS),
+        Tuning=rng.choice(TUNINGS, size=n, p=TUNING_WEIGHTS),
+        Time=np.clip(np.round(rng.lognormal(np.log(4.5), 0.35, size=n) * 2) / 2, 1.5, 15.0),
+        Mood=np.clip(np.round(rng.normal(6, 2, size=n)), 1, 10).astype(int),
+        Active=rng.random(n) < 0.9,
+    ))
+
+def write_catalog(n, path, seed=0):
+    make_catalog(n, seed).to_csv(path, index=False)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Make a synthetic song catalog csv")
+    parser.add_argument("songs", type=int, help="number of songs")
+    parser.add_argument("output", help="csv file to write")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    args = parser.parse_args()
+    write_catalog(args.songs, args.output, args.seed)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
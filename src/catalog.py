@@ -0,0 +1,402 @@
+# Catalog - Loads song CSV files through a compiled binary cache, so the same CSV is only parsed as text once.
+# The first load parses the CSV with pandas and compiles it into a columnar .npz file in the cache directory (text
+# columns are stored as integer codes plus their unique values). Later loads read the .npz instead, and repeat loads in
+# the same process return the already loaded dataframe.
+# The cache for a CSV is keyed by its path, size, modification time and a hash of its contents, so it is recompiled
+# automatically whenever the CSV changes. If only the modification time changed (the file was touched or re-saved with
+# the same contents), the content hash is checked and the cache is kept.
+# The cache directory is $SETLIST_CACHE_DIR if set, otherwise setlistapp/ in the user's cache directory.
+# load_catalog_columns gives the same catalog as a dict of numpy columns instead. On a cache hit it never imports
+# pandas, which keeps the startup of headless runs fast (missing text values are empty strings there).
+# Every catalog follows one schema, checked once when the CSV is parsed (the cache stores the typed columns): Artist,
+# Key and Tuning are categorical, Time is float32, Mood is int8 (float32 if some moods are missing or not whole numbers)
+# and Active is bool. Text in Time or Mood counts as a missing value. Song and any extra columns are kept as they are.
+# In a dict of numpy columns the categorical columns are plain text arrays. For 100k songs this takes the dataframe
+# from about 27 MB to 9 MB, and the pipeline never has to convert a column again.
+# Note: Loaded catalogs are shared between callers. Copy them before modifying them.
+# Changes to the Active column (from the GUI's Modify button) are not written by rewriting the CSV. save_active_flags
+# appends only the changed rows to a journal file next to the CSV (songs.csv.active-journal), which every load applies
+# on top of the CSV. Each journal line is written and synced in one go and a half-written last line is ignored, so a
+# crash never corrupts the CSV or the journal. Once the journal gets long it is compacted: the Active field of every row
+# of the CSV is rewritten with the current flags, leaving every other cell as it is (to a temporary file that is then
+# moved over it), and the journal is deleted.
+# A song file can also be an SQLite database ("repertoire.db" or "repertoire.db#band"). The functions below hand those
+# over to song_db.py, which keeps its own in-process memo and writes the Active flags straight into the database.
+
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from profiling import stage, count
+from song_db import is_database, db_fingerprint, load_db_catalog, save_db_active_flags
+import song_db
+
+CACHE_VERSION = 2
+JOURNAL_SUFFIX = ".active-journal"
+# The journal is compacted into the CSV once it would hold more entries than this, or this fraction of the catalog
+JOURNAL_COMPACT_ENTRIES = 1000
+JOURNAL_COMPACT_FRACTION = 0.05
+TRUE_VALUES = {"true", "t", "yes", "y", "1", "1.0"}
+CATEGORY_COLUMNS = ("Artist", "Key", "Tuning")
+
+# Catalogs already loaded in this process: (absolute path, "frame" or "columns") -> (fingerprint, catalog)
+_loaded = {}
+# The same catalogs with the Active journal applied: (absolute path, "frame" or "columns") -> (fingerprint, journal fingerprint, catalog)
+_journaled = {}
+
+def cache_dir():
+    if os.environ.get("SETLIST_CACHE_DIR"):
+        return os.environ["SETLIST_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "setlistapp")
+
+def cache_path(csv_path):
+    name = hashlib.sha1(os.path.abspath(csv_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir(), name + ".npz")
+
+# Cheap identity of the file on disk. Raises FileNotFoundError if the file does not exist
+def file_fingerprint(csv_path):
+    if is_database(csv_path):
+        return db_fingerprint(csv_path)
+    stat = os.stat(csv_path)
+    return dict(path=os.path.abspath(csv_path), size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+def content_hash(csv_path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(csv_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Turns a dataframe into arrays that np.savez can store without pickling. Returns None if a column can't be stored
+def compile_catalog(df):
+    import pandas as pd
+    arrays = {}
+    columns = []
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            uniques = np.array(list(values.cat.categories))
+            if uniques.dtype == object:
+                return None
+            arrays[f"c{i}_codes"] = values.cat.codes.to_numpy().astype(np.int32)
+            arrays[f"c{i}_uniques"] = uniques
+            columns.append(dict(name=column, kind="category"))
+        elif values.dtype == object or isinstance(values.dtype, pd.StringDtype) or str(values.dtype) == "str":
+            codes, uniques = pd.factorize(values)
+            uniques = np.array(list(uniques))
+            if uniques.dtype == object: # Mixed types in one column
+                return None
+            arrays[f"c{i}_codes"] = codes.astype(np.int32)
+            arrays[f"c{i}_uniques"] = uniques
+            columns.append(dict(name=column, kind="codes"))
+        else:
+            array = values.to_numpy()
+            if array.dtype == object:
+                return None
+            arrays[f"c{i}"] = array
+            columns.append(dict(name=column, kind="array"))
+    return arrays, columns
+
+def _decode(data, columns):
+    import pandas as pd
+    frame = {}
+    for i, column in enumerate(columns):
+        if column["kind"] == "codes":
+            codes = data[f"c{i}_codes"]
+            values = data[f"c{i}_uniques"].astype(object)[codes]
+            values[codes < 0] = np.nan
+            frame[column["name"]] = values
+        elif column["kind"] == "category":
+            frame[column["name"]] = pd.Categorical.from_codes(data[f"c{i}_codes"], data[f"c{i}_uniques"])
+        else:
+            frame[column["name"]] = data[f"c{i}"]
+    return pd.DataFrame(frame)
+
+def _decode_columns(data, columns):
+    frame = {}
+    for i, column in enumerate(columns):
+        if column["kind"] in ("codes", "category"):
+            codes = data[f"c{i}_codes"]
+            uniques = data[f"c{i}_uniques"]
+            # Missing values become empty strings (or the type's zero) so the column keeps a plain numpy dtype
+            frame[column["name"]] = np.append(uniques, np.zeros(1, dtype=uniques.dtype))[codes]
+        else:
+            frame[column["name"]] = data[f"c{i}"]
+    return frame
+
+def _read_cache_meta(path):
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+    except Exception: # A missing, truncated or corrupt cache is a cache miss
+        return None
+    return meta if meta.get("version") == CACHE_VERSION else None
+
+def _write_cache(path, meta, arrays):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A temp file of its own, so two processes (or threads) writing the same cache never write into each other's file
+    handle, temp_path = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, "wb") as file:
+            np.savez(file, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(temp_path, path) # Atomic, so a half-written cache is never read
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+# Reads the compiled cache of a CSV with the given decoder, or returns None if there is no up to date cache
+def _load_compiled(csv_path, fingerprint, decode):
+    path = cache_path(csv_path)
+    meta = _read_cache_meta(path)
+    if meta is None or meta["size"] != fingerprint["size"]:
+        return None
+    if meta["mtime_ns"] != fingerprint["mtime_ns"]:
+        if content_hash(csv_path) != meta["hash"]:
+            return None
+        # Same contents, new modification time
+        meta.update(fingerprint)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                _write_cache(path, meta, {key: data[key] for key in data.files if key != "meta"})
+        except OSError:
+            pass # The cache is still good, it's just checked by hash again next time
+        except Exception:
+            return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return decode(data, meta["columns"])
+    except Exception: # A cache that is corrupt past its meta is a cache miss too
+        return None
+
+# Loads a song CSV (without the Active journal) as a dataframe, going through the in-process and on-disk caches
+def _load_catalog_file(csv_path, fingerprint):
+    loaded = _loaded.get((fingerprint["path"], "frame"))
+    if loaded is not None and loaded[0] == fingerprint:
+        return loaded[1]
+
+    df = _load_compiled(csv_path, fingerprint, _decode)
+    if df is None:
+        import pandas as pd
+        df = typed_catalog(pd.read_csv(csv_path))
+        compiled = compile_catalog(df)
+        if compiled is not None:
+            arrays, columns = compiled
+            meta = dict(fingerprint, version=CACHE_VERSION, hash=content_hash(csv_path), columns=columns)
+            try:
+                _write_cache(cache_path(csv_path), meta, arrays)
+            except OSError:
+                pass # The cache is only an optimization
+
+    _loaded[(fingerprint["path"], "frame")] = (fingerprint, df)
+    return df
+
+def _load_catalog_columns_file(csv_path, fingerprint):
+    loaded = _loaded.get((fingerprint["path"], "columns"))
+    if loaded is not None and loaded[0] == fingerprint:
+        return loaded[1]
+
+    columns = _load_compiled(csv_path, fingerprint, _decode_columns)
+    if columns is None:
+        df = _load_catalog_file(csv_path, fingerprint)
+        compiled = compile_catalog(df)
+        columns = _decode_columns(*compiled) if compiled is not None else {column: df[column].to_numpy() for column in df.columns}
+
+    _loaded[(fingerprint["path"], "columns")] = (fingerprint, columns)
+    return columns
+
+# Loads the CSV with one of the loaders above and applies the Active journal to it
+def _load_journaled(csv_path, kind, load):
+    fingerprint = file_fingerprint(csv_path)
+    journal = journal_fingerprint(csv_path)
+    loaded = _journaled.get((fingerprint["path"], kind))
+    if loaded is not None and loaded[0] == fingerprint and loaded[1] == journal:
+        count("csv_read.memo_hits")
+        return loaded[2]
+
+    with stage("csv_read", kind=kind):
+        catalog = load(csv_path, fingerprint)
+    if journal is not None:
+        rows, active = read_active_journal(csv_path, catalog["Song"])
+        if len(rows):
+            flags = active_values(catalog["Active"])
+            flags[rows] = active
+            if kind == "frame":
+                catalog = catalog.copy(deep=False) # Only the Active column is replaced, the rest stays shared
+            else:
+                catalog = dict(catalog)
+            catalog["Active"] = flags
+
+    _journaled[(fingerprint["path"], kind)] = (fingerprint, journal, catalog)
+    return catalog
+
+# Loads a song CSV as a dataframe, going through the in-process and on-disk caches
+def load_catalog(csv_path):
+    if is_database(csv_path):
+        return load_db_catalog(csv_path, "frame")
+    return _load_journaled(csv_path, "frame", _load_catalog_file)
+
+# Loads a song CSV as a dict of numpy columns. Only parses the CSV (with pandas) if there is no up to date cache
+def load_catalog_columns(csv_path):
+    if is_database(csv_path):
+        return load_db_catalog(csv_path, "columns")
+    return _load_journaled(csv_path, "columns", _load_catalog_columns_file)
+
+# Forgets every catalog loaded in this process (the on-disk caches stay)
+def clear_loaded_catalogs():
+    _loaded.clear()
+    _journaled.clear()
+    song_db.clear_loaded_catalogs()
+
+# Active column as a writable boolean array. Text values count as Active if they read as true
+def active_values(values):
+    values = np.asarray(values)
+    if values.dtype == bool:
+        return values.copy()
+    return np.array([str(value).strip().lower() in TRUE_VALUES for value in values], dtype=bool)
+
+def _numbers(values):
+    array = np.asarray(values)
+    if array.dtype.kind in "biuf":
+        return array.astype(float)
+    import pandas as pd
+    return pd.to_numeric(pd.Series(array, dtype=object), errors="coerce").to_numpy(dtype=float)
+
+# Mood column as int8, or float32 (with NaN for the missing ones) if some moods are missing or not whole numbers
+def mood_values(values):
+    moods = _numbers(values)
+    if np.all(moods == np.round(moods)) and np.all(np.abs(moods) <= 127):
+        return moods.astype(np.int8)
+    return moods.astype(np.float32)
+
+# Applies the catalog schema (see the header) to the Time, Mood and Active columns of a dict of columns
+def typed_columns(columns):
+    columns = dict(columns)
+    if "Time" in columns:
+        columns["Time"] = _numbers(columns["Time"]).astype(np.float32)
+    if "Mood" in columns:
+        columns["Mood"] = mood_values(columns["Mood"])
+    if "Active" in columns:
+        columns["Active"] = active_values(columns["Active"])
+    return columns
+
+# Applies the catalog schema (see the header) to a freshly parsed dataframe
+def typed_catalog(df):
+    import pandas as pd
+    columns = typed_columns({column: df[column] for column in df.columns})
+    for column in CATEGORY_COLUMNS:
+        if column in columns:
+            columns[column] = columns[column].astype("category")
+    return pd.DataFrame(columns, index=df.index)
+
+def journal_path(csv_path):
+    return csv_path + JOURNAL_SUFFIX
+
+# Identity of the journal on disk, or None if there is no journal (databases never have one)
+def journal_fingerprint(csv_path):
+    if is_database(csv_path):
+        return None
+    try:
+        stat = os.stat(journal_path(csv_path))
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+def _read_journal_lines(csv_path):
+    try:
+        with open(journal_path(csv_path), "rb") as file:
+            lines = file.read().split(b"\n")
+    except FileNotFoundError:
+        return []
+    return lines[:-1] # Everything after the last newline is a half-written line (or nothing)
+
+# Reads the journal as (rows, active flags), with the last entry for a row winning.
+# Entries whose song name no longer matches the row (the CSV was edited since) are skipped
+def read_active_journal(csv_path, names):
+    latest = {}
+    for line in _read_journal_lines(csv_path):
+        try:
+            row, active, name = json.loads(line)
+        except ValueError:
+            continue
+        latest[row] = (active, name)
+    names = np.asarray(names)
+    rows = np.array([row for row, (_, name) in latest.items() if 0 <= row < len(names) and names[row] == name], dtype=np.intp)
+    active = np.array([latest[row][0] for row in rows], dtype=bool)
+    return rows, active
+
+# Rewrites the Active field of every row of the CSV with the given flags and deletes the journal. Every other cell is
+# copied over as it is (only the quoting can change), so compaction never changes the rest of the file. The new file
+# is written next to the CSV with the same permissions and moved over it in one step, and the journal only goes once
+# that is done (applying it again to the new CSV is harmless)
+def _rewrite_active(csv_path, active):
+    directory = os.path.dirname(os.path.abspath(csv_path))
+    handle, temp_path = tempfile.mkstemp(suffix=".csv.tmp", dir=directory)
+    try:
+        with open(csv_path, newline="", encoding="utf-8") as source, os.fdopen(handle, "w", newline="", encoding="utf-8") as file:
+            newline = "\r\n" if source.readline().endswith("\r\n") else "\n" # Keeps the line endings of the file
+            source.seek(0)
+            reader = csv.reader(source)
+            writer = csv.writer(file, lineterminator=newline)
+            header = next(reader, [])
+            if "Active" not in header:
+                header.append("Active")
+            column = header.index("Active")
+            writer.writerow(header)
+            row = 0
+            for fields in reader:
+                if not fields: # Blank lines are not catalog rows
+                    continue
+                if row < len(active):
+                    fields += [""] * (column + 1 - len(fields))
+                    fields[column] = str(bool(active[row]))
+                writer.writerow(fields)
+                row += 1
+            file.flush()
+            os.fsync(file.fileno())
+        shutil.copymode(csv_path, temp_path) # mkstemp makes the file private (0600)
+        os.replace(temp_path, csv_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    try:
+        os.remove(journal_path(csv_path))
+    except FileNotFoundError:
+        pass
+
+# Saves the Active flag of every song in the CSV (active is a boolean array over the catalog rows).
+# Only rows whose flag changed are written, to the journal, unless that makes the journal long enough to compact.
+# Returns the number of rows that changed
+def save_active_flags(csv_path, active):
+    if is_database(csv_path):
+        with stage("csv_write", mode="database", rows=len(active)):
+            return save_db_active_flags(csv_path, active)
+    catalog = load_catalog(csv_path)
+    active = np.asarray(active, dtype=bool)
+    changed = np.flatnonzero(active != active_values(catalog["Active"]))
+    if len(changed) == 0:
+        return 0
+    entries = len(_read_journal_lines(csv_path)) + len(changed)
+    if entries > max(JOURNAL_COMPACT_ENTRIES, JOURNAL_COMPACT_FRACTION * len(active)):
+        with stage("csv_write", mode="rewrite", rows=len(active)):
+            _rewrite_active(csv_path, active)
+        return len(changed)
+    names = np.asarray(catalog["Song"])
+    lines = "".join(json.dumps([int(row), bool(active[row]), str(names[row])]) + "\n" for row in changed)
+    with stage("csv_write", mode="journal", rows=len(changed)), open(journal_path(csv_path), "a+b") as file:
+        if file.tell() > 0:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                lines = "\n" + lines # End a half-written line left by a crash, so it can't swallow the new entries
+        file.write(lines.encode("utf-8"))
+        file.flush()
+        os.fsync(file.fileno())
+    return len(changed)
+
+# Writes the journal into the CSV (if there is one)
+def compact_active_journal(csv_path):
+    if journal_fingerprint(csv_path) is not None:
+        _rewrite_active(csv_path, active_values(load_catalog(csv_path)["Active"]))
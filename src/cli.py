@@ -0,0 +1,167 @@
+# CLI - Headless batch generation of setlists, for cron jobs and scripts on machines without a display.
+# This file (and everything it imports) never imports PyQt5 or tkinter.
+# usage: python main.py generate --csv songs.csv --set-time 60 --count 50 --seed 7 --out dir/
+#        python main.py generate --shows shows.json --out dir/
+#        python main.py generate --csv songs.csv --sets "60, 60, encore 15" --count 5 --out dir/
+#        python main.py generate --csv songs.csv --constraints rules.toml --count 5 --out dir/
+# Each setlist is written to <out>/<show>_<number>.txt as soon as it is generated (or .md, .json, .csv or .html with
+# --format, see renderers.py).
+# A shows file holds several show specs, either as JSON ({"shows": [...]} or just the list) or as TOML ([[shows]] tables).
+# Each spec may have any of these keys, and the command line options are used for the ones it leaves out:
+#   name, csv, set_time, transition_time, og_weight, mood_weight, cluster_size, count, seed, fill, optimize_order, includes,
+#   excludes, sets, recency_weight, recency_half_life, constraints
+# Songs that were played recently (see play_history.py) are picked less often, like in the GUI.
+# With sets (text like "60, 60, encore 15", or a list of set specs, see show_planner.py) every output file is a whole
+# show planned in one pass (set_time and transition_time are then per set, and fill is not used).
+# constraints is a rules file (or the rules as a table/object right in the spec, see set_constraints.py) that every
+# setlist has to follow. It does not work with sets.
+
+import json
+import os
+import sys
+import warnings
+import numpy as np
+from setlist_math import *
+from song_library import SongLibrary
+from renderers import RENDERERS, write_setlist, write_show
+from ordering import order_setlist, refill_order
+from profiling import stage
+from generation import new_seed
+from show_planner import parse_sets, plan_show, show_sets
+from play_history import recency_multipliers
+from set_constraints import load_constraints, check_constraints, sample_constrained_positions, constrained_order, fit_constrained_order, pinned_songs, ConstraintError
+
+SPEC_KEYS = ("name", "csv", "set_time", "transition_time", "og_weight", "mood_weight", "cluster_size", "count", "seed", "fill", "optimize_order", "includes", "excludes",
+             "sets", "recency_weight", "recency_half_life", "constraints")
+
+def load_show_specs(path):
+    if path.endswith(".toml"):
+        import tomllib # Python 3.11+
+        with open(path, "rb") as file:
+            data = tomllib.load(file)
+    else:
+        with open(path) as file:
+            data = json.load(file)
+    if isinstance(data, dict):
+        data = data.get("shows", [data])
+    return data
+
+# The show specs to run: the ones from --shows (with the command line options as defaults), or one from the options
+def show_specs(args):
+    defaults = {key: getattr(args, key) for key in SPEC_KEYS}
+    if isinstance(defaults["sets"], str):
+        defaults["sets"] = parse_sets(defaults["sets"])
+    defaults["constraints"] = _spec_constraints(defaults["constraints"])
+    if not args.shows:
+        _check_spec(defaults)
+        return [defaults]
+    specs = []
+    for i, show in enumerate(load_show_specs(args.shows)):
+        unknown = set(show) - set(SPEC_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown keys in show {i + 1}: {', '.join(sorted(unknown))}")
+        spec = dict(defaults, name=f"show{i + 1}", **show) if "name" not in show else dict(defaults, **show)
+        if isinstance(spec["sets"], str):
+            spec["sets"] = parse_sets(spec["sets"])
+        if "constraints" in show:
+            spec["constraints"] = _spec_constraints(show["constraints"])
+        _check_spec(spec)
+        specs.append(spec)
+    return specs
+
+def _check_spec(spec):
+    if spec["sets"] and spec["constraints"]:
+        raise ValueError(f"Constraints only work for single sets, not for the sets of {spec['name']}")
+
+# The constraints of a spec, from a rules file or given right in the spec
+def _spec_constraints(constraints):
+    if not constraints:
+        return None
+    if isinstance(constraints, str):
+        return load_constraints(constraints)
+    return check_constraints(constraints)
+
+# Generates spec["count"] setlists for one show, yielding each setlist (a dict of columns in playing order) as soon as it
+# is ready. With spec["sets"] each one is a planned show instead, as a list of (set name, columns) pairs
+def generate_show(spec):
+    if not spec["csv"]:
+        raise ValueError(f"No csv file given for {spec['name']}")
+    with stage("load_songs", show=spec["name"]):
+        library = SongLibrary.from_csv(spec["csv"], columns=True) # No pandas needed when the catalog cache is up to date
+        library.apply_lists(spec["includes"], spec["excludes"])
+    rng = np.random.default_rng(spec["seed"])
+    songs = library.songs
+    recency = recency_multipliers(spec["csv"], library.names, spec["recency_weight"], spec["recency_half_life"])
+    if spec["sets"]:
+        for _ in range(spec["count"]):
+            with stage("show_planning", sets=len(spec["sets"])):
+                show = plan_show(library, spec["sets"], spec["og_weight"], spec["mood_weight"], rng=rng, optimize_order=spec["optimize_order"],
+                                 cluster_size=spec["cluster_size"], recency=recency)
+            yield show_sets(songs, show)
+        return
+    transition_time = spec["transition_time"] if spec["transition_time"] is not None else spec["set_time"] * 0.1
+    times, moods, is_og = catalog_arrays(songs)
+    weights = song_weights(moods, is_og, spec["og_weight"], spec["mood_weight"], recency)
+    constraints = spec["constraints"]
+    for _ in range(spec["count"]):
+        with stage("sampling"):
+            if constraints:
+                positions = sample_constrained_positions(library, target_time=spec["set_time"] - transition_time, og_weight=spec["og_weight"],
+                                                         mood_weight=spec["mood_weight"], constraints=constraints, rng=rng, fill=spec["fill"], recency=recency)
+            else:
+                positions = sample_library_positions(library, target_time=spec["set_time"] - transition_time, og_weight=spec["og_weight"],
+                                                     mood_weight=spec["mood_weight"], rng=rng, fill=spec["fill"], recency=recency)
+        with stage("clustering", songs=len(positions)):
+            if spec["optimize_order"]:
+                keep = np.flatnonzero(library.included[positions] | np.isin(library.names[positions], pinned_songs(constraints))) # Never trim the pinned songs
+                order, order_time = order_setlist(times[positions], songs["Key"][positions], songs["Tuning"][positions], moods[positions],
+                                                  set_time=spec["set_time"], keep=keep, rng=rng)
+                positions = positions[order]
+                if not constraints: # The time the order saves goes back to the set, like generation._refill_candidate
+                    refilled = refill_order(positions, order_time, times, songs["Key"], songs["Tuning"], moods, weights, library.active_pool(),
+                                            spec["set_time"], budget=np.inf if spec["fill"] else transition_time - order_time, rng=rng)
+                    positions = refilled[0] if refilled is not None else positions
+            else:
+                positions = positions[cluster_order(moods[positions], spec["cluster_size"], rng=rng)]
+            if constraints:
+                positions = positions[constrained_order(_rows(songs, positions), constraints)]
+                if spec["optimize_order"]:
+                    rows, _ = fit_constrained_order(_rows(songs, positions), constraints, spec["set_time"], keep=library.included_songs)
+                    positions = positions[rows]
+        yield _rows(songs, positions)
+
+def _rows(songs, positions):
+    return {column: values[positions] for column, values in songs.items()}
+
+def run_generate(args):
+    warnings.filterwarnings("ignore")
+    try:
+        specs = show_specs(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    extension = RENDERERS[args.format][1]
+    for spec in specs:
+        if spec["seed"] is None:
+            spec["seed"] = new_seed()
+        print(f"{spec['name']}: seed {spec['seed']}", file=sys.stderr) # Run again with --seed to get the same setlists
+        try:
+            for i, setlist in enumerate(generate_show(spec), start=1):
+                output_file = os.path.join(args.out, f"{spec['name']}_{i:03d}{extension}")
+                with stage("rendering", format=args.format):
+                    if isinstance(setlist, list): # A planned show
+                        write_show(setlist, output_file, args.format)
+                    else:
+                        write_setlist(setlist, output_file, args.format)
+                print(output_file, flush=True)
+        except FileNotFoundError:
+            print(f"Error: File not found: {spec['csv']}", file=sys.stderr)
+            return 1
+        except IndexError:
+            print(f"Error: The set time of {spec['name']} is too short for the songs you have selected!", file=sys.stderr)
+            return 1
+        except ConstraintError as e:
+            print(f"Error: {spec['name']}: {e}", file=sys.stderr)
+            return 1
+    return 0
@@ -1,87 +1,146 @@
-import pandas as pd
+# Format CSV - Formats a song csv file for the setlist generator: adds any missing columns, fills in missing values
+# with defaults, makes Time and Mood numbers and Active True/False, and puts the columns in the right order.
+# usage: python format_csv.py                                   (opens the small formatter window)
+#        python format_csv.py songs.csv [more.csv ...] [--output out.csv] [--chunksize 50000]
+# The file is read and formatted in chunks, so memory use stays the same no matter how big the file is. The result is
+# written to a temporary file next to the output and then moved over it in one step, so the original file is never
+# left half-written. It reports how many rows were fixed in each column.
+# format_csv() can also be called from other scripts.
 
-import tkinter as tk
-from tkinter import filedialog
+import argparse
+import os
+import shutil
+import sys
+import tempfile
 
-def run_program():
-    # Get the input values
-    song_file = input_file_entry.get()
+COLUMNS = ["Song", "Artist", "Key", "Tuning", "Time", "Mood", "Active"]
+DEFAULTS = dict(Song="Unknown Song", Artist="Unknown Artist", Key="Misc", Tuning="E Standard", Time=1.0, Mood=5, Active=True)
+TRUE_VALUES = {"true", "t", "yes", "y", "1", "1.0"}
+FALSE_VALUES = {"false", "f", "no", "n", "0", "0.0"}
+CHUNK_SIZE = 50000
 
-    # Main code
-    try:
-        songs = pd.read_csv(song_file)
-    except Exception as e:
-        setlist_generated_text.delete("1.0", tk.END)
-        setlist_generated_text.insert(tk.END, f"Error: {e}")
-    #If Column does not exist, create it and fill it with the default value
-    try:
-        songs["Song"]
-    except KeyError:
-        songs["Song"] = "Unknown Song"
-    try:
-        songs["Artist"]
-    except KeyError:
-        songs["Artist"] = "Unknown Artist"
-    try:
-        songs["Key"]
-    except KeyError:
-        songs["Key"] = "Misc"
-    try:
-        songs["Tuning"]
-    except KeyError:
-        songs["Tuning"] = "E Standard"
-    try:
-        songs["Time"]
-    except KeyError:
-        songs["Time"] = "1"
-    try:
-        songs["Mood"]
-    except KeyError:
-        songs["Mood"] = "5"
-    try:
-        songs["Active"]
-    except KeyError:
-        songs["Active"] = "True"
+# Formats one chunk (read with every column as text) and adds the number of rows fixed per column to counts
+def format_chunk(chunk, counts):
+    import pandas as pd
+    formatted = pd.DataFrame(index=chunk.index)
+    for column in COLUMNS:
+        # If Column does not exist, create it and fill it with the default value
+        if column not in chunk:
+            formatted[column] = DEFAULTS[column]
+            counts[column] += len(chunk)
+            continue
+        values = chunk[column]
+        if column in ("Time", "Mood"):
+            numbers = pd.to_numeric(values, errors="coerce")
+            fixed = numbers.isna()
+            numbers = numbers.fillna(DEFAULTS[column])
+            if column == "Mood": # Whole moods are written without a decimal point, whatever else is in the chunk
+                whole = numbers % 1 == 0
+                numbers = numbers.astype(str).where(~whole, numbers.round().astype(int).astype(str))
+            formatted[column] = numbers
+        elif column == "Active":
+            text = values.str.strip().str.lower()
+            active = text.isin(TRUE_VALUES)
+            inactive = text.isin(FALSE_VALUES)
+            fixed = ~(active | inactive)
+            formatted[column] = ~inactive # Anything that is not clearly False counts as Active
+        else:
+            fixed = values.isna()
+            formatted[column] = values.fillna(DEFAULTS[column])
+        counts[column] += int(fixed.sum())
+    return formatted
 
+# Formats song_file, writing the result to output_file (song_file itself by default).
+# Returns the number of rows and the number of rows fixed in each column
+def format_csv(song_file, output_file=None, chunksize=CHUNK_SIZE):
+    import pandas as pd
+    output_file = output_file or song_file
+    counts = {column: 0 for column in COLUMNS}
+    rows = 0
+    directory = os.path.dirname(os.path.abspath(output_file))
+    handle, temp_path = tempfile.mkstemp(suffix=".csv.tmp", dir=directory)
     try:
-        songs = songs[["Song", "Artist", "Key", "Tuning", "Time", "Mood", "Active"]]  # Reorder the columns
-        songs["Active"].fillna("True", inplace=True)  # Fill the NaN values in the "Active" column with "True"
-        songs["Mood"].fillna("5", inplace=True)  # Fill the NaN values in the "Mood" column with "0"
-        songs["Time"].fillna("1", inplace=True)  # Fill the NaN values in the "Time" column with "1"
-        songs["Tuning"].fillna("E Standard", inplace=True)  # Fill the NaN values in the "Tuning" column with "E Standard"
-        songs["Key"].fillna("Misc", inplace=True)  # Fill the NaN values in the "Key" column with "Misc"
-        songs["Artist"].fillna("Unknown Artist", inplace=True)  # Fill the NaN values in the "Artist" column with "Unknown Artist"
-        songs["Song"].fillna("Unknown Song", inplace=True)  # Fill the NaN values in the "Song" column with "Unknown Song"
-        songs.to_csv(song_file, index=False)
+        with os.fdopen(handle, "w", newline="") as file:
+            header = True
+            for chunk in pd.read_csv(song_file, dtype=str, chunksize=chunksize):
+                formatted = format_chunk(chunk, counts)
+                formatted.to_csv(file, header=header, index=False)
+                header = False
+                rows += len(chunk)
+            if header: # No rows at all
+                file.write(",".join(COLUMNS) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp makes the file private (0600), so it gets the permissions of the file it replaces (or the input file)
+        shutil.copymode(output_file if os.path.exists(output_file) else song_file, temp_path)
+        os.replace(temp_path, output_file)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return rows, counts
+
+def report(rows, counts):
+    fixed = ", ".join(f"{column}: {count}" for column, count in counts.items() if count)
+    return f"{rows} rows, fixed {fixed}" if fixed else f"{rows} rows, nothing to fix"
 
+# The small formatter window. tkinter is only imported when the window is used
+def run_gui():
+    import tkinter as tk
+    from tkinter import filedialog
+
+    def run_program():
+        # Get the input values
+        song_file = input_file_entry.get()
         setlist_generated_text.delete("1.0", tk.END)  # Clear previous message
-        setlist_generated_text.insert(tk.END, "CSV Formatted!")
-    except Exception as e:
-        setlist_generated_text.delete("1.0", tk.END)
-        setlist_generated_text.insert(tk.END, f"Error: {e}")
+        try:
+            rows, counts = format_csv(song_file)
+            setlist_generated_text.insert(tk.END, f"CSV Formatted! {report(rows, counts)}")
+        except Exception as e:
+            setlist_generated_text.insert(tk.END, f"Error: {e}")
+
+    # Create the GUI window
+    window = tk.Tk()
+    window.title("CSV Formatter for Setlist Generator")
 
-# Create the GUI window
-window = tk.Tk()
-window.title("CSV Formatter for Setlist Generator")
+    # Input File Path
+    input_file_label = tk.Label(window, text="Input File Path:")
+    input_file_label.pack()
+    input_file_entry = tk.Entry(window)
+    input_file_entry.pack()
+    input_file_button = tk.Button(window, text="Browse", command=lambda: input_file_entry.insert(tk.END, filedialog.askopenfilename()))
+    input_file_button.pack()
 
-# Input File Path
-input_file_label = tk.Label(window, text="Input File Path:")
-input_file_label.pack()
-input_file_entry = tk.Entry(window)
-input_file_entry.pack()
-input_file_button = tk.Button(window, text="Browse", command=lambda: input_file_entry.insert(tk.END, filedialog.askopenfilename()))
-input_file_button.pack()
+    # Run Button
+    run_button = tk.Button(window, text="Format", command=run_program)
+    run_button.pack()
 
-# Run Button
-run_button = tk.Button(window, text="Format", command=run_program)
-run_button.pack()
+    # Setlist Generated Message
+    setlist_generated_text = tk.Text(window, height=3, width=50)
+    setlist_generated_text.pack()
 
-# Setlist Generated Message
-setlist_generated_text = tk.Text(window, height=1, width=30)
-setlist_generated_text.pack()
+    # Start the GUI event loop
+    window.mainloop()
 
-# Start the GUI event loop
-window.mainloop()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Format song csv files for the setlist generator. Opens a window if no files are given.")
+    parser.add_argument("files", nargs="*", help="csv files to format in place")
+    parser.add_argument("--output", help="write the formatted file here instead (only with one input file)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help=f"rows per chunk (default: {CHUNK_SIZE})")
+    args = parser.parse_args(argv)
+    if not args.files:
+        run_gui()
+        return 0
+    if args.output and len(args.files) > 1:
+        parser.error("--output only works with one input file")
+    status = 0
+    for song_file in args.files:
+        try:
+            rows, counts = format_csv(song_file, args.output, chunksize=args.chunksize)
+            print(f"{song_file}: {report(rows, counts)}")
+        except Exception as e:
+            print(f"{song_file}: Error: {e}", file=sys.stderr)
+            status = 1
+    return status
 
 if __name__ == '__main__':
-    run_program()
\ No newline at end of file
+    sys.exit(main())
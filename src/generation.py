@@ -0,0 +1,218 @@
+# Generation - The whole setlist generation pipeline (load the songs, sample candidates, sort them into clusters and
+# write them out) without any GUI code, so it can run on a worker thread or from a script.
+# Long runs can report progress through a callback and be cancelled cooperatively: the cancelled callback is checked
+# between sampling batches and between candidates, and GenerationCancelled is raised when it returns True.
+# All the randomness of a run comes from one numpy Generator made from the run's seed, so the same seed, songs and
+# settings always give the same setlists. Results are kept in a small LRU cache keyed by all of those, so running or
+# exporting a configuration again is instant.
+# With a "show" in the params (a list of set specs, see show_planner.py), every candidate is a whole show planned in
+# one pass instead of a single setlist. With "constraints" (rules like at most N tuning changes, see set_constraints.py)
+# every candidate follows the rules, and ConstraintError says which rule got in the way if none can.
+
+import datetime
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+import profiling
+from catalog import file_fingerprint, journal_fingerprint
+from setlist_math import *
+from song_library import SongLibrary
+from ordering import order_setlist, refill_order
+from show_planner import plan_show, show_sets, show_fill
+from play_history import recency_multipliers, history_fingerprint, DEFAULT_RECENCY_WEIGHT, DEFAULT_HALF_LIFE_DAYS
+from renderers import render_show
+from set_constraints import make_constrained_candidates, constrained_order, fit_constrained_order, pinned_songs, ConstraintError
+
+# Stages reported to the progress callback, in order
+STAGES = ("parsed", "sampled", "clustered", "rendered")
+
+# Candidates are sampled in batches of this size, so a cancel is noticed quickly even for big "best of N" runs
+SAMPLING_BATCH_SIZE = 50
+
+# Number of runs kept in the result cache
+RESULT_CACHE_SIZE = 32
+
+# Cache key -> result of generate_candidates, least recently used first. Runs on several threads share it (server.py)
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+class GenerationCancelled(Exception):
+    pass
+
+# A fresh random seed, small enough to write down
+def new_seed():
+    return int(np.random.SeedSequence().generate_state(1)[0])
+
+# Everything a run's result depends on: the song file on disk, the includes and excludes, the play history and today's
+# date (the recency weights count the days since each song was played), the settings and the seed
+def result_key(library, params):
+    masks = hashlib.blake2b(np.packbits(library.included).tobytes() + np.packbits(library.excluded).tobytes(), digest_size=16).hexdigest()
+    settings = tuple(params.get(key) for key in ("og_weight", "mood_weight", "set_time", "transition_time", "cluster_size", "candidates",
+                                                  "kept_candidates", "fill", "optimize_order", "recency_weight", "recency_half_life", "seed"))
+    show = json.dumps([params.get("show"), params.get("constraints")], sort_keys=True)
+    fingerprint = tuple(sorted(file_fingerprint(library.song_file).items())) # The version too, for a database
+    history = (history_fingerprint(library.song_file), datetime.date.today())
+    return (fingerprint, journal_fingerprint(library.song_file), history, masks, show) + settings
+
+def clear_result_cache():
+    with _results_lock:
+        _results.clear()
+
+# params has og_weight, mood_weight, set_time, transition_time, cluster_size, candidates, kept_candidates, fill and
+# optionally optimize_order, recency_weight, recency_half_life (see play_history.py, the defaults from there are used
+# if they are missing), seed (a new one is picked if it is missing or None), show and constraints (a dict from
+# set_constraints.load_constraints, not for shows). With optimize_order the songs are put in order by ordering.order_setlist instead of mood
+# clusters, and songs are dropped if the real transition time (in that order) makes the set run over set_time.
+# library is the current SongLibrary, if any: if it is for song_file, a copy of it (with its includes and excludes)
+# is used, otherwise song_file is loaded with its inactive songs excluded.
+# progress(stage, percent) is called as the run goes. Returns a dict with the library that was used and the kept
+# candidates (best first) as dataframes in playing order, strings, scores and transition times (None without
+# optimize_order), and the seed. For a show, every candidate setlist is a list of (set name, columns) pairs (see
+# renderers.render_show), scored by how much of the show's time it fills. The result may come from the cache, so don't
+# modify it
+def generate_candidates(song_file, params, library=None, progress=None, cancelled=None):
+    def report(stage, percent):
+        if cancelled is not None and cancelled():
+            raise GenerationCancelled()
+        if progress is not None:
+            progress(stage, percent)
+
+    with profiling.stage("load_songs"):
+        if library is not None and library.song_file == song_file:
+            library = library.copy()
+            library.refresh() # Picks up changes to the csv file, keeping the includes and excludes
+        else:
+            library = SongLibrary.from_csv(song_file)
+    report("parsed", 25)
+
+    params = dict(params, seed=params.get("seed") if params.get("seed") is not None else new_seed())
+    params.setdefault("recency_weight", DEFAULT_RECENCY_WEIGHT)
+    params.setdefault("recency_half_life", DEFAULT_HALF_LIFE_DAYS)
+    key = result_key(library, params)
+    with _results_lock:
+        cached = _results.get(key)
+        if cached is not None:
+            _results.move_to_end(key)
+    if cached is not None:
+        profiling.count("result_cache.hits")
+        report("rendered", 100)
+        return dict(cached, library=library)
+    rng = np.random.default_rng(params["seed"])
+    recency = recency_multipliers(library.song_file, library.names, params["recency_weight"], params["recency_half_life"])
+    if params.get("show"):
+        if params.get("constraints"):
+            raise ValueError("Constraints only work for single sets, not for shows")
+        result = _generate_shows(library, params, rng, recency, report)
+    else:
+        result = _generate_setlists(library, params, rng, recency, report)
+    with _results_lock:
+        _results[key] = dict(result, library=None) # The cache doesn't need to hold on to the songs
+        while len(_results) > RESULT_CACHE_SIZE:
+            _results.popitem(last=False)
+    return dict(result, library=library)
+
+def _generate_setlists(library, params, rng, recency, report):
+    target_time = params["set_time"] - params["transition_time"]
+    total = max(params["candidates"], 1)
+    ranked = []
+    done = 0
+    while done < total:
+        batch = min(SAMPLING_BATCH_SIZE, total - done)
+        with profiling.stage("sampling", candidates=batch):
+            if params.get("constraints"):
+                ranked += make_constrained_candidates(library, target_time=target_time, og_weight=params["og_weight"], mood_weight=params["mood_weight"],
+                                                      n_candidates=batch, top_k=params["kept_candidates"], constraints=params["constraints"],
+                                                      fill=params["fill"], rng=rng, recency=recency)
+            else:
+                ranked += make_library_candidates(library, target_time=target_time, og_weight=params["og_weight"], mood_weight=params["mood_weight"],
+                                                  n_candidates=batch, top_k=params["kept_candidates"], fill=params["fill"], rng=rng, recency=recency)
+        profiling.count("sampling.iterations")
+        ranked = sorted(ranked, key=lambda candidate: -candidate[0])[:params["kept_candidates"]]
+        done += batch
+        report("sampled", 25 + 25 * done // total)
+
+    clustered = []
+    transition_times = []
+    errors = []
+    for i, (score, setlist) in enumerate(ranked):
+        with profiling.stage("clustering", songs=len(setlist)):
+            try:
+                ordered, transition_time = _order_candidate(setlist, params, library, rng, recency)
+            except ConstraintError as e: # No order of these songs follows the rules, the other candidates may do
+                errors.append(e)
+                continue
+        clustered.append((score, ordered))
+        transition_times.append(transition_time)
+        report("clustered", 50 + 25 * (i + 1) // len(ranked))
+    if errors and not clustered:
+        raise errors[0]
+
+    with profiling.stage("rendering", setlists=len(clustered)):
+        candidate_strings = [write_setlist_to_string(setlist) for _, setlist in clustered]
+    report("rendered", 100)
+    return dict(candidate_setlists=[setlist for _, setlist in clustered], candidate_strings=candidate_strings,
+                candidate_scores=[score for score, _ in clustered], candidate_transition_times=transition_times, seed=params["seed"])
+
+# Plans params["candidates"] shows and keeps the params["kept_candidates"] that fill the most of their time
+def _generate_shows(library, params, rng, recency, report):
+    total = max(params["candidates"], 1)
+    shows = []
+    for i in range(total):
+        with profiling.stage("show_planning", sets=len(params["show"])):
+            show = plan_show(library, params["show"], params["og_weight"], params["mood_weight"], rng=rng,
+                             optimize_order=params.get("optimize_order", False), cluster_size=params["cluster_size"], recency=recency)
+        shows.append((show_fill(show), show))
+        report("clustered", 25 + 50 * (i + 1) // total)
+    shows = sorted(shows, key=lambda candidate: -candidate[0])[:params["kept_candidates"]]
+
+    with profiling.stage("rendering", setlists=len(shows)):
+        setlists = [show_sets(library.songs, show) for _, show in shows]
+        candidate_strings = []
+        for sets in setlists:
+            text = io.StringIO()
+            render_show(sets, text)
+            candidate_strings.append(text.getvalue())
+    report("rendered", 100)
+    transition_times = [sum(planned["transition_time"] for planned in show) if params.get("optimize_order") else None for _, show in shows]
+    return dict(candidate_setlists=setlists, candidate_strings=candidate_strings, candidate_scores=[score for score, _ in shows],
+                candidate_transition_times=transition_times, seed=params["seed"])
+
+# Puts one candidate in playing order. Returns the ordered setlist and its transition time (None for mood clusters).
+# With constraints, the usual order is then changed as little as possible to follow the rules. Without them, the time
+# an optimized order leaves over is given back to the set (see _refill_candidate)
+def _order_candidate(setlist, params, library, rng, recency=None):
+    constraints = params.get("constraints")
+    if params.get("optimize_order"):
+        times, moods, _ = catalog_arrays(setlist)
+        keep = np.flatnonzero(np.isin(np.asarray(setlist["Song"]), library.included_songs + pinned_songs(constraints))) # Never trim the pinned songs
+        order, transition_time = order_setlist(times, setlist["Key"], setlist["Tuning"], moods, set_time=params["set_time"], keep=keep, rng=rng)
+        ordered = setlist.iloc[order]
+        if constraints:
+            ordered = ordered.iloc[constrained_order(ordered, constraints)]
+            rows, transition_time = fit_constrained_order(ordered, constraints, params["set_time"], keep=library.included_songs)
+            ordered = ordered.iloc[rows]
+        else:
+            ordered, transition_time = _refill_candidate(ordered, transition_time, params, library, rng, recency)
+        return ordered, transition_time
+    ordered = sort_sample_into_clusters(setlist, cluster_size=params["cluster_size"], rng=rng)
+    if constraints:
+        ordered = ordered.iloc[constrained_order(ordered, constraints)]
+    return ordered, None
+
+# Gives the time an optimized order saves on the transitions back to the set (see ordering.refill_order). With fill
+# mode all the time that is left is filled, otherwise only the time saved against params["transition_time"]. Not done
+# with constraints, since the added songs could break a rule
+def _refill_candidate(ordered, transition_time, params, library, rng, recency):
+    songs = library.songs
+    times, moods, is_og = catalog_arrays(songs)
+    weights = song_weights(moods, is_og, params["og_weight"], params["mood_weight"], recency)
+    budget = np.inf if params["fill"] else params["transition_time"] - transition_time
+    positions = np.flatnonzero(np.isin(library.names, np.asarray(ordered["Song"])))
+    refilled = refill_order(positions, transition_time, times, np.asarray(songs["Key"]), np.asarray(songs["Tuning"]), moods, weights,
+                            library.active_pool(), params["set_time"], budget=budget, rng=rng)
+    if refilled is None:
+        return ordered, transition_time
+    positions, transition_time = refilled
+    return songs.iloc[positions].reset_index(drop=True), transition_time
@@ -1,16 +1,152 @@
 # Setlist Make (w/ GUI) - This is the main GUI class for the setlist generator.
 
 # Note: Csv file must have the following columns: Song, Artist, Key, Tuning, Time, Mood, Active
+# Note: pandas is not imported here. It is loaded the first time a song file is read (on the worker thread), so the
+# window shows up without waiting for it.
 # Ryan Peruski, 05/27/2023
 
-import pandas as pd
-import random
 import warnings
 import numpy as np
 import sys, os
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QLabel, QLineEdit, QPushButton, QFileDialog, QTextEdit, QVBoxLayout, QTabWidget, QHBoxLayout, QListWidget, QListWidgetItem
+import threading
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QLabel, QLineEdit, QPushButton, QFileDialog, QTextEdit, QVBoxLayout, QTabWidget, QHBoxLayout, QTableView, QAbstractItemView, QHeaderView, QCheckBox, QProgressBar, QComboBox
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool, QTimer, QElapsedTimer, pyqtSignal
 from PyQt5.QtGui import QColor
 from setlist_math import *
+from generation import generate_candidates, GenerationCancelled
+from song_library import SongLibrary
+from catalog import save_active_flags
+from renderers import write_setlist, write_show
+from show_planner import parse_sets
+from song_search import search_index
+from play_history import record_play, DEFAULT_RECENCY_WEIGHT, DEFAULT_HALF_LIFE_DAYS
+from set_constraints import load_constraints, ConstraintError
+from profiling import stage
+
+# Table model for the "Includes/Excludes" tab. Rows are the songs of a SongLibrary in catalog order and are only
+# rendered when the view asks for them, so the cost of a click depends on the number of songs it changes, not on the
+# size of the catalog. Includes are green and excludes are red.
+# The table can be narrowed down to some of the songs (the search results) with set_rows. The model then maps each
+# table row to its catalog position, so the library and the rest of the window keep working with catalog positions.
+class SongTableModel(QAbstractTableModel):
+    COLUMNS = ["Song", "Artist", "Key", "Tuning", "Time", "Mood"]
+    COLORS = dict(included=QColor("green"), excluded=QColor("red"))
+
+    def __init__(self):
+        super().__init__()
+        self.library = None
+        self.songs = None
+        self.columns = []
+        self.rows = None # Catalog positions of the shown rows, in order (None shows every song)
+
+    # Shows the songs of the library (or "No file selected" for None). Only resets the view if the songs changed
+    def set_library(self, library):
+        songs = library.songs if library is not None else None
+        if library is self.library and songs is self.songs:
+            return
+        self.beginResetModel()
+        self.library = library
+        self.songs = songs
+        self.columns = [np.asarray(songs[column]) if column in songs else None for column in self.COLUMNS] if songs is not None else []
+        self.rows = None
+        self.endResetModel()
+
+    # Only shows the songs at the given (sorted) catalog positions, or every song for None
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    # Catalog positions of table rows
+    def positions(self, rows):
+        rows = np.asarray(rows, dtype=np.intp)
+        return rows if self.rows is None else self.rows[rows]
+
+    # Table rows of catalog positions, leaving out the positions that are not shown
+    def table_rows(self, positions):
+        positions = np.asarray(positions, dtype=np.intp)
+        if self.rows is None:
+            return positions
+        found = np.searchsorted(self.rows, positions)
+        found[found == len(self.rows)] = 0
+        return found[self.rows[found] == positions] if len(self.rows) else found[:0]
+
+    # Repaints only the given rows, in one signal per run of consecutive rows
+    def rows_changed(self, positions):
+        positions = np.unique(self.table_rows(np.unique(positions)))
+        if len(positions) == 0:
+            return
+        breaks = np.flatnonzero(np.diff(positions) != 1)
+        with stage("list_refresh", rows=len(positions)):
+            for start, end in zip(np.r_[positions[0], positions[breaks + 1]], np.r_[positions[breaks], positions[-1]]):
+                self.dataChanged.emit(self.index(int(start), 0), self.index(int(end), len(self.COLUMNS) - 1), [Qt.ForegroundRole])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self.library is None:
+            return 1
+        return len(self.library) if self.rows is None else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        row, column = index.row(), index.column()
+        if self.library is None:
+            return "No file selected" if role == Qt.DisplayRole and column == 0 else None
+        if self.rows is not None:
+            row = self.rows[row]
+        if role == Qt.DisplayRole:
+            values = self.columns[column]
+            return "" if values is None else str(values[row])
+        if role == Qt.ForegroundRole:
+            if self.library.included[row]:
+                return self.COLORS["included"]
+            if self.library.excluded[row]:
+                return self.COLORS["excluded"]
+        return None
+
+    def flags(self, index):
+        if self.library is None:
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+class GenerationSignals(QObject):
+    progress = pyqtSignal(str, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    cancelled = pyqtSignal()
+
+# Runs generation.generate_candidates on a QThreadPool thread and reports back through signals, which Qt delivers
+# on the GUI thread
+class GenerationWorker(QRunnable):
+    def __init__(self, params, library):
+        super().__init__()
+        self.params = params
+        self.library = library
+        self.signals = GenerationSignals()
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            result = generate_candidates(self.params["song_file"], self.params, library=self.library,
+                                         progress=self.signals.progress.emit, cancelled=self.cancel_event.is_set)
+            search_index(result["library"].songs) # Built here so the first search in the "Includes/Excludes" tab is instant
+        except GenerationCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
 
 class SetlistGeneratorWindow(QMainWindow):
     def __init__(self, debug=False):
@@ -18,97 +154,203 @@ class SetlistGeneratorWindow(QMainWindow):
         self.output_file_path = ""
         self.debug = debug
         self.setlist_string = ""
+        self.setlist = None # The shown candidate
         self.song_file = ""
-        self.available_songs = []
-        self.included_songs = []
-        self.excluded_songs = [] # List of excluded songs to show in GUI
+        self.library = None # Loaded songs along with their include/exclude state
+        self.worker = None # Generation running in the background, if any
+        self.candidate_strings = [] # Best setlists from the last run, best first
+        self.candidate_setlists = [] # The same setlists as dataframes, for exporting
+        self.candidate_scores = []
+        self.candidate_transition_times = [] # Real transition time of each candidate with Optimize Order
+        self.candidate_index = 0
         self.setWindowTitle("Setlist Generator")
-        self.defaults = dict(og_weight=1.2, mood_weight=0.8, set_time=60, cluster_size=2)
+        self.defaults = dict(og_weight=1.2, mood_weight=0.8, set_time=60, cluster_size=2, candidates=20, kept_candidates=10,
+                             recency_weight=DEFAULT_RECENCY_WEIGHT, recency_half_life=DEFAULT_HALF_LIFE_DAYS)
+        self.recorded_setlist = None # The last setlist written to the play history, so exporting it again doesn't count twice
         self.init_ui()
 
     def browse_input_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(None, "Select Input File", "", "CSV Files (*.csv);;All Files (*)")
+        file_path, _ = QFileDialog.getOpenFileName(None, "Select Input File", "", "CSV Files (*.csv);;Song Databases (*.db *.sqlite *.sqlite3);;All Files (*)")
         self.input_file_entry.setText(file_path)
 
     def browse_output_file(self):
-        file_path, _ = QFileDialog.getSaveFileName(None, "Save Output File", "", "Text Files (*.txt);;All Files (*)")
+        file_path, _ = QFileDialog.getSaveFileName(None, "Save Output File", "", "Text Files (*.txt);;Markdown (*.md);;JSON (*.json);;CSV Files (*.csv);;Stage Printout (*.html);;All Files (*)")
         self.output_file_path = file_path
         self.output_file_entry.setText(file_path)
 
-    def generate_setlist(self):
-        # Get user inputs
-        song_file = self.input_file_entry.text()
-        og_weight = float(self.og_weight_entry.text() or self.defaults["og_weight"])  # Default value if no input
-        mood_weight = float(self.mood_weight_entry.text() or self.defaults["mood_weight"])  # Default value if no input
+    def browse_constraints_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(None, "Select Constraints File", "", "Rules Files (*.toml *.json);;All Files (*)")
+        self.constraints_file_entry.setText(file_path)
+
+    # Reads the inputs of the "Make Setlist" tab
+    def read_parameters(self):
         set_time = float(self.set_time_entry.text() or self.defaults["set_time"])  # Default value if no input
-        transition_time = float(self.transition_time_entry.text() or set_time*0.1)  # Default value if no input
-        cluster_size = int(self.cluster_size_entry.text() or self.defaults["cluster_size"])  # Default value if no input
-        #Reset random seed
-        random.seed()
-        
-        setlist_string = ""
-        # Main code
+        return dict(
+            song_file=self.input_file_entry.text(),
+            og_weight=float(self.og_weight_entry.text() or self.defaults["og_weight"]),  # Default value if no input
+            mood_weight=float(self.mood_weight_entry.text() or self.defaults["mood_weight"]),  # Default value if no input
+            set_time=set_time,
+            transition_time=float(self.transition_time_entry.text() or set_time*0.1),  # Default value if no input
+            cluster_size=int(self.cluster_size_entry.text() or self.defaults["cluster_size"]),  # Default value if no input
+            candidates=int(self.candidates_entry.text() or self.defaults["candidates"]),  # Default value if no input
+            recency_weight=float(self.recency_weight_entry.text() or self.defaults["recency_weight"]),  # Default value if no input
+            recency_half_life=float(self.recency_half_life_entry.text() or self.defaults["recency_half_life"]),  # Default value if no input
+            kept_candidates=self.defaults["kept_candidates"],
+            fill=self.fill_checkbox.isChecked(),
+            optimize_order=self.optimize_order_checkbox.isChecked(),
+            seed=int(self.seed_entry.text()) if self.seed_entry.text().strip() else None,  # A new seed each run if no input
+            show=parse_sets(self.show_sets_entry.text()) or None,  # A single setlist if no input
+            constraints=load_constraints(self.constraints_file_entry.text()) if self.constraints_file_entry.text().strip() else None,  # No rules if no input
+        )
+
+    # Starts generating on a worker thread. The GUI stays responsive and gets progress updates while it runs
+    def generate_setlist(self):
+        if self.worker is not None: # Already running
+            return
         try:
-            songs = pd.read_csv(song_file)
-            # Song file setup for class
-            # First Time setup (whenever a new song file is selected)
-            if self.song_file != song_file: 
-                # Reset variables and then fill in excludes and available songs.
-                self.reset_vars()
-                self.available_songs = songs["Song"].tolist()
-                self.excluded_songs = songs.query('Active == False')["Song"].tolist()
-
-            
-            self.song_file = song_file
-            # Filter songs
-            for song in self.excluded_songs:
-                songs = songs.query('Song != @song')
-
-
-            warnings.filterwarnings("ignore")
-            setlist = make_setlist(songs, target_time=set_time-transition_time, og_weight=og_weight, mood_weight=mood_weight, includes=self.included_songs)
-            sorted_clusters = sort_sample_into_clusters(setlist, cluster_size=cluster_size)
-            setlist_string = write_setlist_to_string(sorted_clusters)
-            self.setlist_generated_text.clear()  # Clear previous message
-            self.setlist_generated_text.append("Setlist generated!")
-        except FileNotFoundError:
+            params = self.read_parameters()
+        except (ValueError, OSError) as e: # OSError: the constraints file can't be read
+            self.setlist_generated_text.clear()
+            self.setlist_generated_text.append(f"Error: {e}!")
+            return
+        warnings.filterwarnings("ignore")
+
+        self.worker = GenerationWorker(params, self.library)
+        self.worker.signals.progress.connect(self.update_progress)
+        self.worker.signals.finished.connect(self.finish_generation)
+        self.worker.signals.failed.connect(self.fail_generation)
+        self.worker.signals.cancelled.connect(self.cancel_generation_done)
+        self.run_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.progress_bar.setValue(0)
+        self.setlist_generated_text.clear()
+        self.setlist_generated_text.append("Generating...")
+        self.elapsed.start()
+        self.elapsed_timer.start()
+        QThreadPool.globalInstance().start(self.worker)
+
+    # Re-enables the "Run" button and stops the elapsed time clock once the worker is done, one way or another
+    def end_generation(self):
+        self.worker = None
+        self.run_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.elapsed_timer.stop()
+        self.update_elapsed()
+
+    def update_progress(self, stage, percent):
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"{stage.capitalize()} (%p%)")
+
+    def update_elapsed(self):
+        self.elapsed_label.setText(f"Elapsed: {self.elapsed.elapsed() / 1000:.2f} s")
+
+    # Called on the GUI thread with the result of generation.generate_candidates
+    def finish_generation(self, result):
+        params = self.worker.params
+        self.end_generation()
+        # Song file setup for class
+        # First Time setup (whenever a new song file is selected)
+        if self.song_file != params["song_file"] or self.library is None:
+            # Reset variables and then take the newly loaded songs, with the inactive songs excluded
+            self.reset_vars()
+            self.library = result["library"]
+        else:
+            self.library.refresh() # Picks up changes to the csv file, keeping the includes and excludes
+        self.song_file = params["song_file"]
+        self.setlist_generated_text.clear()  # Clear previous message
+        self.setlist_generated_text.append(f"Setlist generated! (seed {result['seed']})")
+
+        #Update tab 3
+        self.load_songs_from_csv()
+
+        vals = dict(
+            params,
+            seed=result["seed"],
+            setlist_string=result["candidate_strings"][0],
+            candidate_strings=result["candidate_strings"],
+            candidate_setlists=result["candidate_setlists"],
+            candidate_scores=result["candidate_scores"],
+            candidate_transition_times=result["candidate_transition_times"],
+            includes = self.library.included_songs,
+            excludes = self.library.excluded_songs
+        )
+        self.update_setlist_text(vals)
+
+    def fail_generation(self, error):
+        self.end_generation()
+        if isinstance(error, FileNotFoundError):
             self.setlist_generated_text.clear()
             self.setlist_generated_text.append("Error: File not found!")
             self.reset_vars()
-        except IndexError:
+        elif isinstance(error, IndexError):
             self.setlist_generated_text.clear()
             self.setlist_generated_text.append("Error: Your set time is too short for the songs you have selected!")
-        except Exception as e:
+        elif isinstance(error, ConstraintError):
+            self.setlist_generated_text.clear()
+            self.setlist_generated_text.append(f"Error: {error}!")
+            self.setlist_generated_text.append("Loosen that rule in your constraints file, or change the set time or includes.")
+        else:
             self.setlist_generated_text.clear()  # Clear previous message
-            self.setlist_generated_text.append(f"Error: {e}!")
+            self.setlist_generated_text.append(f"Error: {error}!")
             self.setlist_generated_text.append(f"Make sure your CSV is formatted correctly.")
             self.setlist_generated_text.append(f"See the README for more information.")
             self.reset_vars()
 
-        #Update tab 3
-        self.load_songs_from_csv()
+    def cancel_generation_done(self):
+        self.end_generation()
+        self.progress_bar.setFormat("Cancelled")
+        self.setlist_generated_text.clear()
+        self.setlist_generated_text.append("Cancelled.")
 
-        return dict(
-            setlist_string=setlist_string,
-            og_weight=og_weight,
-            mood_weight=mood_weight,
-            set_time=set_time,
-            transition_time=transition_time,
-            cluster_size=cluster_size,
-            includes = self.included_songs,
-            excludes = self.excluded_songs
-        )
+    # The "Cancel" button under the "Make Setlist" tab. The worker stops at its next check
+    def cancel_generation(self):
+        if self.worker is not None:
+            self.worker.cancel()
+
+    # The "Run" button under the "Make Setlist" tab. Repeated clicks within a short time only start one run
+    def request_generation(self):
+        self.run_debounce.start()
 
-    # Updated the setlist text box as well as displaying results for debug. "Run" button under "Make Setlist" tab
-    def update_setlist_text(self):
-        vals = self.generate_setlist()
+    # Updates the setlist text box as well as displaying results for debug
+    def update_setlist_text(self, vals):
         if self.debug:
             print(f"New setlist with values:")
             for val in reversed(vals):
                 print(f"{val}: {vals[val]}")
+        self.candidate_strings = vals["candidate_strings"]
+        self.candidate_setlists = vals["candidate_setlists"]
+        self.candidate_scores = vals["candidate_scores"]
+        self.candidate_transition_times = vals["candidate_transition_times"]
+        self.candidate_index = 0
+        self.show_candidate()
+
+    # Shows the current candidate in the "View Setlist" tab. The shown candidate is the one that gets exported
+    def show_candidate(self):
         self.setlist_text.clear()
-        self.setlist_text.append(vals["setlist_string"])
-        self.setlist_string = vals["setlist_string"]
+        if self.candidate_strings:
+            self.setlist_string = self.candidate_strings[self.candidate_index]
+            self.setlist = self.candidate_setlists[self.candidate_index]
+            label = f"Candidate {self.candidate_index + 1} of {len(self.candidate_strings)} (score {self.candidate_scores[self.candidate_index]:.2f}"
+            transition_time = self.candidate_transition_times[self.candidate_index]
+            if transition_time is not None:
+                label += f", transitions {transition_time:.1f} min"
+            self.candidate_label.setText(label + ")")
+        else:
+            self.setlist_string = ""
+            self.setlist = None
+            self.candidate_label.setText("No candidates")
+        self.setlist_text.append(self.setlist_string)
+
+    # The "Previous" and "Next" buttons on the "View Setlist" tab. Flips through the candidates without regenerating
+    def previous_candidate(self):
+        if self.candidate_strings:
+            self.candidate_index = (self.candidate_index - 1) % len(self.candidate_strings)
+            self.show_candidate()
+
+    def next_candidate(self):
+        if self.candidate_strings:
+            self.candidate_index = (self.candidate_index + 1) % len(self.candidate_strings)
+            self.show_candidate()
 
     # Resets all variables for a new csv file or if an error occurs
     def reset_vars(self):
@@ -116,95 +358,135 @@ class SetlistGeneratorWindow(QMainWindow):
             print("Resetting variables")
         self.output_file_path = ""
         self.setlist_string = ""
+        self.setlist = None
         self.song_file = ""
-        self.available_songs = []
-        self.included_songs = []
-        self.excluded_songs = []
+        self.candidate_strings = []
+        self.candidate_setlists = []
+        self.candidate_scores = []
+        self.candidate_transition_times = []
+        self.candidate_index = 0
+        self.library = None
         self.load_songs_from_csv()
 
-    # The "Export" button on the "View Setlist" Tab
+    # The "Export" button on the "View Setlist" Tab. The format comes from the file extension (see renderers.py)
     def export_to_output_file(self):
         if self.output_file_path:
-            with open(self.output_file_path, "w") as file:
-                file.write(self.setlist_string)
-                if self.debug:
-                    print(f"Exported setlist to {self.output_file_path}")
+            if isinstance(self.setlist, list): # A planned show
+                write_show(self.setlist, self.output_file_path)
+            elif self.setlist is not None:
+                write_setlist(self.setlist, self.output_file_path)
+            else:
+                write_setlist_string_to_file(self.setlist_string, self.output_file_path)
+            if self.debug:
+                print(f"Exported setlist to {self.output_file_path}")
+            if self.setlist is not None and self.setlist is not self.recorded_setlist:
+                # An exported setlist is one that gets played, so it goes in the play history (see play_history.py)
+                sets = self.setlist if isinstance(self.setlist, list) else [(None, self.setlist)]
+                record_play(self.song_file, [song for _, setlist in sets for song in np.asarray(setlist["Song"]).tolist()])
+                self.recorded_setlist = self.setlist
             self.message_box_export.clear()
             self.message_box_export.setText(self.message_box_export.text() + "Exported to " + os.path.basename(self.output_file_path) + "!\n")
 
     # Prints the available songs, includes, and excludes all to the "Includes/Excludes" tab
     def load_songs_from_csv(self):
-        if self.song_file:
-            self.available_songs = list(pd.read_csv(self.song_file)["Song"])
-            # Clear the existing list items before adding new items
-            self.available_songs_list.clear()
-
-            for song in self.available_songs:
-                item = QListWidgetItem(song)
-                if song in self.included_songs:
-                    item.setForeground(QColor("green"))
-                elif song in self.excluded_songs:
-                    item.setForeground(QColor("red"))
-                self.available_songs_list.addItem(item)
-
+        if self.song_file and self.library is not None:
+            with stage("list_refresh", songs=len(self.library)):
+                self.song_model.set_library(self.library)
             if self.debug:
                 print(f"Loading songs from {self.song_file}")
         else:
-            self.available_songs_list.clear()
-            self.available_songs_list.addItem("No file selected")
+            self.song_model.set_library(None)
+        self.fill_facet_boxes()
+        self.filter_songs()
+
+    # Puts the keys, tunings and mood bands of the loaded songs in the filter boxes, keeping what was picked if it is still there
+    def fill_facet_boxes(self):
+        index = search_index(self.library.songs) if self.song_file and self.library is not None else None
+        for facet, box in self.facet_boxes.items():
+            picked = box.currentData()
+            box.blockSignals(True)
+            while box.count() > 1: # Keeps the "Any ..." item
+                box.removeItem(1)
+            for value in index.facet_values(facet) if index is not None else []:
+                box.addItem(str(value), value)
+            box.setCurrentIndex(max(box.findData(picked), 0) if picked is not None else 0)
+            box.blockSignals(False)
+
+    # The search box and filters of the "Includes/Excludes" tab. Narrows the list down as you type (see song_search.py)
+    def filter_songs(self):
+        if not self.song_file or self.library is None:
+            self.song_filter_label.setText("")
+            return
+        text = self.song_search_entry.text()
+        facets = {facet: [box.currentData()] for facet, box in self.facet_boxes.items() if box.currentIndex() > 0}
+        if self.og_only_checkbox.isChecked():
+            facets["OG"] = [True]
+        if self.active_only_checkbox.isChecked():
+            facets["Active"] = [True]
+        if text.strip() or facets:
+            with stage("song_search", songs=len(self.library)):
+                rows = search_index(self.library.songs).search(text, facets)
+        else:
+            rows = None
+        self.song_model.set_rows(rows)
+        shown = len(self.library) if rows is None else len(rows)
+        self.song_filter_label.setText(f"Showing {shown} of {len(self.library)} songs")
+
+    # Catalog positions of the songs selected in the "Includes/Excludes" tab
+    def selected_positions(self):
+        return self.song_model.positions([index.row() for index in self.available_songs_list.selectionModel().selectedRows()])
+
+    # Catalog positions of every song shown in the "Includes/Excludes" tab (all of the search results)
+    def shown_positions(self):
+        return self.song_model.rows if self.song_model.rows is not None else np.arange(len(self.library))
 
-    # The "Include" Button on the "Includes/Excludes" tab. Adds the selected songs to the included list
+    # The "Include Shown" and "Exclude Shown" Buttons. Include or exclude every song that matches the search and filters
+    def include_shown_songs(self):
+        if self.song_file != "" and self.library is not None:
+            self.song_model.rows_changed(self.library.include(self.shown_positions()))
+
+    def exclude_shown_songs(self):
+        if self.song_file != "" and self.library is not None:
+            self.song_model.rows_changed(self.library.exclude(self.shown_positions()))
+
+    # The "Include" Button on the "Includes/Excludes" tab. Adds the selected songs to the included list (and takes them off the excluded list)
     def include_selected_songs(self):
-        if self.song_file != "":
-            selected_songs = self.available_songs_list.selectedItems()
-            for song in selected_songs:
-                if self.debug:
-                    print(f"Including {song.text()}")
-                if song.text() in self.excluded_songs: # If the song is in the excluded list, remove it
-                    self.excluded_songs.remove(song.text())
-                self.included_songs.append(song.text())
-        self.load_songs_from_csv()
+        if self.song_file != "" and self.library is not None:
+            positions = self.library.include(self.selected_positions())
+            if self.debug:
+                print(f"Including {self.library.names[positions].tolist()}")
+            self.song_model.rows_changed(positions)
 
-    # The "Exclude" Button on the "Includes/Excludes" tab. Adds the selected songs to the excluded list
+    # The "Exclude" Button on the "Includes/Excludes" tab. Adds the selected songs to the excluded list (and takes them off the included list)
     def exclude_selected_songs(self):
-        if self.song_file != "":
-            selected_songs = self.available_songs_list.selectedItems()
-            for song in selected_songs:
-                if self.debug:
-                    print(f"Excluding {song.text()}")
-                if song.text() in self.included_songs: # If the song is in the included list, remove it
-                    self.included_songs.remove(song.text())
-                self.excluded_songs.append(song.text())
-        self.load_songs_from_csv()
-    
+        if self.song_file != "" and self.library is not None:
+            positions = self.library.exclude(self.selected_positions())
+            if self.debug:
+                print(f"Excluding {self.library.names[positions].tolist()}")
+            self.song_model.rows_changed(positions)
+
     def remove_selected_songs(self):
-        if self.song_file != "":
-            selected_songs = self.available_songs_list.selectedItems()
-            for song in selected_songs:
-                if self.debug:
-                    print(f"Removing {song.text()}")
-                if song.text() in self.included_songs: # If the song is in the included list, remove it
-                    self.included_songs.remove(song.text())
-                if song.text() in self.excluded_songs:
-                    self.excluded_songs.remove(song.text())
-        self.load_songs_from_csv()
+        if self.song_file != "" and self.library is not None:
+            positions = self.library.remove(self.selected_positions())
+            if self.debug:
+                print(f"Removing {self.library.names[positions].tolist()}")
+            self.song_model.rows_changed(positions)
 
 
     # This is the "Modify" Button on the "Includes/Excludes" tab. This takes all of the Includes and Excludes and changes the mood value in the csv file
     def modify_song_csv(self):
-        df = pd.read_csv(self.song_file)
+        if self.library is None:
+            return
+        self.library.refresh()
         if self.debug:
             print(f"Modifying {self.song_file}")
-        for i in range(df.shape[0]):
-            if df["Song"][i] in self.excluded_songs:
-                if self.debug:
-                    print(f"Excluding {df['Song'][i]}")
-                df["Active"][i] = "False"
-            else:
-                df["Active"][i] = "True"
-        df.to_csv(self.song_file, index=False)
+            for song in self.library.excluded_songs:
+                print(f"Excluding {song}")
+        # Only the rows whose Active flag changed get written (see catalog.save_active_flags)
+        changed = save_active_flags(self.song_file, ~self.library.excluded)
         self.message_box_modify.clear()
-        self.message_box_modify.setText(self.message_box_modify.text() + "Modified " + os.path.basename(self.song_file) + "!\n")
+        self.message_box_modify.setText(self.message_box_modify.text() + "Modified " + os.path.basename(self.song_file) + f"! ({changed} songs changed)\n")
+        self.library.refresh() # Picks up the new Active column, keeping the includes and excludes
         self.load_songs_from_csv()
 
     # Gets called with the constructor after all the member variables are initialized. This sets up the layout of the entire UI
@@ -237,6 +519,17 @@ class SetlistGeneratorWindow(QMainWindow):
         output_file_layout.addWidget(self.output_file_entry)
         output_file_layout.addWidget(browse_output_button)
 
+        # Constraints File Entry
+        self.constraints_file_entry = QLineEdit()
+        self.constraints_file_entry.setPlaceholderText("no rules")
+        self.constraints_file_entry.setToolTip("JSON or TOML file with rules every setlist has to follow, like at most 1 tuning change or 2 songs between songs by the same artist (see the README)")
+        browse_constraints_button = QPushButton("Browse")
+        browse_constraints_button.setToolTip("Click to browse for a constraints file")
+        browse_constraints_button.clicked.connect(self.browse_constraints_file)
+        constraints_file_layout = QHBoxLayout()
+        constraints_file_layout.addWidget(self.constraints_file_entry)
+        constraints_file_layout.addWidget(browse_constraints_button)
+
         # Tab 1: Make Setlist
         tab1 = QWidget()
         tab_widget.addTab(tab1, "Make Setlist")
@@ -260,10 +553,67 @@ class SetlistGeneratorWindow(QMainWindow):
         self.cluster_size_entry = QLineEdit()
         self.cluster_size_entry.setPlaceholderText(str(self.defaults["cluster_size"]))
 
+        # Candidates Entry
+        self.candidates_entry = QLineEdit()
+        self.candidates_entry.setPlaceholderText(str(self.defaults["candidates"]))
+        self.candidates_entry.setToolTip("Number of setlists to generate in one run. The best ones can be flipped through in the \"View Setlist\" tab")
+
+        # Recency Entries
+        self.recency_weight_entry = QLineEdit()
+        self.recency_weight_entry.setPlaceholderText(str(self.defaults["recency_weight"]))
+        self.recency_weight_entry.setToolTip("How much to rest recently played songs (exported setlists count as played). 0 turns it off, 1 never picks a song that was played today")
+        self.recency_half_life_entry = QLineEdit()
+        self.recency_half_life_entry.setPlaceholderText(str(self.defaults["recency_half_life"]))
+        self.recency_half_life_entry.setToolTip("Days until a played song gets back half of the weight it was rested by")
+
+        # Seed Entry
+        self.seed_entry = QLineEdit()
+        self.seed_entry.setPlaceholderText("random")
+        self.seed_entry.setToolTip("Seed for the random choices. The same seed, songs and settings always give the same setlists. Leave empty for a new seed every run (it is shown after the run)")
+
+        # Show Sets Entry
+        self.show_sets_entry = QLineEdit()
+        self.show_sets_entry.setPlaceholderText("single set")
+        self.show_sets_entry.setToolTip("Plan a whole show instead of one setlist, e.g. \"60, 60, encore 15\": the minutes of every set, with \"encore\" in front of the encore and optionally \"mood <weight>\" after a set. No song is played twice and the OG songs and tunings are spread over the sets")
+
+        # Fill Checkbox
+        self.fill_checkbox = QCheckBox("Fill Set Time")
+        self.fill_checkbox.setToolTip("Fill the time left at the end of the set with the songs that fit best, instead of stopping at the first song that does not fit")
+
+        # Optimize Order Checkbox
+        self.optimize_order_checkbox = QCheckBox("Optimize Order")
+        self.optimize_order_checkbox.setToolTip("Order the songs for as few retunes and as many segues as possible (strongest song first and last) instead of by mood clusters. Songs are dropped if the real transitions make the set too long")
+
         # Run Button
-        run_button = QPushButton("Run")
-        run_button.setToolTip("Generate Setlist")
-        run_button.clicked.connect(self.update_setlist_text)
+        self.run_button = QPushButton("Run")
+        self.run_button.setToolTip("Generate Setlist")
+        self.run_button.clicked.connect(self.request_generation)
+        self.run_debounce = QTimer(self)
+        self.run_debounce.setSingleShot(True)
+        self.run_debounce.setInterval(250)
+        self.run_debounce.timeout.connect(self.generate_setlist)
+
+        # Cancel Button
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setToolTip("Stop generating")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_generation)
+        run_layout = QHBoxLayout()
+        run_layout.addWidget(self.run_button)
+        run_layout.addWidget(self.cancel_button)
+
+        # Progress and Elapsed Time
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.elapsed_label = QLabel("Elapsed: 0.00 s")
+        self.elapsed = QElapsedTimer()
+        self.elapsed_timer = QTimer(self)
+        self.elapsed_timer.setInterval(100)
+        self.elapsed_timer.timeout.connect(self.update_elapsed)
+        progress_layout = QHBoxLayout()
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.elapsed_label)
 
         # Setlist Generated Text
         self.setlist_generated_text = QTextEdit()
@@ -283,7 +633,22 @@ class SetlistGeneratorWindow(QMainWindow):
         tab1_layout.addWidget(self.transition_time_entry)
         tab1_layout.addWidget(QLabel("Cluster Size:"))
         tab1_layout.addWidget(self.cluster_size_entry)
-        tab1_layout.addWidget(run_button)
+        tab1_layout.addWidget(QLabel("Candidates:"))
+        tab1_layout.addWidget(self.candidates_entry)
+        tab1_layout.addWidget(QLabel("Recency Weight:"))
+        tab1_layout.addWidget(self.recency_weight_entry)
+        tab1_layout.addWidget(QLabel("Recency Half-Life (days):"))
+        tab1_layout.addWidget(self.recency_half_life_entry)
+        tab1_layout.addWidget(QLabel("Seed:"))
+        tab1_layout.addWidget(self.seed_entry)
+        tab1_layout.addWidget(QLabel("Show Sets (minutes):"))
+        tab1_layout.addWidget(self.show_sets_entry)
+        tab1_layout.addWidget(QLabel("Constraints File:"))
+        tab1_layout.addLayout(constraints_file_layout)
+        tab1_layout.addWidget(self.fill_checkbox)
+        tab1_layout.addWidget(self.optimize_order_checkbox)
+        tab1_layout.addLayout(run_layout)
+        tab1_layout.addLayout(progress_layout)
         tab1_layout.addWidget(self.setlist_generated_text)
         tab1.setLayout(tab1_layout)
 
@@ -300,6 +665,19 @@ class SetlistGeneratorWindow(QMainWindow):
         export_button.setToolTip("Export to Selected Output File")
         export_button.clicked.connect(self.export_to_output_file)
 
+        # Candidate Buttons
+        previous_button = QPushButton("Previous")
+        previous_button.setToolTip("Show the previous candidate setlist")
+        previous_button.clicked.connect(self.previous_candidate)
+        next_button = QPushButton("Next")
+        next_button.setToolTip("Show the next candidate setlist")
+        next_button.clicked.connect(self.next_candidate)
+        self.candidate_label = QLabel("No candidates")
+        candidate_layout = QHBoxLayout()
+        candidate_layout.addWidget(previous_button)
+        candidate_layout.addWidget(self.candidate_label)
+        candidate_layout.addWidget(next_button)
+
         # Feedback Text
         self.message_box_export = QLineEdit()
         self.message_box_export.setReadOnly(True)  # Set the text box to read-only
@@ -309,6 +687,7 @@ class SetlistGeneratorWindow(QMainWindow):
         tab2_layout.addWidget(QLabel("Output File:"))
         tab2_layout.addLayout(output_file_layout)
         tab2_layout.addWidget(export_button)
+        tab2_layout.addLayout(candidate_layout)
         tab2_layout.addWidget(self.setlist_text)
         tab2_layout.addWidget(self.message_box_export)
         tab2.setLayout(tab2_layout)
@@ -318,8 +697,37 @@ class SetlistGeneratorWindow(QMainWindow):
         tab_widget.addTab(tab3, "Includes/Excludes")
 
         # Available Songs List
-        self.available_songs_list = QListWidget()
-        self.available_songs_list.setSelectionMode(QListWidget.ExtendedSelection)  # Enable multi-selection
+        self.song_model = SongTableModel()
+        self.available_songs_list = QTableView()
+        self.available_songs_list.setModel(self.song_model)
+        self.available_songs_list.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.available_songs_list.setSelectionMode(QAbstractItemView.ExtendedSelection)  # Enable multi-selection
+        # Fixed row heights, so the view never measures rows that are not on screen
+        self.available_songs_list.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.available_songs_list.verticalHeader().setDefaultSectionSize(self.available_songs_list.fontMetrics().height() + 6)
+        self.available_songs_list.verticalHeader().hide()
+        self.available_songs_list.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+
+        # Search Box and Filters
+        self.song_search_entry = QLineEdit()
+        self.song_search_entry.setPlaceholderText("Search songs and artists")
+        self.song_search_entry.setClearButtonEnabled(True)
+        self.song_search_entry.textChanged.connect(self.filter_songs)
+        self.facet_boxes = {}
+        filter_layout = QHBoxLayout()
+        for facet, label in (("Key", "Any key"), ("Tuning", "Any tuning"), ("Mood", "Any mood")):
+            box = QComboBox()
+            box.addItem(label, None)
+            box.currentIndexChanged.connect(self.filter_songs)
+            self.facet_boxes[facet] = box
+            filter_layout.addWidget(box)
+        self.og_only_checkbox = QCheckBox("OG only")
+        self.og_only_checkbox.stateChanged.connect(self.filter_songs)
+        self.active_only_checkbox = QCheckBox("Active only")
+        self.active_only_checkbox.stateChanged.connect(self.filter_songs)
+        filter_layout.addWidget(self.og_only_checkbox)
+        filter_layout.addWidget(self.active_only_checkbox)
+        self.song_filter_label = QLabel("")
         self.load_songs_from_csv() # Init the list (although no CSV file is loaded yet)
 
         # Include and Exclude Buttons
@@ -330,6 +738,17 @@ class SetlistGeneratorWindow(QMainWindow):
         exclude_button.setToolTip("Click to exclude selected songs from the setlist")
         exclude_button.clicked.connect(self.exclude_selected_songs)
 
+        # Include Shown and Exclude Shown Buttons
+        include_shown_button = QPushButton("Include Shown")
+        include_shown_button.setToolTip("Click to include every song that matches the search and filters")
+        include_shown_button.clicked.connect(self.include_shown_songs)
+        exclude_shown_button = QPushButton("Exclude Shown")
+        exclude_shown_button.setToolTip("Click to exclude every song that matches the search and filters")
+        exclude_shown_button.clicked.connect(self.exclude_shown_songs)
+        shown_layout = QHBoxLayout()
+        shown_layout.addWidget(include_shown_button)
+        shown_layout.addWidget(exclude_shown_button)
+
         #Remove Button
         remove_button = QPushButton("Remove")
         remove_button.setToolTip("Click to remove selected songs from the includes/excludes list")
@@ -346,9 +765,13 @@ class SetlistGeneratorWindow(QMainWindow):
 
         # Layout for Tab 3
         tab3_layout = QVBoxLayout()
+        tab3_layout.addWidget(self.song_search_entry)
+        tab3_layout.addLayout(filter_layout)
+        tab3_layout.addWidget(self.song_filter_label)
         tab3_layout.addWidget(self.available_songs_list)
         tab3_layout.addWidget(include_button)
         tab3_layout.addWidget(exclude_button)
+        tab3_layout.addLayout(shown_layout)
         tab3_layout.addWidget(remove_button)
         tab3_layout.addWidget(modify_button)
         tab3_layout.addWidget(self.message_box_modify)
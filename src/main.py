@@ -1,15 +1,40 @@
 # Main.py - The driver file for the setlist generator.
-# usage: python main.py [-d] [-h]
+# usage: python main.py [-d] [-h] [--profile FILE [--profile-chrome] [--profile-python] [--profile-memory]]
+#        python main.py [--profile FILE ...] generate --csv songs.csv --out dir/ [options]   (headless, see cli.py)
+#        python main.py serve [--host HOST] [--port PORT] [--csv songs.csv ...]   (HTTP/JSON server, see server.py)
+#        python main.py analyze --csv songs.csv [--out analysis.csv] [options]   (what the weights do, see weight_analysis.py)
 # options:
-#   -d, --debug  print debug statements
-#   -h, --help   print help
+#   -d, --debug         print debug statements
+#   -h, --help          print help
+#   --profile FILE      time every stage of the run and write them to FILE as JSON when the program ends (see profiling.py)
+#   --profile-chrome    write a Chrome trace instead (open it in chrome://tracing or ui.perfetto.dev)
+#   --profile-python    also profile every Python function with cProfile (full stats in FILE.prof)
+#   --profile-memory    also track memory with tracemalloc
 # Note: Csv file must have the following columns: Song, Artist, Key, Tuning, Time, Mood, Active, Not in that order (I don't think)
+# Note: The GUI (and PyQt5) is only imported when the GUI is started, so the headless commands never load it.
 # Ryan Peruski, 07/29/2023
 
-from gui import *
 import sys
 import argparse
 
+def run_gui(args):
+    from gui import QApplication, SetlistGeneratorWindow
+    app = QApplication(sys.argv)
+    window = SetlistGeneratorWindow(debug=args.debug)
+    return app.exec_()
+
+def run(args):
+    if args.command == "generate":
+        from cli import run_generate
+        return run_generate(args)
+    if args.command == "analyze":
+        from weight_analysis import run_analyze
+        return run_analyze(args)
+    if args.command == "serve":
+        from server import run_serve
+        return run_serve(args)
+    return run_gui(args)
+
 if __name__ == "__main__":
     #Start arg parsing
     parser = argparse.ArgumentParser(conflict_handler='resolve', description="Setlist Generator")
@@ -17,18 +42,77 @@ if __name__ == "__main__":
     parser.add_argument("-d", "--debug", help="print debug statements", action="store_true")
     # Add help flag
     parser.add_argument("-h", "--help", help="print help", action="store_true")
+    # Profiling flags
+    parser.add_argument("--profile", metavar="FILE", help="time every stage of the run and write the results to FILE (JSON)")
+    parser.add_argument("--profile-chrome", action="store_true", help="write the profile as a Chrome trace")
+    parser.add_argument("--profile-python", action="store_true", help="also profile every Python function (cProfile)")
+    parser.add_argument("--profile-memory", action="store_true", help="also track memory (tracemalloc)")
+    # Headless commands
+    subparsers = parser.add_subparsers(dest="command")
+    generate_parser = subparsers.add_parser("generate", help="generate setlists without the GUI")
+    generate_parser.add_argument("--csv", help="song csv file")
+    generate_parser.add_argument("--shows", help="JSON or TOML file with a list of show specs (see cli.py)")
+    generate_parser.add_argument("--out", required=True, help="directory to write the setlists to")
+    generate_parser.add_argument("--name", default="setlist", help="name used for the output files (default: setlist)")
+    generate_parser.add_argument("--set-time", type=float, default=60, help="set time in minutes (default: 60)")
+    generate_parser.add_argument("--transition-time", type=float, help="transition time in minutes (default: 10%% of the set time)")
+    generate_parser.add_argument("--og-weight", type=float, default=1.2, help="OG weight (default: 1.2)")
+    generate_parser.add_argument("--mood-weight", type=float, default=0.8, help="mood weight (default: 0.8)")
+    generate_parser.add_argument("--cluster-size", type=int, default=2, help="cluster size (default: 2)")
+    generate_parser.add_argument("--count", type=int, default=1, help="number of setlists per show (default: 1)")
+    generate_parser.add_argument("--seed", type=int, help="random seed, for reproducible setlists")
+    generate_parser.add_argument("--format", default="text", choices=["text", "markdown", "json", "csv", "stage"], help="output format (default: text)")
+    generate_parser.add_argument("--sets", help="plan a whole show with these sets, e.g. \"60, 60, encore 15\" (see show_planner.py)")
+    generate_parser.add_argument("--fill", action="store_true", help="fill the leftover time at the end of each set")
+    generate_parser.add_argument("--optimize-order", action="store_true", help="order the songs for as few retunes as possible instead of by mood clusters")
+    generate_parser.add_argument("--recency-weight", type=float, default=0.8, help="how much to rest recently played songs, 0 to 1 (default: 0.8)")
+    generate_parser.add_argument("--recency-half-life", type=float, default=30, help="days until a played song gets back half its weight (default: 30)")
+    generate_parser.add_argument("--constraints", metavar="FILE", help="JSON or TOML file with rules every setlist has to follow (see set_constraints.py)")
+    generate_parser.add_argument("--include", dest="includes", action="append", default=[], help="song to include (can be repeated)")
+    generate_parser.add_argument("--exclude", dest="excludes", action="append", default=[], help="song to exclude (can be repeated)")
+    serve_parser = subparsers.add_parser("serve", help="serve setlist generation over HTTP/JSON (see server.py)")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1, use 0.0.0.0 for other devices)")
+    serve_parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    serve_parser.add_argument("--csv", action="append", default=[], help="song file to load at startup (can be repeated)")
+    serve_parser.add_argument("--workers", type=int, help="threads for generation (default: one per CPU)")
+    analyze_parser = subparsers.add_parser("analyze", help="simulate lots of setlists to see what the weights do (see weight_analysis.py)")
+    analyze_parser.add_argument("--csv", required=True, help="song csv file")
+    analyze_parser.add_argument("--out", help="csv file for the per-song results (the sweep goes next to it)")
+    analyze_parser.add_argument("--set-time", type=float, default=60, help="set time in minutes (default: 60)")
+    analyze_parser.add_argument("--transition-time", type=float, help="transition time in minutes (default: 10%% of the set time)")
+    analyze_parser.add_argument("--og-weight", type=float, default=1.2, help="OG weight (default: 1.2)")
+    analyze_parser.add_argument("--mood-weight", type=float, default=0.8, help="mood weight (default: 0.8)")
+    analyze_parser.add_argument("--cluster-size", type=int, default=2, help="cluster size, for the openers and closers (default: 2)")
+    analyze_parser.add_argument("--setlists", type=int, default=100000, help="setlists to simulate (default: 100000)")
+    analyze_parser.add_argument("--sweep-setlists", type=int, default=20000, help="setlists to simulate for every point of the sweeps (default: 20000)")
+    analyze_parser.add_argument("--og-grid", default="0.5,0.75,1,1.2,1.5,2,2.5,3", help="OG weights to sweep (default: 0.5,0.75,1,1.2,1.5,2,2.5,3)")
+    analyze_parser.add_argument("--mood-grid", default="0,0.25,0.5,0.8,1,1.5,2,3", help="mood weights to sweep (default: 0,0.25,0.5,0.8,1,1.5,2,3)")
+    analyze_parser.add_argument("--best-of", type=int, default=1, help="simulate the best scored of N setlists, like a run with N candidates (default: 1)")
+    analyze_parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    analyze_parser.add_argument("--recency-weight", type=float, default=0.8, help="how much to rest recently played songs, 0 to 1 (default: 0.8)")
+    analyze_parser.add_argument("--recency-half-life", type=float, default=30, help="days until a played song gets back half its weight (default: 30)")
+    analyze_parser.add_argument("--include", dest="includes", action="append", default=[], help="song to include (can be repeated)")
+    analyze_parser.add_argument("--exclude", dest="excludes", action="append", default=[], help="song to exclude (can be repeated)")
     try: # If unknown argument, print help and exit
         args = parser.parse_args()
+    except SystemExit as e:
+        if e.code == 0: # A subcommand printed its own help
+            raise
+        parser.print_help()
+        sys.exit(0)
     except:
         parser.print_help()
         sys.exit(0)
     # End arg parsing
-    app = QApplication(sys.argv)
     # If help flag is set, print help and exit
     if args.help:
         parser.print_help()
         sys.exit(0)
 
-
-    window = SetlistGeneratorWindow(debug=args.debug)
-    sys.exit(app.exec_())
\ No newline at end of file
+    if args.profile:
+        from profiling import profiled
+        with profiled(args.profile, chrome=args.profile_chrome, python=args.profile_python, memory=args.profile_memory):
+            status = run(args)
+        print(f"Profile written to {args.profile}", file=sys.stderr)
+        sys.exit(status)
+    sys.exit(run(args))
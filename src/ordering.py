@@ -0,0 +1,171 @@
+# Ordering - Puts the songs of a setlist in a playing order with as few guitar retunes (and as many key segues) as
+# possible, instead of the mood clusters of sort_sample_into_clusters.
+# Every pair of songs gets a transition cost, all at once as a matrix:
+#   the time between the two songs in minutes (SONG_GAP_MINUTES, nothing for a segue, plus RETUNE_MINUTES if the
+#   tuning changes), plus MOOD_JUMP_COST for every point of mood between them.
+# The strongest song (highest mood) opens the set and the next strongest closes it, like with the clusters. The songs
+# in between are put in order by nearest neighbour (ties broken at random, so runs still differ), then improved with
+# 2-opt (reversing a stretch of songs) and or-opt (moving one to three songs somewhere else) until nothing improves or
+# the time limit is up.
+# The time the transitions really take in the final order is returned, so the caller can check it against the set
+# time: fit_order_to_set_time drops the weakest songs until the songs plus the transitions fit. It also works the other
+# way: when an order with a lot of segues leaves time over, refill_order adds songs from the rest of the pool (with
+# setlist_math.fill_remaining_time) and orders the set again.
+# Usage:
+#   order, transition_time = order_setlist(times, keys, tunings, moods, set_time=60, keep=included, rng=rng)
+#   refilled = refill_order(positions[order], transition_time, times, keys, tunings, moods, weights, pool, set_time=60, rng=rng)
+
+import time
+import numpy as np
+from profiling import count
+from setlist_math import fill_remaining_time
+
+SONG_GAP_MINUTES = 0.25
+RETUNE_MINUTES = 1.0
+MOOD_JUMP_COST = 0.05
+ORDER_TIME_LIMIT = 0.05 # Seconds
+
+def _codes(values):
+    return np.unique(np.asarray(values).astype(str), return_inverse=True)[1]
+
+# Minutes it takes to go from song i to song j, for every pair of songs
+def transition_minutes(keys, tunings):
+    keys = np.asarray(keys).astype(str)
+    key_codes, tuning_codes = _codes(keys), _codes(tunings)
+    same_tuning = tuning_codes[:, None] == tuning_codes[None, :]
+    segue = same_tuning & (key_codes[:, None] == key_codes[None, :]) & (keys != "Misc")[:, None]
+    return np.where(segue, 0.0, SONG_GAP_MINUTES) + np.where(same_tuning, 0.0, RETUNE_MINUTES)
+
+def transition_cost_matrix(keys, tunings, moods, mood_jump_cost=MOOD_JUMP_COST):
+    moods = np.nan_to_num(np.asarray(moods, dtype=float), nan=5.0)
+    return transition_minutes(keys, tunings) + mood_jump_cost * np.abs(moods[:, None] - moods[None, :])
+
+# Total of the cost matrix along an order (minutes if cost is from transition_minutes)
+def path_cost(cost, order):
+    order = np.asarray(order)
+    return float(cost[order[:-1], order[1:]].sum())
+
+# Positions of the opener (the strongest song) and the closer (the next strongest)
+def opener_and_closer(moods):
+    by_mood = np.argsort(-np.nan_to_num(np.asarray(moods, dtype=float), nan=-np.inf), kind='stable')
+    return by_mood[0], by_mood[1] if len(by_mood) > 1 else None
+
+# Path from start to end through every other song, always going to the cheapest song left
+def nearest_neighbour(cost, start, end, rng):
+    left = np.ones(len(cost), dtype=bool)
+    left[[start, end]] = False
+    order = [start]
+    candidates = rng.permutation(np.flatnonzero(left)) # Random order, so ties go to a random song
+    while len(candidates):
+        best = np.argmin(cost[order[-1], candidates])
+        order.append(candidates[best])
+        candidates = np.delete(candidates, best)
+    order.append(end)
+    return np.array(order)
+
+# Best 2-opt move (reversing order[i:j+1], keeping both ends in place). Returns (gain, i, j)
+def _best_two_opt(cost, order):
+    n = len(order)
+    i = np.arange(1, n - 1)
+    # Rows are the first song of the stretch (i), columns the last one (j)
+    delta = (cost[order[i - 1][:, None], order[i][None, :]] + cost[order[i][:, None], order[i + 1][None, :]]
+             - cost[order[i - 1], order[i]][:, None] - cost[order[i], order[i + 1]][None, :])
+    delta[np.tril_indices(len(i))] = 0.0
+    best = np.unravel_index(np.argmin(delta), delta.shape)
+    return -delta[best], i[best[0]], i[best[1]]
+
+# Best or-opt move (moving order[i:i+length] between two other songs). Returns (gain, i, length, k), where the
+# stretch goes after order[k]
+def _best_or_opt(cost, order):
+    n = len(order)
+    best = (0.0, 0, 0, 0)
+    k = np.arange(n - 1)
+    for length in (1, 2, 3):
+        for i in range(1, n - length):
+            first, last = order[i], order[i + length - 1]
+            before, after = order[i - 1], order[i + length]
+            removed = cost[before, first] + cost[last, after] - cost[before, after]
+            added = cost[order[k], first] + cost[last, order[k + 1]] - cost[order[k], order[k + 1]]
+            added[i - 1:i + length] = np.inf # Can't go back where it came from or inside itself
+            j = np.argmin(added)
+            if removed - added[j] > best[0]:
+                best = (removed - added[j], i, length, j)
+    return best
+
+# Improves an order with 2-opt and or-opt moves (the first and last song stay put) until no move helps or the
+# deadline (a time.perf_counter() value) passes
+def improve_order(cost, order, deadline):
+    order = np.array(order)
+    while len(order) > 3 and time.perf_counter() < deadline:
+        count("ordering.moves")
+        gain, i, j = _best_two_opt(cost, order)
+        if gain > 1e-9:
+            order[i:j + 1] = order[i:j + 1][::-1]
+            continue
+        gain, i, length, k = _best_or_opt(cost, order)
+        if gain <= 1e-9:
+            break
+        stretch = order[i:i + length]
+        rest = np.delete(order, np.arange(i, i + length))
+        at = k + 1 if k < i else k + 1 - length
+        order = np.concatenate((rest[:at], stretch, rest[at:]))
+    return order
+
+# Low cost playing order for the given songs (positions into the arrays), with the strongest song first and the next
+# strongest last
+def optimize_order(keys, tunings, moods, time_limit=ORDER_TIME_LIMIT, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    deadline = time.perf_counter() + time_limit
+    n = len(keys)
+    if n == 0:
+        raise IndexError("Can't order an empty setlist")
+    opener, closer = opener_and_closer(moods)
+    if closer is None:
+        return np.array([opener])
+    cost = transition_cost_matrix(keys, tunings, moods)
+    return improve_order(cost, nearest_neighbour(cost, opener, closer, rng), deadline)
+
+# Drops songs from an order until the song times plus the transitions (in that order) fit in set_time. The weakest
+# songs go first; the opener, the closer and the positions in keep are never dropped.
+# Returns the order that is left and its transition time in minutes
+def fit_order_to_set_time(order, times, keys, tunings, moods, set_time, keep=()):
+    order = np.asarray(order)
+    minutes = transition_minutes(keys, tunings)
+    moods = np.nan_to_num(np.asarray(moods, dtype=float), nan=5.0)
+    times = np.asarray(times, dtype=float)
+    droppable = np.ones(len(times), dtype=bool)
+    droppable[list(keep)] = False
+    droppable[order[[0, -1]]] = False
+    transition_time = path_cost(minutes, order)
+    while times[order].sum() + transition_time > set_time:
+        candidates = order[droppable[order]]
+        if len(candidates) == 0:
+            break
+        weakest = candidates[np.argmin(moods[candidates])]
+        order = order[order != weakest]
+        transition_time = path_cost(minutes, order)
+    return order, transition_time
+
+# optimize_order, then fit_order_to_set_time if set_time is given. Returns (order, transition time in minutes)
+def order_setlist(times, keys, tunings, moods, set_time=None, keep=(), rng=None, time_limit=ORDER_TIME_LIMIT):
+    order = optimize_order(keys, tunings, moods, time_limit=time_limit, rng=rng)
+    if set_time is None:
+        return order, path_cost(transition_minutes(keys, tunings), order)
+    return fit_order_to_set_time(order, times, keys, tunings, moods, set_time, keep=keep)
+
+# Gives the time an order saves back to the set. positions (into the catalog arrays) are a set in the order from
+# order_setlist with the given transition time; the time they leave in set_time (at most budget minutes) is filled with
+# songs from pool by fill_remaining_time, and the grown set is ordered and fit to set_time again, dropping only the
+# added songs. Returns (positions in playing order, transition time), or None if nothing was added
+def refill_order(positions, transition_time, times, keys, tunings, moods, weights, pool, set_time, budget=np.inf, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    spare = min(set_time - times[positions].sum() - transition_time, budget)
+    added = fill_remaining_time(times, weights, spare, pool[~np.isin(pool, positions)], rng)
+    if len(added) == 0:
+        return None
+    grown = np.concatenate([positions, added])
+    order, grown_time = order_setlist(times[grown], keys[grown], tunings[grown], moods[grown], set_time=set_time, keep=np.arange(len(positions)), rng=rng)
+    if times[grown[order]].sum() + grown_time > set_time: # The songs that were there no longer fit in the new order
+        return None
+    count("ordering.refilled_songs", len(order) - len(positions))
+    return grown[order], grown_time
@@ -0,0 +1,116 @@
+# Parallel Generation - Runs many make_setlist + sort_sample_into_clusters runs across all cores, for parameter sweeps
+# and festival planning with thousands of setlists.
+# The catalog is copied once into shared memory as numpy arrays (numbers, plus integer codes for the text columns).
+# Each worker process attaches to it and builds its own dataframe once at startup, so tasks only send a few parameters
+# and get back the ordered song positions. Every task gets its own seed derived from the base seed and the task
+# number, so a sweep gives the same setlists no matter how many workers run it or in what order tasks finish.
+# This is a library for scripts: main.py generate and the server don't use it. Importing it doesn't import pandas.
+# Usage:
+#   with ParallelGenerator(songs, workers=8) as generator:
+#       for task, spec, positions in generator.generate(sweep_specs([1.0, 1.2], [0.5, 0.8], [45, 60]), seed=7):
+#           print(generator.render(positions))
+
+import os
+from multiprocessing import get_context, shared_memory
+import numpy as np
+from setlist_math import *
+
+NUMERIC_COLUMNS = ("Time", "Mood")
+TEXT_COLUMNS = ("Song", "Artist", "Key", "Tuning")
+
+# State of a worker process, filled in once by _init_worker
+_worker = {}
+
+def _init_worker(layout, categories):
+    import pandas as pd
+    blocks = []
+    columns = {}
+    for column, (name, dtype, length) in layout.items():
+        # Pool workers share the parent's resource tracker, so attaching does not hand the block over to the worker
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        array = np.ndarray((length,), dtype=dtype, buffer=block.buf)
+        if column in categories:
+            columns[column] = pd.Categorical.from_codes(array, categories[column])
+        else:
+            columns[column] = array
+    _worker["blocks"] = blocks # Keep the blocks open for as long as the worker lives
+    _worker["catalog"] = pd.DataFrame(columns)
+    _worker["arrays"] = catalog_arrays(_worker["catalog"])
+
+def _run_task(task):
+    index, spec, seed = task
+    times, moods, is_og = _worker["arrays"]
+    rng = np.random.default_rng(seed)
+    weights = song_weights(moods, is_og, spec["og_weight"], spec["mood_weight"])
+    positions = sample_setlist_indices(times, weights, spec["target_time"], includes=spec.get("include_positions", ()), rng=rng)
+    if len(positions) == 0:
+        return index, spec, positions
+    sorted_clusters = sort_sample_into_clusters(_worker["catalog"].iloc[positions], cluster_size=spec["cluster_size"], rng=rng)
+    return index, spec, sorted_clusters.index.to_numpy()
+
+# Builds one spec per combination of the given weights and set times, each repeated `repeats` times.
+# Target time is the set time minus the transition time (10% of the set time by default, like the GUI)
+def sweep_specs(og_weights, mood_weights, set_times, cluster_size=2, repeats=1, transition_ratio=0.1, includes=()):
+    for og_weight in og_weights:
+        for mood_weight in mood_weights:
+            for set_time in set_times:
+                for _ in range(repeats):
+                    yield dict(og_weight=og_weight, mood_weight=mood_weight, set_time=set_time, target_time=set_time * (1 - transition_ratio),
+                               cluster_size=cluster_size, includes=list(includes))
+
+class ParallelGenerator:
+    # df should already have the excluded songs filtered out. workers defaults to the number of cores
+    def __init__(self, df, workers=None):
+        import pandas as pd
+        self.catalog = df.reset_index(drop=True)
+        self.workers = workers or os.cpu_count() or 1
+        self.blocks = []
+        layout = {}
+        categories = {}
+        # Copy the catalog into shared memory once
+        for column in NUMERIC_COLUMNS + TEXT_COLUMNS:
+            if column in TEXT_COLUMNS:
+                codes, uniques = pd.factorize(self.catalog[column])
+                array = codes.astype(np.int32)
+                categories[column] = list(uniques)
+            else:
+                array = self.catalog[column].to_numpy(dtype=float)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            layout[column] = (block.name, array.dtype.str, len(array))
+        self.pool = get_context().Pool(self.workers, initializer=_init_worker, initargs=(layout, categories))
+
+    # Runs every spec (see sweep_specs for the keys) and yields (task number, spec, ordered song positions) as soon as
+    # each one finishes, so results stream back in completion order rather than submission order
+    def generate(self, specs, seed=0, chunksize=1):
+        tasks = []
+        for index, spec in enumerate(specs):
+            spec = dict(spec)
+            includes = spec.pop("includes", ())
+            if len(includes):
+                spec["include_positions"] = np.flatnonzero(self.catalog["Song"].isin(includes).to_numpy())
+            task_seed = np.random.SeedSequence([seed, index]).generate_state(1)[0]
+            tasks.append((index, spec, int(task_seed)))
+        yield from self.pool.imap_unordered(_run_task, tasks, chunksize=chunksize)
+
+    # Turns positions from generate back into the setlist text
+    def render(self, positions):
+        return write_setlist_to_string(self.catalog.iloc[positions])
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
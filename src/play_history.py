@@ -0,0 +1,180 @@
+# Play History - Remembers which songs were played when, so generation can rest the songs that were played recently.
+# Every setlist exported from the GUI is appended as one line to a log next to the song file (songs.csv.play-history):
+#   {"date": "2026-10-18", "songs": ["Althea", ...]}
+# The log is only ever appended to (each line written and synced in one go, a half-written last line is ignored), so
+# it can be kept for years. Reading it is made cheap by a summary in the cache directory (see catalog.cache_dir) with
+# the last played day and play count of every song, plus how far into the log it has read. Loading the history only
+# reads the summary and the log lines added since, and it is memoized in the process as long as the log is unchanged.
+# Recency weights: a song played d days ago has its weight multiplied by 1 - recency_weight * 0.5 ** (d / half_life),
+# so a song played today with recency_weight 0.8 is picked 5 times less often, and it is back to 90% of its weight
+# after 3 half lives. Songs that were never played keep their weight. A recency_weight of 0 turns this off.
+# Usage:
+#   record_play("songs.csv", ["Althea", "All My Love"])
+#   weights = song_weights(moods, is_og, og_weight, mood_weight, recency_multipliers("songs.csv", library.names, 0.8, 30))
+
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+from catalog import cache_dir
+from profiling import stage
+
+HISTORY_SUFFIX = ".play-history"
+DEFAULT_RECENCY_WEIGHT = 0.8
+DEFAULT_HALF_LIFE_DAYS = 30.0
+SUMMARY_VERSION = 1
+EPOCH = datetime.date(1970, 1, 1)
+
+# History already loaded in this process: log path -> (log fingerprint, summary)
+_loaded = {}
+# The same history lined up with a catalog: log path -> (log fingerprint, catalog names, (last played, play count))
+_arrays = {}
+
+def history_path(song_file):
+    return str(song_file) + HISTORY_SUFFIX
+
+def summary_path(log_path):
+    name = hashlib.sha1(os.path.abspath(log_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir(), name + ".history.npz")
+
+# Forgets the histories loaded in this process (the summaries on disk are kept)
+def clear_loaded_history():
+    _loaded.clear()
+    _arrays.clear()
+
+# Identity of the log on disk, or None if nothing was played yet
+def history_fingerprint(song_file):
+    try:
+        stat = os.stat(history_path(song_file))
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+def _day(date):
+    return (date - EPOCH).days
+
+# Appends one played setlist (song names) to the log of the song file
+def record_play(song_file, songs, date=None):
+    date = date or datetime.date.today()
+    line = json.dumps(dict(date=date.isoformat(), songs=[str(song) for song in songs])) + "\n"
+    with stage("history_write", songs=len(songs)), open(history_path(song_file), "a+b") as file:
+        if file.tell() > 0:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                line = "\n" + line # End a half-written line left by a crash, so it can't swallow this one
+        file.write(line.encode("utf-8"))
+        file.flush()
+        os.fsync(file.fileno())
+
+def _empty_summary():
+    return dict(offset=0, names=np.array([], dtype=str), last_played=np.array([], dtype=np.int64), play_count=np.array([], dtype=np.int64))
+
+def _read_summary(path):
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != SUMMARY_VERSION:
+                return None
+            return dict(offset=int(data["offset"]), names=data["names"], last_played=data["last_played"], play_count=data["play_count"])
+    except Exception: # A missing, truncated or corrupt summary is rebuilt from the log
+        return None
+
+def _write_summary(path, summary):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(path)) # Never shared with another writer
+    try:
+        with os.fdopen(handle, "wb") as file:
+            np.savez(file, version=np.array(SUMMARY_VERSION), **summary)
+        os.replace(temp_path, path) # Atomic, so a half-written summary is never read
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+# Adds the log lines after the summary's offset to the summary. Returns the new summary
+def _update_summary(summary, log_path):
+    with open(log_path, "rb") as file:
+        file.seek(summary["offset"])
+        data = file.read()
+    complete = data.rfind(b"\n") + 1 # A half-written last line is left for next time
+    plays = {}
+    for line in data[:complete].split(b"\n"):
+        try:
+            entry = json.loads(line)
+            day = _day(datetime.date.fromisoformat(entry["date"]))
+        except (ValueError, KeyError, TypeError):
+            continue
+        for song in entry["songs"]:
+            last, count = plays.get(song, (day, 0))
+            plays[song] = (max(last, day), count + 1)
+    names = summary["names"].tolist()
+    last_played = summary["last_played"].tolist()
+    play_count = summary["play_count"].tolist()
+    index = {name: i for i, name in enumerate(names)}
+    for song, (day, count) in plays.items():
+        i = index.get(song)
+        if i is None:
+            index[song] = len(names)
+            names.append(song)
+            last_played.append(day)
+            play_count.append(count)
+        else:
+            last_played[i] = max(last_played[i], day)
+            play_count[i] += count
+    order = np.argsort(np.array(names, dtype=str), kind="stable") # Sorted by name, for lookups with searchsorted
+    return dict(offset=summary["offset"] + complete, names=np.array(names, dtype=str)[order],
+                last_played=np.array(last_played, dtype=np.int64)[order], play_count=np.array(play_count, dtype=np.int64)[order])
+
+# The history of a song file as a summary: sorted song names with their last played day (days since 1970) and play count
+def load_history(song_file):
+    log_path = history_path(song_file)
+    fingerprint = history_fingerprint(song_file)
+    if fingerprint is None:
+        return _empty_summary()
+    loaded = _loaded.get(log_path)
+    if loaded is not None and loaded[0] == fingerprint:
+        return loaded[1]
+    with stage("history_read"):
+        path = summary_path(log_path)
+        summary = _read_summary(path)
+        if summary is None or summary["offset"] > fingerprint[0]: # No summary yet, or the log was replaced by a shorter one
+            summary = _empty_summary()
+        if summary["offset"] < fingerprint[0]:
+            summary = _update_summary(summary, log_path)
+            try:
+                _write_summary(path, summary)
+            except OSError:
+                pass # The summary is only an optimization
+    _loaded[log_path] = (fingerprint, summary)
+    return summary
+
+# Last played day (NaN if never) and play count of every song in names (the catalog's Song column)
+def history_arrays(song_file, names):
+    fingerprint = history_fingerprint(song_file)
+    loaded = _arrays.get(history_path(song_file))
+    if loaded is not None and loaded[0] == fingerprint and loaded[1] is names:
+        return loaded[2]
+    summary = load_history(song_file)
+    catalog_names = names
+    names = np.asarray(names).astype(str)
+    last_played = np.full(len(names), np.nan)
+    play_count = np.zeros(len(names), dtype=np.int64)
+    if len(summary["names"]):
+        found = np.searchsorted(summary["names"], names)
+        found[found == len(summary["names"])] = 0
+        played = summary["names"][found] == names
+        last_played[played] = summary["last_played"][found[played]]
+        play_count[played] = summary["play_count"][found[played]]
+    _arrays[history_path(song_file)] = (fingerprint, catalog_names, (last_played, play_count))
+    return last_played, play_count
+
+# Weight multiplier of every song in names for how recently it was played (see the header), or None if there is
+# nothing to rest (no history, or recency_weight 0)
+def recency_multipliers(song_file, names, recency_weight=DEFAULT_RECENCY_WEIGHT, half_life=DEFAULT_HALF_LIFE_DAYS, today=None):
+    if not recency_weight or history_fingerprint(song_file) is None:
+        return None
+    last_played, _ = history_arrays(song_file, names)
+    days = np.maximum(_day(today or datetime.date.today()) - last_played, 0)
+    with np.errstate(invalid="ignore"):
+        rest = np.where(np.isnan(days), 0.0, recency_weight * np.power(0.5, days / max(half_life, 1e-9)))
+    return 1.0 - np.clip(rest, 0.0, 1.0)
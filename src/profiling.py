@@ -0,0 +1,175 @@
+# Profiling - Times the stages of a run and counts what happens in them, for when a run is slow and we need data.
+# Turned on with `python main.py --profile trace.json ...` (GUI or headless), or from a script:
+#   with profiled("trace.json", chrome=True):
+#       ...
+# The code marks its stages with `with stage("csv_read"):` and counts things with `count("sampling.setlists", n)`.
+# When profiling is off, stage() hands back one shared do-nothing object and count() returns right away, so the marks
+# cost next to nothing.
+# A run can also be wrapped in cProfile (python=True, the slowest functions go into the output and the full stats
+# into <output>.prof) and tracemalloc (memory=True, the memory in use is recorded at the end of every stage, with the
+# biggest allocations at the end).
+# The output is JSON (stages, counters and the extras above), or a Chrome trace (chrome=True) that can be opened in
+# chrome://tracing or https://ui.perfetto.dev.
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+# The active Profiler, or None when profiling is off
+_profiler = None
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_stage(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+class Profiler:
+    def __init__(self, python=False, memory=False):
+        self.python = python
+        self.memory = memory
+        self.stages = []
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.started = None
+        self.stopped = None
+        self.cprofile = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.python:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.stopped = time.perf_counter()
+        if self.memory:
+            import tracemalloc
+            self.memory_peak = tracemalloc.get_traced_memory()[1]
+            self.memory_top = [dict(where=str(stat.traceback[0]), kb=stat.size / 1024, blocks=stat.count)
+                               for stat in tracemalloc.take_snapshot().statistics("lineno")[:20]]
+            tracemalloc.stop()
+
+    def add_stage(self, name, start, end, args):
+        if self.memory:
+            import tracemalloc
+            args = dict(args, memory_kb=tracemalloc.get_traced_memory()[0] / 1024)
+        with self.lock:
+            self.stages.append(dict(name=name, start=start, end=end, thread=threading.current_thread().name, args=args))
+
+    def count(self, name, n):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # Total time and number of runs of every stage
+    def summary(self):
+        totals = {}
+        for entry in self.stages:
+            total = totals.setdefault(entry["name"], dict(calls=0, total_ms=0.0))
+            total["calls"] += 1
+            total["total_ms"] += (entry["end"] - entry["start"]) * 1000
+        return totals
+
+    def _python_top(self, path):
+        import pstats
+        self.cprofile.dump_stats(path + ".prof")
+        stats = pstats.Stats(self.cprofile)
+        top = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:30]
+        return [dict(function=f"{file}:{line}({function})", calls=calls, own_ms=own * 1000, cumulative_ms=cumulative * 1000)
+                for (file, line, function), (_, calls, own, cumulative, _) in top]
+
+    def to_json(self, path):
+        data = dict(total_ms=((self.stopped or time.perf_counter()) - self.started) * 1000, summary=self.summary(), counters=self.counters,
+                    stages=[dict(name=entry["name"], start_ms=(entry["start"] - self.started) * 1000, duration_ms=(entry["end"] - entry["start"]) * 1000,
+                                 thread=entry["thread"], args=entry["args"]) for entry in self.stages])
+        if self.cprofile is not None:
+            data["python"] = self._python_top(path)
+        if self.memory:
+            data["memory"] = dict(peak_kb=self.memory_peak / 1024, top=self.memory_top)
+        return data
+
+    # Chrome trace events: one complete ("X") event per stage, and the counters as counter ("C") events at the end
+    def to_chrome(self, path):
+        pid = os.getpid()
+        threads = {}
+        events = []
+        for entry in self.stages:
+            tid = threads.setdefault(entry["thread"], len(threads) + 1)
+            events.append(dict(name=entry["name"], ph="X", ts=(entry["start"] - self.started) * 1e6, dur=(entry["end"] - entry["start"]) * 1e6,
+                               pid=pid, tid=tid, args=entry["args"]))
+        end = ((self.stopped or time.perf_counter()) - self.started) * 1e6
+        for name, value in self.counters.items():
+            events.append(dict(name=name, ph="C", ts=end, pid=pid, tid=0, args=dict(value=value)))
+        for name, tid in threads.items():
+            events.append(dict(name="thread_name", ph="M", pid=pid, tid=tid, args=dict(name=name)))
+        data = dict(traceEvents=events, displayTimeUnit="ms")
+        if self.cprofile is not None:
+            data["otherData"] = dict(python=self._python_top(path))
+        return data
+
+    def write(self, path, chrome=False):
+        data = self.to_chrome(path) if chrome else self.to_json(path)
+        with open(path, "w") as file:
+            json.dump(data, file, indent=None if chrome else 2, default=str)
+
+# Marks a stage of the run: `with stage("rendering", setlists=10):`. The keyword arguments are saved with it
+def stage(name, **args):
+    if _profiler is None:
+        return _NULL_STAGE
+    return _Stage(_profiler, name, args)
+
+# Adds n to a counter
+def count(name, n=1):
+    if _profiler is None:
+        return
+    _profiler.count(name, n)
+
+def enable_profiling(python=False, memory=False):
+    global _profiler
+    profiler = Profiler(python=python, memory=memory)
+    profiler.start()
+    _profiler = profiler
+    return profiler
+
+# Turns profiling off and returns the profiler that was running (or None)
+def disable_profiling():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+# Profiles the code in the with block and writes the result to path when it ends (even if it fails)
+@contextlib.contextmanager
+def profiled(path, chrome=False, python=False, memory=False):
+    profiler = enable_profiling(python=python, memory=memory)
+    try:
+        yield profiler
+    finally:
+        disable_profiling()
+        profiler.write(path, chrome=chrome)
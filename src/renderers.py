@@ -0,0 +1,165 @@
+# Renderers - Writes setlists out in different formats: plain text (like the View Setlist tab), Markdown, JSON with the
+# details of every song, CSV, and a big-font HTML page to print and put on stage.
+# Every renderer writes straight to an open file, so batches of setlists can be written one after the other without
+# building them up in memory. Renderers get a list of (title, setlist) pairs: one for a single setlist, or one per set
+# for a whole show (see show_planner.py). The segue (-->) and tuning notes are worked out for the whole setlist at
+# once (see setlist_math.setlist_segues).
+# A setlist is a dataframe or a dict of numpy columns (Song, Key and Tuning, plus Artist, Time and Mood if there),
+# with the songs in playing order.
+# Usage:
+#   write_setlist(setlist, "show.md")                    (the format comes from the file extension)
+#   with open("all.txt", "w") as file:
+#       for setlist in setlists:
+#           render_setlist(setlist, file, "text")
+#   write_show([("Set 1", set1), ("Set 2", set2)], "show.html")
+# New formats are added with the register_renderer decorator.
+
+import csv
+import html
+import json
+import numpy as np
+from setlist_math import setlist_lines, setlist_segues
+
+# Format name -> (render function, file extension)
+RENDERERS = {}
+
+def register_renderer(name, extension):
+    def register(render):
+        RENDERERS[name] = (render, extension)
+        return render
+    return register
+
+# The format to use for a file, from its extension. Unknown extensions get the default format
+def format_for_path(path, default="text"):
+    for name, (_, extension) in RENDERERS.items():
+        if path.lower().endswith(extension):
+            return name
+    return default
+
+def _column(setlist, name, default=""):
+    if name in setlist:
+        return np.asarray(setlist[name])
+    return np.full(len(setlist["Song"]), default, dtype=object)
+
+# Time and Mood can be float32 in a catalog (see catalog.py). They are turned into float64 through their shortest text,
+# so a Time of 3.1 is written as 3.1 and not 3.0999999046325684
+def _numbers(values):
+    return values.astype(str).astype(float) if values.dtype == np.float32 else values
+
+# Per song details of a setlist, as columns: everything the renderers write
+def setlist_details(setlist):
+    keys = _column(setlist, "Key")
+    tunings = _column(setlist, "Tuning")
+    details = dict(
+        song=_column(setlist, "Song"),
+        artist=_column(setlist, "Artist"),
+        key=keys,
+        tuning=tunings,
+        time=_numbers(_column(setlist, "Time", 0.0)).astype(float),
+        mood=_numbers(_column(setlist, "Mood", 0.0)),
+        segue=setlist_segues(keys, tunings),
+    )
+    # The band has to retune before the song (never before the first one)
+    details["retune"] = np.zeros(len(keys), dtype=bool)
+    details["retune"][1:] = tunings[1:] != tunings[:-1]
+    return details
+
+@register_renderer("text", ".txt")
+def render_text(sets, file):
+    for i, (title, setlist) in enumerate(sets):
+        if i:
+            file.write("\n\n")
+        if title:
+            file.write(f"{title}\n\n")
+        file.write("\n".join(setlist_lines(_column(setlist, "Song"), _column(setlist, "Key"), _column(setlist, "Tuning"))))
+    if sets and sets[-1][0]: # An empty show writes nothing
+        file.write("\n")
+
+@register_renderer("markdown", ".md")
+def render_markdown(sets, file):
+    for i, (title, setlist) in enumerate(sets):
+        details = setlist_details(setlist)
+        if i:
+            file.write("\n")
+        file.write(f"# {title or 'Setlist'}\n\n")
+        lines = setlist_lines(details["song"], details["key"], details["tuning"])
+        numbers = np.arange(1, len(lines) + 1).astype(str).astype(object)
+        file.write("".join(numbers + ". " + lines + "\n"))
+        file.write(f"\nTotal time: {details['time'].sum():.1f} minutes\n")
+
+def _json_set(title, setlist):
+    details = setlist_details(setlist)
+    columns = {name: values.tolist() for name, values in details.items()}
+    songs = [dict(position=i + 1, **dict(zip(columns, values))) for i, values in enumerate(zip(*columns.values()))]
+    return dict(title=title, total_time=float(details["time"].sum()), songs=songs)
+
+# One set is written as a single object, a show with more sets as {"sets": [...]}
+@register_renderer("json", ".json")
+def render_json(sets, file):
+    if len(sets) == 1:
+        data = _json_set(*sets[0])
+    else:
+        data = dict(sets=[_json_set(title, setlist) for title, setlist in sets])
+    json.dump(data, file, indent=2, default=str)
+    file.write("\n")
+
+# A show with more than one set gets a Set column first
+@register_renderer("csv", ".csv")
+def render_csv(sets, file):
+    writer = csv.writer(file, lineterminator="\n")
+    show = len(sets) > 1
+    writer.writerow(["Set"] * show + ["Position", "Song", "Artist", "Key", "Tuning", "Time", "Mood", "Segue"])
+    for title, setlist in sets:
+        details = setlist_details(setlist)
+        rows = zip(range(1, len(details["song"]) + 1), details["song"], details["artist"], details["key"], details["tuning"],
+                   details["time"], details["mood"], details["segue"])
+        writer.writerows(((title,) + row for row in rows) if show else rows)
+
+STAGE_STYLE = """body { font-family: sans-serif; font-size: 40pt; font-weight: bold; margin: 0.5in; }
+h1 { font-size: 28pt; }
+h1.next-set { page-break-before: always; }
+ol { padding-left: 1.5em; }
+li { margin-bottom: 0.2em; }
+.tuning { font-size: 24pt; color: #b00; }
+.retune { border-top: 4px dashed #b00; }
+@media print { body { margin: 0.25in; } }
+"""
+
+# Big print for the stage floor: one song per line, segues marked, and a dashed line wherever the band has to retune.
+# Every set of a show starts on a new page
+@register_renderer("stage", ".html")
+def render_stage(sets, file):
+    page_title = " / ".join(title for title, _ in sets if title) or "Setlist"
+    file.write(f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>{html.escape(page_title)}</title>\n")
+    file.write(f"<style>\n{STAGE_STYLE}</style>\n</head>\n<body>\n")
+    for i, (title, setlist) in enumerate(sets):
+        details = setlist_details(setlist)
+        if title:
+            file.write(f"<h1 class=\"next-set\">{html.escape(title)}</h1>\n" if i else f"<h1>{html.escape(title)}</h1>\n")
+        file.write("<ol>\n")
+        for song, tuning, segue, retune in zip(details["song"], details["tuning"], details["segue"], details["retune"]):
+            line = html.escape(str(song)) + (" &rarr;" if segue else "")
+            if tuning != "E Standard":
+                line += f" <span class=\"tuning\">({html.escape(str(tuning))})</span>"
+            file.write(f"<li class=\"retune\">{line}</li>\n" if retune else f"<li>{line}</li>\n")
+        file.write("</ol>\n")
+    file.write("</body>\n</html>\n")
+
+# Writes a show (a list of (title, setlist) pairs, one per set) to an open file in the given format
+def render_show(sets, file, format="text"):
+    if format not in RENDERERS:
+        raise ValueError(f"Unknown format {format!r} (formats: {', '.join(RENDERERS)})")
+    RENDERERS[format][0](sets, file)
+
+# Writes one setlist to an open file in the given format
+def render_setlist(setlist, file, format="text", title=None):
+    render_show([(title, setlist)], file, format)
+
+# Writes a show to output_file. The format defaults to the one for the file extension (text if unknown)
+def write_show(sets, output_file, format=None):
+    with open(output_file, "w", newline="", encoding="utf-8") as file:
+        render_show(sets, file, format or format_for_path(output_file))
+
+# Writes one setlist to output_file, like write_show
+def write_setlist(setlist, output_file, format=None, title=None):
+    write_show([(title, setlist)], output_file, format)
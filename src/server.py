@@ -0,0 +1,250 @@
+# Server - Serves setlist generation over HTTP with JSON, so bandmates can make and tweak setlists from their phones.
+# usage: python main.py serve [--host 127.0.0.1] [--port 8765] [--csv songs.csv ...] [--workers N]
+# Use --host 0.0.0.0 to let other devices on the network in. There is no login, so only do that on a network you trust.
+# Only the song files given with --csv can be opened (by the same path, or the same absolute path), so a client can
+# never make the server read or write any other file.
+# The server is plain asyncio (no extra packages). Song files are loaded once and stay in memory (the catalog memo in
+# catalog.py), and the --csv files are loaded at startup, so no request pays for parsing a csv. Generation runs on a
+# thread pool, so a big run never holds up the other requests.
+# Every user works in a session, which holds a SongLibrary (the includes and excludes) and the candidates of the last
+# run, like one window of the GUI. All requests are POSTs with a JSON body (GET works for the ones without one):
+#   /health                                                      -> {"ok": true, "sessions": n}
+#   /session   {"song_file": "songs.csv"} (one of the --csv files)  -> {"session": id, "songs": n}
+#   /songs     {"session", "offset": 0, "limit": 100}            -> {"total": n, "songs": [{"song", "artist", ..., "included", "excluded"}]}
+#   /include, /exclude, /remove   {"session", "songs": [names or row numbers]}   -> {"changed": n}
+#   /generate  {"session", any generation params (see PARAM_DEFAULTS), "show": "60, 60, encore 15",
+#               "constraints": {"max_tuning_changes": 1, ...} (see set_constraints.py)}
+#                                                                -> {"seed": n, "candidates": [{"text", "score", "transition_time"}]}
+#   /export    {"session", "candidate": 0, "format": "text"}     -> the candidate in that format (see renderers.py)
+#   /modify    {"session"}                                       -> {"changed": n}, saves the excludes as the Active flags
+# Errors come back as {"error": message} with status 400 (bad request), 404 (unknown path or session) or 500.
+
+import asyncio
+import io
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from catalog import load_catalog, save_active_flags
+from generation import generate_candidates
+from song_library import SongLibrary
+from renderers import RENDERERS, render_setlist, render_show
+from show_planner import parse_sets
+from profiling import stage
+from play_history import DEFAULT_RECENCY_WEIGHT, DEFAULT_HALF_LIFE_DAYS
+from set_constraints import check_constraints
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+PARAM_DEFAULTS = dict(og_weight=1.2, mood_weight=0.8, set_time=60, transition_time=None, cluster_size=2, candidates=20, kept_candidates=10,
+                      fill=False, optimize_order=False, recency_weight=DEFAULT_RECENCY_WEIGHT, recency_half_life=DEFAULT_HALF_LIFE_DAYS, seed=None)
+MEDIA_TYPES = dict(text="text/plain", markdown="text/markdown", json="application/json", csv="text/csv", stage="text/html")
+# Requests with a bigger body than this are turned away
+MAX_BODY = 1 << 20
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# One user's songs, includes/excludes and last run. Sessions are only changed on the event loop, so they need no locks
+class Session:
+    def __init__(self, library):
+        self.library = library
+        self.result = None
+
+class SetlistServer:
+    # song_files are the only song files sessions can be opened for
+    def __init__(self, workers=None, song_files=()):
+        self.sessions = {}
+        self.song_files = {}
+        for song_file in song_files:
+            self.song_files[song_file] = song_file
+            self.song_files[os.path.abspath(song_file)] = song_file
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        self.routes = {"/health": self.health, "/session": self.new_session, "/songs": self.songs, "/include": self.include,
+                       "/exclude": self.exclude, "/remove": self.remove, "/generate": self.generate, "/export": self.export,
+                       "/modify": self.modify}
+
+    # Runs a blocking function on the thread pool
+    async def run_blocking(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def session(self, body):
+        session = self.sessions.get(body.get("session"))
+        if session is None:
+            raise HTTPError(404, f"Unknown session {body.get('session')!r}")
+        return session
+
+    # The --csv song file a client asked for. Raises HTTPError 404 for any other file
+    def served_file(self, song_file):
+        if not isinstance(song_file, str):
+            raise HTTPError(400, "song_file must be a string")
+        served = self.song_files.get(song_file) or self.song_files.get(os.path.abspath(song_file))
+        if served is None:
+            raise HTTPError(404, f"Unknown song file {song_file!r} (the server only has the files given with --csv)")
+        return served
+
+    async def health(self, body):
+        return dict(ok=True, sessions=len(self.sessions))
+
+    async def new_session(self, body):
+        if not body.get("song_file"):
+            raise HTTPError(400, "No song_file given")
+        song_file = self.served_file(body["song_file"])
+        library = await self.run_blocking(SongLibrary.from_csv, song_file)
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = Session(library)
+        return dict(session=session_id, songs=len(library))
+
+    async def songs(self, body):
+        library = self.session(body).library
+        offset = int(body.get("offset", 0))
+        rows = range(offset, min(offset + int(body.get("limit", 100)), len(library)))
+        songs = library.songs
+        columns = {column: songs[column] for column in ("Song", "Artist", "Key", "Tuning", "Time", "Mood")}
+        return dict(total=len(library), songs=[dict({column.lower(): _plain(values[row]) for column, values in columns.items()},
+                                                    included=bool(library.included[row]), excluded=bool(library.excluded[row])) for row in rows])
+
+    async def include(self, body):
+        return dict(changed=len(self.session(body).library.include(body.get("songs", []))))
+
+    async def exclude(self, body):
+        return dict(changed=len(self.session(body).library.exclude(body.get("songs", []))))
+
+    async def remove(self, body):
+        return dict(changed=len(self.session(body).library.remove(body.get("songs", []))))
+
+    async def generate(self, body):
+        session = self.session(body)
+        params = dict(PARAM_DEFAULTS, **{key: body[key] for key in PARAM_DEFAULTS if body.get(key) is not None})
+        if params["transition_time"] is None:
+            params["transition_time"] = params["set_time"] * 0.1
+        if body.get("show"):
+            params["show"] = parse_sets(body["show"]) if isinstance(body["show"], str) else body["show"]
+        if body.get("constraints"):
+            params["constraints"] = check_constraints(body["constraints"]) # ConstraintError is a ValueError, so a bad rule is a 400
+        library = session.library.copy() # Later include/exclude requests don't change a run that has started
+        result = await self.run_blocking(generate_candidates, library.song_file, params, library)
+        session.result = result
+        return dict(seed=result["seed"], candidates=[dict(text=text, score=float(score), transition_time=transition_time) for text, score, transition_time
+                                                      in zip(result["candidate_strings"], result["candidate_scores"], result["candidate_transition_times"])])
+
+    async def export(self, body):
+        session = self.session(body)
+        if session.result is None:
+            raise HTTPError(400, "Nothing generated yet")
+        format = body.get("format", "text")
+        if format not in RENDERERS:
+            raise HTTPError(400, f"Unknown format {format!r} (formats: {', '.join(RENDERERS)})")
+        setlists = session.result["candidate_setlists"]
+        candidate = int(body.get("candidate", 0))
+        if not 0 <= candidate < len(setlists):
+            raise HTTPError(400, f"There are only {len(setlists)} candidates")
+        text = io.StringIO()
+        if isinstance(setlists[candidate], list): # A planned show
+            render_show(setlists[candidate], text, format)
+        else:
+            render_setlist(setlists[candidate], text, format)
+        return MEDIA_TYPES[format], text.getvalue()
+
+    async def modify(self, body):
+        library = self.session(body).library
+        active = ~library.excluded # As of now, later requests don't change what gets saved
+
+        def save():
+            changed = save_active_flags(library.song_file, active)
+            load_catalog(library.song_file) # Loads the new catalog here, so the refresh below is instant
+            return changed
+        changed = await self.run_blocking(save)
+        library.refresh()
+        return dict(changed=changed)
+
+    # Answers one request. Returns (status, content type, body text)
+    async def respond(self, method, path, body):
+        route = self.routes.get(path.split("?")[0])
+        if route is None:
+            return 404, "application/json", json.dumps(dict(error=f"Unknown path {path}"))
+        try:
+            data = json.loads(body) if body.strip() else {}
+            if not isinstance(data, dict):
+                raise HTTPError(400, "The body must be a JSON object")
+            with stage("request", path=path):
+                result = await route(data)
+        except HTTPError as e:
+            return e.status, "application/json", json.dumps(dict(error=str(e)))
+        except FileNotFoundError as e:
+            return 404, "application/json", json.dumps(dict(error=f"File not found: {e.filename or e}"))
+        except (ValueError, TypeError, KeyError, IndexError) as e:
+            return 400, "application/json", json.dumps(dict(error=str(e)))
+        except Exception as e:
+            return 500, "application/json", json.dumps(dict(error=str(e)))
+        if isinstance(result, tuple):
+            return (200,) + result
+        return 200, "application/json", json.dumps(result)
+
+    # Reads requests off one connection until the client closes it (keep-alive)
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, version = (lines[0].split(" ") + ["", ""])[:3]
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    status, content_type, text = 400, "application/json", json.dumps(dict(error="Bad Content-Length"))
+                    keep_alive = False # The body can't be told apart from the next request
+                elif length > MAX_BODY:
+                    status, content_type, text = 413, "application/json", json.dumps(dict(error="Body too big"))
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, content_type, text = await self.respond(method, path, body.decode("utf-8"))
+                    keep_alive = headers.get("connection", "").lower() != "close" and version != "HTTP/1.0"
+                payload = text.encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\nContent-Type: {content_type}; charset=utf-8\r\n"
+                             f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+# numpy values as plain JSON values. float32 values (see catalog.py) go through their shortest text, so 3.1 stays 3.1
+def _plain(value):
+    if getattr(value, "dtype", None) == "float32":
+        return float(str(value))
+    return value.item() if hasattr(value, "item") else value
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, song_files=(), workers=None, ready=None):
+    app = SetlistServer(workers, song_files)
+    for song_file in song_files: # Warm up the catalogs before the first request
+        await app.run_blocking(load_catalog, song_file)
+    server = await asyncio.start_server(app.handle_connection, host, port)
+    print(f"Serving on http://{host}:{server.sockets[0].getsockname()[1]}", flush=True)
+    if ready is not None:
+        ready(server)
+    async with server:
+        await server.serve_forever()
+
+def run_serve(args):
+    import warnings
+    warnings.filterwarnings("ignore")
+    try:
+        asyncio.run(serve(args.host, args.port, args.csv, args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
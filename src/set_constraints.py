@@ -0,0 +1,498 @@
+# Set Constraints - Show rules that every generated setlist has to follow, declared in a JSON or TOML file:
+#   max_tuning_changes = 2          # at most this many tuning changes in the set
+#   artist_spacing = 1              # at least this many other songs between two songs by the same artist (1: never back to back)
+#   max_per_artist = 3              # at most this many songs by one artist
+#   opener = "Althea"               # the song that opens the set
+#   closer = "All My Love"          # the song that closes the set
+#   no_misc_segues = true           # never two "Misc" key songs back to back in the same tuning (it would read as a segue)
+# Every rule is optional. The rules are checked while a set is built instead of generating sets until one complies:
+#   Sampling: the pinned opener and closer are placed like included songs, then the pool is walked in weighted random
+#   order (like weighted_order) and a song is skipped as soon as it would break max_per_artist or need more tunings than
+#   max_tuning_changes allows. Skipping a song in a weighted random order is the same as drawing from the songs that
+#   are still allowed. If the set ends up with too many songs of one artist (or Misc songs) to space them out, the
+#   last one is dropped and the walk goes on with that artist capped. Once the counts fit, the order search below is
+#   run on the set, and if the rules get in each other's way the last sampled song of the rule that blocked is dropped
+#   the same way, so every set that comes out can be ordered.
+#   Ordering: the songs are placed one slot at a time, trying them in the order the mood clusters (or Optimize Order)
+#   would play them, and a song is only placed if the rest of the set can still follow the rules from there (a depth
+#   first search with lower bounds on the tuning changes and artist spacing still needed). So the order stays as close
+#   to the usual one as the rules allow. Songs that no rule can tell apart are only tried once per slot, and dead ends
+#   are remembered, so proving that a set can't be ordered takes milliseconds, not every permutation.
+# When no set can follow the rules, ConstraintError (a ValueError) says which rule it was.
+# Usage:
+#   constraints = load_constraints("rules.toml")
+#   positions = sample_constrained_positions(library, 54, 1.2, 0.8, constraints, rng=rng)
+#   order = constrained_order(setlist, constraints)   # setlist in the usual playing order
+
+import json
+from collections import Counter
+import numpy as np
+import profiling
+from setlist_math import catalog_arrays, category_codes, song_weights, place_includes, weighted_order, score_setlist_batch
+from ordering import transition_minutes, path_cost
+
+CONSTRAINT_DEFAULTS = dict(max_tuning_changes=None, artist_spacing=0, max_per_artist=None, opener=None, closer=None, no_misc_segues=False)
+# How each rule is described in errors
+CONSTRAINT_TEXT = dict(max_tuning_changes="at most {} tuning changes", artist_spacing="at least {} songs between songs by the same artist",
+                       max_per_artist="at most {} songs per artist", opener="{!r} opens the set", closer="{!r} closes the set",
+                       no_misc_segues="no Misc songs back to back in the same tuning")
+# Slots tried by the ordering search before it gives up
+ORDER_STEP_LIMIT = 20000
+
+class ConstraintError(ValueError):
+    def __init__(self, constraint, message):
+        super().__init__(message)
+        self.constraint = constraint
+
+def describe(constraints, constraint):
+    return CONSTRAINT_TEXT[constraint].format(constraints.get(constraint))
+
+# Checks a dict of rules and fills in the missing ones. Raises ValueError for unknown rules or bad values
+def check_constraints(constraints):
+    unknown = set(constraints) - set(CONSTRAINT_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown constraints: {', '.join(sorted(unknown))}")
+    constraints = dict(CONSTRAINT_DEFAULTS, **constraints)
+    for name in ("max_tuning_changes", "max_per_artist"):
+        if constraints[name] is not None and (not isinstance(constraints[name], int) or constraints[name] < 0):
+            raise ValueError(f"{name} must be a whole number of at least 0")
+    if not isinstance(constraints["artist_spacing"], int) or constraints["artist_spacing"] < 0:
+        raise ValueError("artist_spacing must be a whole number of at least 0")
+    for name in ("opener", "closer"):
+        if constraints[name] is not None and not isinstance(constraints[name], str):
+            raise ValueError(f"{name} must be a song name")
+    if constraints["opener"] is not None and constraints["opener"] == constraints["closer"]:
+        raise ConstraintError("closer", f"{constraints['opener']!r} can't both open and close the set")
+    constraints["no_misc_segues"] = bool(constraints["no_misc_segues"])
+    return constraints
+
+# Reads the rules from a JSON or TOML file (a table called "constraints" or the whole file)
+def load_constraints(path):
+    if str(path).endswith(".toml"):
+        import tomllib # Python 3.11+
+        with open(path, "rb") as file:
+            data = tomllib.load(file)
+    else:
+        with open(path) as file:
+            data = json.load(file)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} must hold a table of constraints")
+    return check_constraints(data.get("constraints", data))
+
+# The columns the rules look at, as arrays: artist codes, tuning codes and which songs have the Misc key
+def constraint_columns(songs):
+    return category_codes(songs["Artist"]), category_codes(songs["Tuning"]), np.asarray(songs["Key"] == "Misc", dtype=bool)
+
+# Catalog position of the pinned opener and closer (None if not pinned). Raises ConstraintError if one can't be played
+def pinned_positions(library, constraints):
+    pinned = []
+    for slot in ("opener", "closer"):
+        name = constraints[slot]
+        if name is None:
+            pinned.append(None)
+            continue
+        matches = np.flatnonzero(library.names == name)
+        if len(matches) == 0:
+            raise ConstraintError(slot, f"The {slot} {name!r} is not in the song list")
+        if library.excluded[matches[0]]:
+            raise ConstraintError(slot, f"The {slot} {name!r} is excluded (or not Active)")
+        pinned.append(int(matches[0]))
+    return pinned
+
+# The number of songs a group of songs that have to be `spacing` songs apart needs in a set
+def _spread(count, spacing):
+    return (count - 1) * (spacing + 1) + 1 if count else 0
+
+# Like sample_setlist_indices, but songs that would break a rule are skipped (see the header). fixed are the songs
+# that have to be in the set (the pinned songs first, then the includes), pinned the positions of the opener and closer
+# (None if not pinned). With fill=True songs that don't fit are skipped too, instead of ending the set, so the walk goes
+# on until no song fits.
+# Returns the positions and a Counter of how many songs each rule turned away
+def sample_constrained_indices(times, weights, target_time, artists, tunings, is_misc, constraints, fixed=(), pinned=(), pool=None, rng=None, fill=False):
+    if rng is None:
+        rng = np.random.default_rng()
+    if pool is None:
+        pool = np.arange(len(times))
+    profiling.count("sampling.setlists")
+    max_per_artist = constraints["max_per_artist"]
+    max_changes = constraints["max_tuning_changes"]
+    round_trip = len(pinned) == 2 and None not in pinned and tunings[pinned[0]] == tunings[pinned[1]]
+
+    picked, total_time = place_includes(times, target_time, fixed)
+    picked = list(picked)
+    artist_counts = Counter(artists[picked].tolist())
+    tunings_used = set(tunings[picked].tolist())
+    if max_per_artist is not None and artist_counts and max(artist_counts.values()) > max_per_artist:
+        raise ConstraintError("max_per_artist", f"The included songs alone break the rule of {describe(constraints, 'max_per_artist')}")
+    if max_changes is not None and _fewest_changes(len(tunings_used), round_trip) > max_changes:
+        raise ConstraintError("max_tuning_changes", f"The included songs alone break the rule of {describe(constraints, 'max_tuning_changes')}")
+    fixed_count = len(picked)
+    misc_counts = Counter(tunings[picked][is_misc[picked]].tolist())
+    caps = {} # Artist -> fewer songs than max_per_artist, because of the spacing
+    misc_caps = {} # Tuning -> most Misc songs in that tuning, because of no_misc_segues
+    turned_away = Counter()
+
+    def rule_broken(song):
+        artist = artists[song]
+        if artist in caps and artist_counts[artist] >= caps[artist]:
+            return "artist_spacing"
+        if max_per_artist is not None and artist_counts[artist] >= max_per_artist:
+            return "max_per_artist"
+        if max_changes is not None and tunings[song] not in tunings_used and _fewest_changes(len(tunings_used) + 1, round_trip) > max_changes:
+            return "max_tuning_changes"
+        if is_misc[song] and tunings[song] in misc_caps and misc_counts[tunings[song]] >= misc_caps[tunings[song]]:
+            return "no_misc_segues"
+        return None
+
+    order = weighted_order(weights, pool[~np.isin(pool, picked)], rng)
+    i = 0
+    while True:
+        while i < len(order) and total_time < target_time:
+            song = order[i]
+            rule = rule_broken(song)
+            if rule is not None:
+                turned_away[rule] += 1
+            elif total_time + times[song] <= target_time:
+                picked.append(song)
+                total_time += times[song]
+                artist_counts[artists[song]] += 1
+                tunings_used.add(tunings[song])
+                misc_counts[tunings[song]] += is_misc[song]
+            elif not fill:
+                break # The first song that doesn't fit ends the set, like sample_setlist_indices
+            i += 1
+        # Spacing can only be checked once the length of the set is known: drop the last song of a group that can't be
+        # spread out, cap the group and go on
+        dropped, rule = _unspaceable_song(picked, fixed_count, pinned, artists, tunings, is_misc, constraints)
+        if dropped is None:
+            # The counts all fit, but the rules can still get in each other's way: look for an order, and if there is
+            # none drop the last sampled song of the rule that got in the way
+            rows = np.array(picked, dtype=np.intp)
+            playing_order, rule = _rule_order(artists[rows], tunings[rows], is_misc[rows], _pinned_index(picked, pinned, 0),
+                                              _pinned_index(picked, pinned, 1), constraints)
+            if playing_order is not None:
+                break
+            dropped = _blocking_song(picked, fixed_count, artists, tunings, is_misc, rule)
+            if dropped is None:
+                break # Only pinned and included songs are left to drop, constrained_order reports the rule
+        song = picked.pop(dropped)
+        total_time -= times[song]
+        artist_counts[artists[song]] -= 1
+        misc_counts[tunings[song]] -= is_misc[song]
+        if rule == "artist_spacing":
+            caps[artists[song]] = artist_counts[artists[song]]
+        elif rule == "no_misc_segues":
+            misc_caps[tunings[song]] = misc_counts[tunings[song]]
+        turned_away[rule] += 1
+        if not any(tunings[other] == tunings[song] for other in picked):
+            tunings_used.discard(tunings[song])
+    return np.array(picked, dtype=np.intp), turned_away
+
+# The index (into picked) of the last sampled song of a group that has too many songs to be spaced out in a set of this
+# length, and the rule of that group, or (None, None) if every group fits. Songs before fixed_count (pinned and
+# included) are never dropped
+def _unspaceable_song(picked, fixed_count, pinned, artists, tunings, is_misc, constraints):
+    length = len(picked)
+    groups = []
+    if constraints["artist_spacing"]:
+        groups += [(artists == artist, "artist_spacing") for artist, count in Counter(artists[picked].tolist()).items()
+                   if _spread(count, constraints["artist_spacing"]) > length]
+    if constraints["no_misc_segues"]:
+        misc_counts = Counter(tunings[picked][is_misc[picked]].tolist())
+        groups += [(is_misc & (tunings == tuning), "no_misc_segues") for tuning, count in misc_counts.items() if _spread(count, 1) > length]
+        if constraints["max_tuning_changes"] is not None and not groups:
+            # Misc songs in one tuning are kept apart by the other songs in that tuning, and one more for every extra
+            # block of that tuning, which costs a tuning change. A pinned opener or closer that isn't Misc takes up the
+            # end of a block, where a Misc song could have gone
+            song_counts = Counter(tunings[picked].tolist())
+            ends = Counter(tunings[song] for song in pinned if song is not None and not is_misc[song])
+            extra = {tuning: count - (song_counts[tuning] - count) - 1 + ends[tuning] for tuning, count in misc_counts.items()}
+            if sum(max(blocks, 0) for blocks in extra.values()) > constraints["max_tuning_changes"] - (len(song_counts) - 1):
+                worst = max(extra, key=extra.get)
+                groups.append((is_misc & (tunings == worst), "no_misc_segues"))
+    for members, rule in groups:
+        for index in range(length - 1, fixed_count - 1, -1):
+            if members[picked[index]]:
+                return index, rule
+    return None, None
+
+# Fewest tuning changes a set with this many tunings needs. If the pinned opener and closer are in the same tuning, the
+# set has to come back to it at the end, which costs one more
+def _fewest_changes(tuning_count, round_trip):
+    if tuning_count <= 1:
+        return 0
+    return tuning_count - 1 + round_trip
+
+# Index (into picked) of the pinned opener (end 0) or closer (end 1), or None
+def _pinned_index(picked, pinned, end):
+    if end >= len(pinned) or pinned[end] is None:
+        return None
+    return picked.index(pinned[end]) if pinned[end] in picked else None
+
+# The index (into picked) of the last sampled song that the rule is about: one of an artist with several songs for
+# artist_spacing, a Misc song for no_misc_segues and one of the rarest tuning for max_tuning_changes. Falls back to the
+# last sampled song, and is None if there is none
+def _blocking_song(picked, fixed_count, artists, tunings, is_misc, rule):
+    if len(picked) == fixed_count:
+        return None
+    rows = np.array(picked, dtype=np.intp)
+    if rule == "artist_spacing":
+        members = np.bincount(artists[rows])[artists[rows]] > 1
+    elif rule == "no_misc_segues":
+        members = is_misc[rows]
+    else:
+        counts = np.bincount(tunings[rows])[tunings[rows]]
+        members = counts == counts.min()
+    sampled = np.flatnonzero(members[fixed_count:])
+    return fixed_count + int(sampled[-1]) if len(sampled) else len(picked) - 1
+
+# sample_constrained_indices for a SongLibrary, with its included songs and the pinned songs. Returns catalog positions.
+# Raises ConstraintError if not even one song can be picked
+def sample_constrained_positions(library, target_time, og_weight, mood_weight, constraints, rng=None, fill=False, recency=None):
+    times, moods, is_og = catalog_arrays(library.songs)
+    weights = song_weights(moods, is_og, og_weight, mood_weight, recency)
+    artists, tunings, is_misc = constraint_columns(library.songs)
+    return _sample_library(library, times, weights, target_time, artists, tunings, is_misc, constraints, rng, fill)
+
+def _sample_library(library, times, weights, target_time, artists, tunings, is_misc, constraints, rng, fill):
+    pinned = pinned_positions(library, constraints)
+    fixed = [position for position in pinned if position is not None]
+    fixed = np.array(fixed + [position for position in library.included_positions().tolist() if position not in fixed], dtype=np.intp)
+    with profiling.stage("exclude_filter"):
+        pool = library.active_pool()
+    positions, turned_away = sample_constrained_indices(times, weights, target_time, artists, tunings, is_misc, constraints, fixed=fixed,
+                                                        pinned=pinned, pool=pool, rng=rng, fill=fill)
+    for slot, position in zip(("opener", "closer"), pinned):
+        if position is not None and position not in positions:
+            raise ConstraintError(slot, f"The {slot} {constraints[slot]!r} doesn't fit in the set time")
+    if len(positions) == 0 and turned_away:
+        rule = turned_away.most_common(1)[0][0]
+        raise ConstraintError(rule, f"No song can be picked with the rule of {describe(constraints, rule)}")
+    return positions
+
+# make_library_candidates with the rules: samples n_candidates sets, scores them all and returns the top_k (score,
+# setlist) pairs, best first
+def make_constrained_candidates(library, target_time, og_weight, mood_weight, n_candidates, top_k, constraints, rng=None, fill=False, recency=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    times, moods, is_og = catalog_arrays(library.songs)
+    weights = song_weights(moods, is_og, og_weight, mood_weight, recency)
+    artists, tunings, is_misc = constraint_columns(library.songs)
+    sets = [_sample_library(library, times, weights, target_time, artists, tunings, is_misc, constraints, rng, fill) for _ in range(n_candidates)]
+    candidates = np.full((len(sets), max((len(positions) for positions in sets), default=0)), -1, dtype=np.intp)
+    for i, positions in enumerate(sets):
+        candidates[i, :len(positions)] = positions
+    scores = score_setlist_batch(candidates, times, moods, tunings, target_time)
+    best = np.argsort(-scores, kind='stable')[:top_k]
+    profiling.count("make_setlist.dataframes", len(best))
+    return [(scores[i], library.songs.iloc[sets[i]].reset_index(drop=True)) for i in best]
+
+# Row of the pinned song in a setlist (None if not pinned or not in it)
+def _pinned_row(setlist, constraints, slot):
+    if constraints[slot] is None:
+        return None
+    rows = np.flatnonzero(np.asarray(setlist["Song"]) == constraints[slot])
+    if len(rows) == 0:
+        raise ConstraintError(slot, f"The {slot} '{constraints[slot]}' is not in the setlist")
+    return int(rows[0])
+
+# Names of the pinned opener and closer, for the songs an ordering must never drop
+def pinned_songs(constraints):
+    return [constraints[slot] for slot in ("opener", "closer") if constraints and constraints[slot] is not None]
+
+# A playing order of a setlist (rows, in the order it should be played) that follows the rules, as close to the
+# current order of the setlist as possible (see the header). Raises ConstraintError naming the rule that got in the
+# way most if there is none
+def constrained_order(setlist, constraints):
+    artists, tunings, is_misc = constraint_columns(setlist)
+    order, rule = _rule_order(artists, tunings, is_misc, _pinned_row(setlist, constraints, "opener"), _pinned_row(setlist, constraints, "closer"), constraints)
+    if order is None:
+        gave_up = " (gave up searching)" if rule is None else ""
+        rule = rule or "max_tuning_changes"
+        raise ConstraintError(rule, f"No order of the {len(artists)} songs follows the rule of {describe(constraints, rule)}{gave_up}")
+    return order
+
+# The search behind constrained_order, on the columns as codes (see constraint_columns) with the rows of the pinned
+# songs. Returns (order, None), or (None, the rule that got in the way most) if there is no order (None as the rule if
+# the search gave up after ORDER_STEP_LIMIT steps)
+def _rule_order(artists, tunings, is_misc, opener, closer, constraints):
+    size = len(artists)
+    if size == 0:
+        return np.array([], dtype=np.intp), None
+    rule = _block_conflict(artists, tunings, is_misc, opener, closer, constraints)
+    if rule is not None:
+        return None, rule
+    spacing = constraints["artist_spacing"]
+    max_changes = constraints["max_tuning_changes"]
+    no_misc_segues = constraints["no_misc_segues"]
+    order = []
+    used = np.zeros(size, dtype=bool)
+    last_slot = {} # Artist -> slot of its last song so far
+    artists_left = Counter(artists.tolist())
+    repeated = [artist for artist, count in artists_left.items() if count > 1] # The only artists the spacing can get stuck on
+    tunings_left = Counter(tunings.tolist())
+    blocked = Counter()
+    steps = [0]
+    # Songs no rule can tell apart (same tuning and Misc or not, by artists with one song in the set) are one kind, and
+    # only the first song of a kind that is left is tried in a slot
+    kinds = [(tunings[song], is_misc[song], artists[song] if artists_left[artists[song]] > 1 else -1, song if song in (opener, closer) else -1)
+             for song in range(size)]
+    kind_codes = {kind: code for code, kind in enumerate(dict.fromkeys(kinds))}
+    kind = [kind_codes[kinds[song]] for song in range(size)]
+    kinds_left = [0] * len(kind_codes)
+    for code in kind:
+        kinds_left[code] += 1
+    dead_ends = set() # (kinds left, the last songs' repeated artists, last tuning and Misc, changes) that lead nowhere
+
+    def rule_broken(song, slot, changes):
+        previous = order[-1] if order else None
+        artist = artists[song]
+        if spacing and artist in last_slot and slot - last_slot[artist] <= spacing:
+            return "artist_spacing"
+        if no_misc_segues and previous is not None and is_misc[song] and is_misc[previous] and tunings[song] == tunings[previous]:
+            return "no_misc_segues"
+        if closer is not None and slot == size - 2: # The song before the pinned closer
+            if spacing and artists[closer] == artist:
+                return "artist_spacing"
+            if no_misc_segues and is_misc[song] and is_misc[closer] and tunings[song] == tunings[closer]:
+                return "no_misc_segues"
+        if max_changes is not None:
+            # Every other tuning still to be played needs at least one more change, and one more to get back to the
+            # closer's tuning if that is this one
+            other_tunings = sum(1 for tuning, count in tunings_left.items() if count and tuning != tunings[song])
+            if other_tunings and closer is not None and not used[closer] and song != closer and tunings[closer] == tunings[song]:
+                other_tunings += 1
+            if changes + other_tunings > max_changes:
+                return "max_tuning_changes"
+        if spacing:
+            slots_left = size - slot - 1
+            for other in repeated:
+                count = artists_left[other] - (other == artist)
+                if count and (count * (spacing + 1) if other == artist else _spread(count, spacing)) > slots_left:
+                    return "artist_spacing"
+        return None
+
+    def place(slot, changes):
+        if slot == size:
+            return True
+        # What is left to place only depends on the kinds left, the last few songs and the changes so far
+        last = order[-1] if order else None
+        state = (tuple(kinds_left), tuple(kinds[song][2] for song in order[-spacing:]) if spacing else (),
+                 None if last is None else (tunings[last], is_misc[last]), changes)
+        if state in dead_ends:
+            return False
+        steps[0] += 1
+        if steps[0] > ORDER_STEP_LIMIT:
+            return False
+        if slot == 0 and opener is not None:
+            choices = [opener]
+        elif slot == size - 1 and closer is not None:
+            choices = [closer]
+        else:
+            choices = [song for song in range(size) if song not in (opener, closer)]
+        tried = set()
+        for song in choices:
+            if used[song] or kind[song] in tried:
+                continue
+            tried.add(kind[song])
+            new_changes = changes + (bool(order) and tunings[song] != tunings[order[-1]])
+            rule = rule_broken(song, slot, new_changes)
+            if rule is not None:
+                blocked[rule] += 1
+                continue
+            previous_slot = last_slot.get(artists[song])
+            order.append(song)
+            used[song] = True
+            last_slot[artists[song]] = slot
+            artists_left[artists[song]] -= 1
+            tunings_left[tunings[song]] -= 1
+            kinds_left[kind[song]] -= 1
+            if place(slot + 1, new_changes):
+                return True
+            kinds_left[kind[song]] += 1
+            order.pop()
+            used[song] = False
+            if previous_slot is None:
+                del last_slot[artists[song]]
+            else:
+                last_slot[artists[song]] = previous_slot
+            artists_left[artists[song]] += 1
+            tunings_left[tunings[song]] += 1
+        if steps[0] <= ORDER_STEP_LIMIT:
+            dead_ends.add(state)
+        return False
+
+    with profiling.stage("constrained_order", songs=size):
+        found = place(0, 0)
+    profiling.count("constraints.order_steps", steps[0])
+    if not found:
+        if steps[0] > ORDER_STEP_LIMIT:
+            return None, None
+        return None, blocked.most_common(1)[0][0] if blocked else "max_tuning_changes"
+    return np.array(order, dtype=np.intp), None
+
+# With no tuning changes to spare, every tuning is played as one block, so the songs by one artist in a tuning have to
+# be spaced out within that block, and so do its Misc songs (a pinned opener or closer that isn't Misc takes up an end
+# of its block). The search would only find that out by trying every order, so it is checked first. Returns the rule
+# that can't be kept, or None
+def _block_conflict(artists, tunings, is_misc, opener, closer, constraints):
+    block_sizes = Counter(tunings.tolist())
+    if constraints["max_tuning_changes"] is None:
+        return None
+    round_trip = opener is not None and closer is not None and tunings[opener] == tunings[closer]
+    fewest = _fewest_changes(len(block_sizes), round_trip)
+    if constraints["max_tuning_changes"] < fewest:
+        return "max_tuning_changes"
+    if constraints["max_tuning_changes"] > fewest or (round_trip and len(block_sizes) > 1): # Some tuning is played twice
+        return None
+    if constraints["artist_spacing"]:
+        for (artist, tuning), count in Counter(zip(artists.tolist(), tunings.tolist())).items():
+            if count > 1 and _spread(count, constraints["artist_spacing"]) > block_sizes[tuning]:
+                return "artist_spacing"
+    if constraints["no_misc_segues"]:
+        ends = Counter(tunings[row] for row in (opener, closer) if row is not None and not is_misc[row])
+        for tuning, count in Counter(tunings[is_misc].tolist()).items():
+            if count > block_sizes[tuning] - count + 1 - ends[tuning]:
+                return "no_misc_segues"
+    return None
+
+# The first rule a setlist breaks in its current order, or None if it follows them all
+def broken_rule(setlist, constraints):
+    artists, tunings, is_misc = constraint_columns(setlist)
+    songs = np.asarray(setlist["Song"])
+    if constraints["opener"] is not None and (len(songs) == 0 or songs[0] != constraints["opener"]):
+        return "opener"
+    if constraints["closer"] is not None and (len(songs) == 0 or songs[-1] != constraints["closer"]):
+        return "closer"
+    if constraints["max_tuning_changes"] is not None and np.count_nonzero(tunings[1:] != tunings[:-1]) > constraints["max_tuning_changes"]:
+        return "max_tuning_changes"
+    if constraints["max_per_artist"] is not None and len(artists) and np.bincount(artists).max() > constraints["max_per_artist"]:
+        return "max_per_artist"
+    for gap in range(1, constraints["artist_spacing"] + 1):
+        if np.any(artists[gap:] == artists[:-gap]):
+            return "artist_spacing"
+    if constraints["no_misc_segues"] and np.any(is_misc[1:] & is_misc[:-1] & (tunings[1:] == tunings[:-1])):
+        return "no_misc_segues"
+    return None
+
+# fit_order_to_set_time for a setlist in an order that follows the rules: drops the weakest songs (never the pinned
+# ones or the songs in keep) until the songs plus the transitions fit in set_time, skipping songs whose removal would
+# break a rule. Returns the rows that are left, in order, and their transition time in minutes
+def fit_constrained_order(setlist, constraints, set_time, keep=()):
+    times, moods, _ = catalog_arrays(setlist)
+    moods = np.nan_to_num(moods, nan=5.0)
+    songs = np.asarray(setlist["Song"])
+    minutes = transition_minutes(setlist["Key"], setlist["Tuning"])
+    rows = np.arange(len(songs))
+    droppable = ~np.isin(songs, [constraints["opener"], constraints["closer"]] + list(keep))
+    transition_time = path_cost(minutes, rows)
+    while len(rows) and times[rows].sum() + transition_time > set_time:
+        for row in sorted(rows[droppable[rows]], key=lambda row: moods[row]):
+            rest = rows[rows != row]
+            if broken_rule({column: np.asarray(setlist[column])[rest] for column in ("Song", "Artist", "Key", "Tuning")}, constraints) is None:
+                rows = rest
+                break
+        else:
+            break # Nothing can go without breaking a rule
+        transition_time = path_cost(minutes, rows)
+    return rows, transition_time
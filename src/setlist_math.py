@@ -1,166 +1,368 @@
 # Setlist Math - This file contains the functions that perform the calculations for the setlist generator.
 # Ryan Peruski, 07/28/2023
 
-import pandas as pd
-import random
 import warnings
 import numpy as np
-import tkinter as tk
-from tkinter import filedialog
+import profiling
 
-def make_setlist(df, target_time, og_weight, mood_weight, includes):
-    # Filter songs by "OG" artist
-    includes = df[df['Song'].isin(includes)].index.tolist()
-    og_songs = df[df['Artist'] == 'OG']
-    og_count = len(og_songs)
+# Pulls the columns the sampler needs out of the catalog as plain numpy arrays (Time, Mood, OG flag).
+# The catalog can be a dataframe or a dict of numpy columns (see catalog.load_catalog_columns)
+def catalog_arrays(df):
+    times = np.asarray(df['Time'], dtype=float)
+    moods = np.asarray(df['Mood'], dtype=float)
+    is_og = np.asarray(df['Artist'] == 'OG', dtype=bool)
+    return times, moods, is_og
 
-    # Initialize variables
-    sampled_songs = pd.DataFrame(columns=df.columns)
-    total_time = 0.0
+# Integer codes of a text column (equal values get equal codes). Categorical columns (see catalog.py) already have
+# them, other columns are coded by sorting their values as text
+def category_codes(values):
+    if hasattr(values, 'cat'):
+        codes = values.cat.codes.to_numpy().astype(np.intp)
+        codes[codes < 0] = len(values.cat.categories) # Missing values share one code of their own
+        return codes
+    return np.unique(np.asarray(values).astype(str), return_inverse=True)[1]
+
+# Sampling weight of every song: Mood ** mood_weight, except OG songs, which all get the flat OG weight.
+# recency (optional) is a multiplier per song for how recently it was played (see play_history.recency_multipliers)
+def song_weights(moods, is_og, og_weight, mood_weight, recency=None):
+    weights = np.power(moods, mood_weight)
+    weights[is_og] = og_weight
+    if recency is not None:
+        weights *= recency
+    return weights
+
+# Draws a full weighted ordering of the pool in one vectorized pass using weighted random keys.
+# Sorting by Exp(1) / weight is the same distribution as drawing songs one at a time without replacement,
+# so this replaces the old sample-one-song-per-iteration loop. Songs with a zero (or invalid) weight are never drawn.
+def weighted_order(weights, pool, rng):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keys = rng.exponential(size=len(pool)) / weights[pool]
+    order = np.argsort(keys, kind='stable')
+    order = order[np.isfinite(keys[order]) & (keys[order] >= 0)]
+    return pool[order]
+
+# Number of songs at the front of the ordering that fit in the budget. Sampling stops at the first song that would
+# overflow, or once the budget is exactly used up, like the old loop did
+def fitting_prefix_length(times, order, budget):
+    cumulative = np.cumsum(times[order])
+    overflow = np.searchsorted(cumulative, budget, side='right')
+    filled = np.searchsorted(cumulative, budget, side='left') + 1
+    return int(min(overflow, filled))
+
+# Places the included songs first, in order, skipping ones that were already placed or do not fit in target_time.
+# Returns the placed positions and the time they use
+def place_includes(times, target_time, includes):
+    sampled = []
     sampled_indices = set()
+    total_time = 0.0
     for i in includes:
-        # Check if the song is in the dataframe
-        if i not in df['Song']:
-            warnings.warn('Song with index {} not found in dataframe'.format(i))
-            continue
         # Check if the song has already been sampled
         if i in sampled_indices:
             warnings.warn('Song with index {} already sampled'.format(i))
             continue
         # Check if the song exceeds the remaining time needed
-        if total_time + df.loc[i, 'Time'] > target_time:
+        if total_time + times[i] > target_time:
             warnings.warn('Song with index {} exceeds remaining time'.format(i))
             continue
-        # Append the song and update the total time and sampled indices
-        sampled_songs = pd.concat([sampled_songs, df.loc[[i]]])
-        total_time += df.loc[i, 'Time']
+        sampled.append(i)
+        total_time += times[i]
         sampled_indices.add(i)
+    return np.asarray(sampled, dtype=np.intp), total_time
+
+# Song times are in half-minute steps, so the fill mode works in those units
+FILL_TIME_STEP = 0.5
 
-    # Perform sequential sampling until the target time is reached
-    while total_time < target_time:
-        # Calculate the probabilities
-        if og_count != 0:
-            og_prob = og_count / (og_count + len(sampled_songs))
-        else:
-            og_prob = 0
-        other_prob = 1 - og_prob
+# "Fill" mode: picks songs from the pool that fill as much of the budget as possible, as a 0/1 knapsack over song times
+# in FILL_TIME_STEP units (times are rounded up, so the picked songs never go over the budget).
+# The Mood/OG weights are kept as randomized preferences: every song gets a weighted random key u ** (1 / weight), and
+# among the fills within `tolerance` minutes of the best possible fill, the one with the highest total key wins.
+# Only the songs with the best keys of each length can be part of an optimal fill (at most budget / length of them),
+# so the dynamic program runs over about C * log(C) songs for a budget of C units, no matter how big the pool is
+def fill_remaining_time(times, weights, budget, pool, rng, tolerance=0.0):
+    capacity = int(np.floor(budget / FILL_TIME_STEP + 1e-9))
+    if capacity <= 0 or len(pool) == 0:
+        return np.array([], dtype=np.intp)
+    units = np.ceil(times[pool] / FILL_TIME_STEP - 1e-9).astype(np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        preferences = np.exp(np.log(rng.random(len(pool))) / weights[pool])
+    usable = (units >= 1) & (units <= capacity) & (preferences > 0)
+    pool, units, preferences = pool[usable], units[usable], preferences[usable]
+    if len(pool) == 0:
+        return np.array([], dtype=np.intp)
 
-        # Calculate the weights based on the "Mood" values and OG weight
-        df['Weight'] = df['Mood'] ** mood_weight
-        og_songs['Weight'] = og_weight
+    # Keep the capacity // length best songs of each length
+    by_length = np.lexsort((-preferences, units))
+    units, preferences, pool = units[by_length], preferences[by_length], pool[by_length]
+    group_starts = np.searchsorted(units, units, side='left')
+    keep = (np.arange(len(units)) - group_starts) < capacity // units
+    units, preferences, pool = units[keep], preferences[keep], pool[keep]
 
-        # Merge OG songs with the rest of the songs
-        merged_songs = pd.concat([og_songs, df[df['Artist'] != 'OG']])
+    profiling.count("fill.dp_rows", len(pool))
+    # best[c] is the highest total key of a selection using exactly c units
+    best = np.full(capacity + 1, -np.inf)
+    best[0] = 0.0
+    taken = np.zeros((len(pool), capacity + 1), dtype=bool)
+    for i in range(len(pool)):
+        size = units[i]
+        with_song = best[:-size] + preferences[i]
+        improves = with_song > best[size:]
+        taken[i, size:] = improves
+        best[size:] = np.where(improves, with_song, best[size:])
 
-        # Filter out already sampled songs
-        remaining_songs = merged_songs[~merged_songs.index.isin(sampled_indices)]
+    reachable = np.flatnonzero(np.isfinite(best))
+    lowest_allowed = reachable[-1] - int(np.floor(tolerance / FILL_TIME_STEP + 1e-9))
+    allowed = reachable[reachable >= lowest_allowed]
+    c = allowed[np.argmax(best[allowed])]
 
-        # Check if there are remaining songs to sample
-        if len(remaining_songs) == 0:
+    chosen = []
+    for i in range(len(pool) - 1, -1, -1):
+        if c == 0:
             break
+        if taken[i, c]:
+            chosen.append(pool[i])
+            c -= units[i]
+    return np.asarray(chosen[::-1], dtype=np.intp)
 
-        # Calculate the weights based on the "Mood" values and OG weight of the remaining songs
-        weights = remaining_songs['Weight'] / remaining_songs['Weight'].sum()
+# Core of make_setlist on positional indices. Includes are placed first (skipping ones that do not fit), then the rest
+# of the pool is drawn in one weighted ordering and cut where it stops fitting in target_time.
+# With fill=True, the time left over after the cut is filled with fill_remaining_time instead of being left unused
+def sample_setlist_indices(times, weights, target_time, includes=(), pool=None, rng=None, fill=False, tolerance=0.0):
+    if rng is None:
+        rng = np.random.default_rng()
+    if pool is None:
+        pool = np.arange(len(times))
+    profiling.count("sampling.setlists")
+    profiling.count("sampling.songs_considered", len(pool))
 
-        # Randomly sample a song based on the updated weights
-        song = remaining_songs.sample(n=1, weights=weights)
+    sampled, total_time = place_includes(times, target_time, includes)
+    if total_time >= target_time:
+        return sampled
+    # Filter out already sampled songs
+    if len(sampled):
+        pool = pool[~np.isin(pool, sampled)]
+    order = weighted_order(weights, pool, rng)
+    length = fitting_prefix_length(times, order, target_time - total_time)
+    if fill:
+        remaining_time = target_time - total_time - times[order[:length]].sum()
+        filler = fill_remaining_time(times, weights, remaining_time, order[length:], rng, tolerance=tolerance)
+        return np.concatenate([sampled, order[:length], filler])
+    return np.concatenate([sampled, order[:length]])
 
-        # Check if the song exceeds the remaining time needed
-        if total_time + song['Time'].values[0] > target_time:
-            break
+# Batched version of sample_setlist_indices: draws n_candidates setlists at once from the same catalog.
+# Returns an (n_candidates, max_length) matrix of positional indices, padded with -1 after the end of each setlist.
+# With fill=True, each candidate's leftover time is filled with fill_remaining_time
+def sample_setlist_batch(times, weights, target_time, n_candidates, includes=(), pool=None, rng=None, fill=False, tolerance=0.0):
+    if rng is None:
+        rng = np.random.default_rng()
+    if pool is None:
+        pool = np.arange(len(times))
+    profiling.count("sampling.setlists", n_candidates)
+    profiling.count("sampling.songs_considered", n_candidates * len(pool))
+
+    sampled, total_time = place_includes(times, target_time, includes)
+    prefix = np.broadcast_to(sampled, (n_candidates, len(sampled)))
+    budget = target_time - total_time
+    if len(sampled):
+        pool = pool[~np.isin(pool, sampled)]
+    if budget <= 0 or len(pool) == 0:
+        return np.array(prefix)
+
+    # No setlist can hold more songs than the shortest songs of the pool back to back, so only that many keys
+    # per candidate need to be ordered
+    shortest = np.cumsum(np.sort(times[pool]))
+    max_length = min(int(np.searchsorted(shortest, budget, side='right')) + 1, len(pool))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keys = rng.exponential(size=(n_candidates, len(pool))) / weights[pool]
+    keys[~(keys >= 0)] = np.inf
+    if max_length < len(pool):
+        columns = np.argpartition(keys, max_length - 1, axis=1)[:, :max_length]
+    else:
+        columns = np.broadcast_to(np.arange(len(pool)), keys.shape)
+    columns = np.take_along_axis(columns, np.argsort(np.take_along_axis(keys, columns, axis=1), axis=1, kind='stable'), axis=1)
+    drawable = np.isfinite(np.take_along_axis(keys, columns, axis=1))
+    order = pool[columns]
+
+    # Cut every candidate at its first overflowing song, like fitting_prefix_length does for a single setlist
+    cumulative = np.cumsum(np.where(drawable, times[order], np.inf), axis=1)
+    lengths = np.minimum((cumulative <= budget).sum(axis=1), (cumulative < budget).sum(axis=1) + 1)
+    order = np.where(np.arange(max_length) < lengths[:, None], order, -1)
+    if fill:
+        order = _fill_batch(times, weights, budget, pool, order, rng, tolerance)
+    return np.concatenate([prefix, order], axis=1)
+
+# Applies fill_remaining_time to every row of a candidate matrix and pads the rows back to a common length
+def _fill_batch(times, weights, budget, pool, order, rng, tolerance):
+    rows = []
+    for row in order:
+        row = row[row >= 0]
+        rest = pool[~np.isin(pool, row)]
+        rows.append(np.concatenate([row, fill_remaining_time(times, weights, budget - times[row].sum(), rest, rng, tolerance=tolerance)]))
+    filled = np.full((len(rows), max((len(row) for row in rows), default=0)), -1, dtype=np.intp)
+    for i, row in enumerate(rows):
+        filled[i, :len(row)] = row
+    return filled
 
-        # Append the sampled song and update the total time and sampled indices
-        sampled_songs = pd.concat([sampled_songs, song])
-        total_time += song['Time'].values[0]
-        sampled_indices.add(song.index[0])
+# Relative importance of each part of a candidate's score. See score_setlist_batch
+CANDIDATE_SCORE_WEIGHTS = dict(fill=1.0, tuning_changes=0.5, mood_arc=0.25, opener=0.25, closer=0.25)
 
-    return sampled_songs.reset_index(drop=True)
+# Scores every row of a candidate matrix from sample_setlist_batch at once. Higher is better.
+# The heuristics follow sort_sample_into_clusters, which orders a set by descending mood with the strongest song
+# first and another high mood song last:
+#   fill: fraction of target_time the setlist uses
+#   tuning_changes: tuning changes per song when the set is played in descending mood order (penalty)
+#   mood_arc: average mood of the set, out of 10
+#   opener / closer: mood of the strongest and second strongest songs, out of 10
+def score_setlist_batch(candidates, times, moods, tunings, target_time):
+    valid = candidates >= 0
+    safe = np.where(valid, candidates, 0)
+    lengths = valid.sum(axis=1)
 
-def sort_sample_into_clusters(sample, cluster_size):
-    # Convert 'Mood' column to numeric dtype
-    sample['Mood'] = pd.to_numeric(sample['Mood'], errors='coerce')
+    fill = np.where(valid, times[safe], 0).sum(axis=1) / target_time
 
-    # Sort the sample by descending "Mood" values
-    sorted_sample = sample.sort_values('Mood', ascending=False)
+    candidate_moods = np.where(valid, moods[safe], -np.inf)
+    by_mood = np.argsort(-candidate_moods, axis=1, kind='stable')
+    sorted_moods = np.take_along_axis(candidate_moods, by_mood, axis=1)
+    sorted_tunings = np.take_along_axis(np.where(valid, tunings[safe], -1), by_mood, axis=1)
+    sorted_valid = np.take_along_axis(valid, by_mood, axis=1)
+    changes = ((sorted_tunings[:, 1:] != sorted_tunings[:, :-1]) & sorted_valid[:, 1:]).sum(axis=1)
+    change_rate = changes / np.maximum(lengths - 1, 1)
+
+    mood_arc = np.where(valid, moods[safe], 0).sum(axis=1) / np.maximum(lengths, 1) / 10
+    opener = np.where(lengths > 0, sorted_moods[:, 0], 0) / 10
+    closer = np.where(lengths > 1, sorted_moods[:, min(1, sorted_moods.shape[1] - 1)], 0) / 10
+
+    weights = CANDIDATE_SCORE_WEIGHTS
+    return (weights['fill'] * fill - weights['tuning_changes'] * change_rate + weights['mood_arc'] * mood_arc
+            + weights['opener'] * opener + weights['closer'] * closer)
+
+def make_setlist(df, target_time, og_weight, mood_weight, includes, rng=None, fill=False, tolerance=0.0):
+    times, moods, is_og = catalog_arrays(df)
+    weights = song_weights(moods, is_og, og_weight, mood_weight)
+    # Includes are given by song name and placed in the order they appear in the dataframe
+    include_positions = np.flatnonzero(df['Song'].isin(includes).to_numpy())
+    positions = sample_setlist_indices(times, weights, target_time, includes=include_positions, rng=rng, fill=fill, tolerance=tolerance)
+    profiling.count("make_setlist.calls")
+    profiling.count("make_setlist.dataframes")
+    return df.iloc[positions].reset_index(drop=True)
+
+# Samples a setlist from a SongLibrary's active pool (one mask instead of filtering out each exclude), with its
+# included songs first. Returns the catalog positions of the songs
+def sample_library_positions(library, target_time, og_weight, mood_weight, rng=None, fill=False, tolerance=0.0, recency=None):
+    times, moods, is_og = catalog_arrays(library.songs)
+    weights = song_weights(moods, is_og, og_weight, mood_weight, recency)
+    with profiling.stage("exclude_filter"):
+        includes, pool = library.included_positions(), library.active_pool()
+    return sample_setlist_indices(times, weights, target_time, includes=includes, pool=pool, rng=rng, fill=fill, tolerance=tolerance)
+
+# make_setlist for a SongLibrary
+def make_library_setlist(library, target_time, og_weight, mood_weight, rng=None, fill=False, tolerance=0.0, recency=None):
+    positions = sample_library_positions(library, target_time, og_weight, mood_weight, rng=rng, fill=fill, tolerance=tolerance, recency=recency)
+    return library.songs.iloc[positions].reset_index(drop=True)
+
+# Samples, scores and ranks candidates over the songs in pool. Returns the top_k (score, setlist) pairs, best first
+def _ranked_candidates(df, target_time, og_weight, mood_weight, include_positions, pool, n_candidates, top_k, rng, fill, tolerance, recency=None):
+    times, moods, is_og = catalog_arrays(df)
+    weights = song_weights(moods, is_og, og_weight, mood_weight, recency)
+    tunings = category_codes(df['Tuning'])
+    candidates = sample_setlist_batch(times, weights, target_time, n_candidates, includes=include_positions, pool=pool, rng=rng, fill=fill, tolerance=tolerance)
+    scores = score_setlist_batch(candidates, times, moods, tunings, target_time)
+    best = np.argsort(-scores, kind='stable')[:top_k]
+    profiling.count("make_setlist.dataframes", len(best))
+    return [(scores[i], df.iloc[candidates[i][candidates[i] >= 0]].reset_index(drop=True)) for i in best]
+
+# "Best of N" version of make_setlist: generates n_candidates setlists in one batched call, scores them all and
+# returns the top_k setlists (best first) as (score, dataframe) pairs
+def make_setlist_candidates(df, target_time, og_weight, mood_weight, includes, n_candidates, top_k, rng=None, fill=False, tolerance=0.0):
+    include_positions = np.flatnonzero(df['Song'].isin(includes).to_numpy())
+    return _ranked_candidates(df, target_time, og_weight, mood_weight, include_positions, None, n_candidates, top_k, rng, fill, tolerance)
+
+# make_setlist_candidates for a SongLibrary
+def make_library_candidates(library, target_time, og_weight, mood_weight, n_candidates, top_k, rng=None, fill=False, tolerance=0.0, recency=None):
+    with profiling.stage("exclude_filter"):
+        includes, pool = library.included_positions(), library.active_pool()
+    return _ranked_candidates(library.songs, target_time, og_weight, mood_weight, includes, pool, n_candidates, top_k, rng, fill, tolerance, recency)
+
+# Largest mood of a cluster, ignoring missing moods (NaN if they are all missing)
+def _cluster_max(moods):
+    return np.fmax.reduce(moods) if len(moods) else np.nan
+
+# Array version of sort_sample_into_clusters: returns the order (as positions into moods) to play the songs in.
+# The middle clusters are shuffled with rng (a numpy Generator). Raises IndexError for an empty sample
+def cluster_order(moods, cluster_size, rng=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    moods = np.asarray(moods, dtype=float)
+    # Sort the sample by descending "Mood" values (missing moods last)
+    by_mood = np.argsort(-moods, kind='stable')
 
     # Split the sample into clusters of the specified size
-    clusters = [sorted_sample[i:i+cluster_size] for i in range(0, len(sorted_sample), cluster_size)]
+    clusters = [by_mood[i:i+cluster_size] for i in range(0, len(by_mood), cluster_size)]
 
     # Check if the first cluster has high mood songs
-    first_cluster = clusters[0]
-    max_mood_first = first_cluster['Mood'].max()
+    max_mood_first = _cluster_max(moods[clusters[0]])
 
     # If the maximum "Mood" value is not high, swap the first cluster with a cluster that has high mood songs
     if max_mood_first < 7:
         for i in range(1, len(clusters)):
-            cluster = clusters[i]
-            if cluster['Mood'].max() >= 8:
+            if _cluster_max(moods[clusters[i]]) >= 8:
                 clusters[0], clusters[i] = clusters[i], clusters[0]
                 break
 
     # Swap songs within the first cluster so that the song with the highest mood is placed first
-    if len(clusters) > 0:
-        first_cluster = clusters[0]
-        first_cluster = first_cluster.sort_values('Mood', ascending=False)
-        clusters[0] = first_cluster
+    clusters[0] = clusters[0][np.argsort(-moods[clusters[0]], kind='stable')]
 
     # Shuffle the middle clusters
     if len(clusters) > 2:
         middle_clusters = clusters[1:-1]
-        random.shuffle(middle_clusters)
-        clusters[1:-1] = middle_clusters
-
-    # Check if the last cluster has high mood songs
-    last_cluster = clusters[-1]
-    max_mood_last = last_cluster['Mood'].max()
+        clusters[1:-1] = [middle_clusters[i] for i in rng.permutation(len(middle_clusters))]
 
-    # If the maximum "Mood" value is not high, swap the last cluster with a cluster that has high mood songs
-    if max_mood_last < 8:
+    # If the maximum "Mood" value of the last cluster is not high, swap it with a cluster that has high mood songs
+    if _cluster_max(moods[clusters[-1]]) < 8:
         for i in range(len(clusters) - 2, -1, -1):
-            cluster = clusters[i]
-            if cluster['Mood'].max() >= 8:
+            if _cluster_max(moods[clusters[i]]) >= 8:
                 clusters[-1], clusters[i] = clusters[i], clusters[-1]
                 break
-    # Sort the songs within the last cluster by descending "Mood" values
+    # Sort the songs within the last cluster by ascending "Mood" values
     if len(clusters) > 1:
-        last_cluster = clusters[-1]
-        last_cluster = last_cluster.sort_values('Mood', ascending=True)
-        clusters[-1] = last_cluster
+        clusters[-1] = clusters[-1][np.argsort(moods[clusters[-1]], kind='stable')]
 
-    # Concatenate the clusters into a single DataFrame
-    sorted_clusters = pd.concat(clusters)
+    return np.concatenate(clusters)
 
-    return sorted_clusters
+# Mood is already numeric in a loaded catalog (see catalog.py), so the sample is not changed
+def sort_sample_into_clusters(sample, cluster_size, rng=None):
+    return sample.iloc[cluster_order(sample['Mood'].to_numpy(), cluster_size, rng=rng)]
 
 def write_setlist_string_to_file(setlist_string, output_file):
     # Open the output file in write mode
     with open(output_file, 'w') as file:
         file.write(setlist_string)
 
+# Which songs of a setlist (keys and tunings in playing order) segue into the next one: the next song has the same key
+# and tuning, and the key is not "Misc". The last song never segues, and neither does a song with a missing key or
+# tuning (NaN, or an empty string in a catalog of numpy columns)
+def setlist_segues(keys, tunings):
+    keys = np.asarray(keys, dtype=object)
+    tunings = np.asarray(tunings, dtype=object)
+    segues = np.zeros(len(keys), dtype=bool)
+    segues[:-1] = (keys[:-1] == keys[1:]) & (tunings[:-1] == tunings[1:]) & (keys[:-1] != "Misc") & (keys[:-1] != "") & (tunings[:-1] != "")
+    return segues
+
+# The setlist lines as an object array: the song, " -->" if it segues into the next one, and the tuning in brackets if
+# it is not "E Standard"
+def setlist_lines(songs, keys, tunings):
+    songs = np.asarray(songs, dtype=object).astype(str).astype(object)
+    segues = setlist_segues(keys, tunings) # On the raw values, so two missing tunings never make a segue
+    tunings = np.asarray(tunings, dtype=object).astype(str).astype(object)
+    lines = songs + np.where(segues, " -->", "").astype(object)
+    return lines + np.where(tunings != "E Standard", " (" + tunings + ")", "").astype(object)
+
+# Array version of write_setlist_to_string, for the song names, keys and tunings of a setlist in playing order
+def write_setlist_arrays_to_string(songs, keys, tunings):
+    return '\n'.join(setlist_lines(songs, keys, tunings))
+
 def write_setlist_to_string(setlist):
-    # Iterate over the setlist songs and write to the file
-    setlist_string = []
-    for i in range(len(setlist)):
-        song = setlist.iloc[i]
-
-        # Check if the current song and the next song have the same key
-        if i < len(setlist) - 1 and song['Key'] == setlist.iloc[i+1]['Key'] and song["Tuning"] == setlist.iloc[i+1]['Tuning'] and song["Key"] != "Misc":
-            song_name = f"{song['Song']} -->"
-        else:
-            song_name = song['Song']
-
-        # Check if the tuning is not "E Standard"
-        if song['Tuning'] != "E Standard":
-            song_name += f" ({song['Tuning']})"
-
-        # Write the song name to the string
-        setlist_string.append(song_name + '\n')
-    setlist_string = ''.join(setlist_string)
-    return setlist_string[:-1] # Remove the last newline character
+    return write_setlist_arrays_to_string(setlist['Song'].to_numpy(), setlist['Key'].to_numpy(), setlist['Tuning'].to_numpy())
 
 def show_active_songs(df):
-    songs = []
-    df = df[df['Active'] == True]
-    for i, song in df.iterrows():
-        songs.append(song['Song'])
-    return songs
\ No newline at end of file
+    return np.asarray(df['Song'])[np.asarray(df['Active']) == True].tolist()
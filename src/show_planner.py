@@ -0,0 +1,148 @@
+# Show Planner - Plans a whole show (e.g. Set 1, Set 2 and an Encore) in one pass, with no song played twice.
+# Each set is a dict with any of these keys (only set_time is needed):
+#   name, set_time, transition_time (default 10% of the set time), mood_weight (default: the show's),
+#   min_mood / max_mood (only songs in that mood range), encore (the closer set: only songs with a mood of at least
+#   ENCORE_MIN_MOOD unless min_mood says otherwise, played from the weakest to the strongest)
+# The sets share one pool, the library's active songs. Every set gets its own weighted random keys over the pool
+# (Exp(1) / weight, like weighted_order), then the sets take turns picking songs, always the set that has used the
+# smallest share of its time so far, until no more songs fit. Each pick leans away from OG songs and tunings that the
+# picking set already has more of than the other sets, so they are spread evenly over the show. Included songs are
+# placed first, each in the (non-encore) set with the most time left.
+# The sets are then put in order like single setlists (mood clusters, or ordering.order_setlist with optimize_order).
+# Everything works on song positions in the catalog, so no dataframes are made until the show is written out.
+# Usage:
+#   show = plan_show(library, parse_sets("60, 60, encore 15"), og_weight=1.2, mood_weight=0.8, rng=rng)
+#   write_show(show_sets(library.songs, show), "show.txt")
+
+import numpy as np
+from setlist_math import catalog_arrays, category_codes, song_weights, cluster_order
+from ordering import order_setlist
+
+SET_DEFAULTS = dict(transition_time=None, mood_weight=None, min_mood=None, max_mood=None, encore=False)
+ENCORE_MIN_MOOD = 8
+# How strongly the picks are pushed towards the OG songs and tunings a set is short of
+BALANCE = 5.0
+
+# Reads a show from text like "60, 60, encore 15": one set per comma, each a number of minutes, optionally with
+# "encore" in front and "mood <weight>" after (e.g. "45 mood 1.5")
+def parse_sets(text):
+    sets = []
+    for i, part in enumerate(part.split() for part in text.split(",") if part.strip()):
+        spec = {}
+        if part[0].lower() == "encore":
+            spec["encore"] = True
+            spec["name"] = "Encore"
+            part = part[1:]
+        if len(part) == 3 and part[1].lower() == "mood":
+            spec["mood_weight"] = float(part[2])
+        elif len(part) != 1:
+            raise ValueError(f"Can't read set {i + 1}: {' '.join(part)!r}")
+        spec["set_time"] = float(part[0])
+        sets.append(spec)
+    return sets
+
+# Fills in the defaults of every set spec
+def set_specs(sets):
+    specs = []
+    for i, spec in enumerate(sets):
+        spec = dict(SET_DEFAULTS, **dict(dict(name=f"Set {i + 1}"), **spec))
+        if spec["transition_time"] is None:
+            spec["transition_time"] = spec["set_time"] * 0.1
+        if spec["encore"] and spec["min_mood"] is None:
+            spec["min_mood"] = ENCORE_MIN_MOOD
+        specs.append(spec)
+    return specs
+
+# Plans the show. Returns one dict per set with its name, the catalog positions of its songs in playing order, the
+# time of the songs and the transition time (measured with optimize_order, otherwise the set's transition_time).
+# recency is the optional multiplier per catalog song from play_history.recency_multipliers
+def plan_show(library, sets, og_weight, mood_weight, rng=None, optimize_order=False, cluster_size=2, balance=BALANCE, recency=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    specs = set_specs(sets)
+    songs = library.songs
+    times, moods, is_og = catalog_arrays(songs)
+    tunings = category_codes(songs["Tuning"])
+    pool = library.active_pool()
+    pool_times, pool_og, pool_tunings = times[pool], is_og[pool], tunings[pool]
+    budgets = np.array([spec["set_time"] - spec["transition_time"] for spec in specs], dtype=float)
+
+    # Random keys of every pool song for every set (infinite where the song can't go in the set)
+    keys = np.empty((len(specs), len(pool)))
+    for s, spec in enumerate(specs):
+        weights = song_weights(moods[pool], pool_og, og_weight, spec["mood_weight"] if spec["mood_weight"] is not None else mood_weight,
+                               recency[pool] if recency is not None else None)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            keys[s] = rng.exponential(size=len(pool)) / weights
+        allowed = keys[s] >= 0
+        if spec["min_mood"] is not None:
+            allowed &= moods[pool] >= spec["min_mood"]
+        if spec["max_mood"] is not None:
+            allowed &= moods[pool] <= spec["max_mood"]
+        keys[s][~allowed] = np.inf
+
+    available = np.ones(len(pool), dtype=bool)
+    picked = [[] for _ in specs]
+    used = np.zeros(len(specs))
+    song_counts = np.zeros(len(specs))
+    og_counts = np.zeros(len(specs))
+    tuning_counts = np.zeros((len(specs), tunings.max() + 1 if len(tunings) else 0))
+
+    def assign(s, j):
+        available[j] = False
+        picked[s].append(j)
+        used[s] += pool_times[j]
+        song_counts[s] += 1
+        og_counts[s] += pool_og[j]
+        tuning_counts[s, pool_tunings[j]] += 1
+
+    # Included songs first, each in the regular set with the most time left that it fits in
+    regular = np.array([not spec["encore"] for spec in specs])
+    for j in np.searchsorted(pool, library.included_positions()):
+        left = np.where(regular & (budgets - used >= pool_times[j]), budgets - used, -np.inf)
+        if np.isfinite(left.max()):
+            assign(int(np.argmax(left)), j)
+
+    # Then the sets take turns, the one with the smallest share of its time used picking next
+    open_sets = budgets > 0
+    while open_sets.any():
+        s = int(np.argmin(np.where(open_sets, used / np.where(budgets > 0, budgets, 1), np.inf)))
+        fits = available & (pool_times <= budgets[s] - used[s])
+        # How much more of each OG/tuning this set has than the show as a whole (as shares of the songs)
+        total = max(song_counts.sum(), 1)
+        og_excess = og_counts[s] / max(song_counts[s], 1) - og_counts.sum() / total
+        tuning_excess = tuning_counts[s] / max(song_counts[s], 1) - tuning_counts.sum(axis=0) / total
+        lean = np.exp(balance * (pool_og * og_excess + tuning_excess[pool_tunings]))
+        candidates = np.where(fits, keys[s] * lean, np.inf)
+        j = int(np.argmin(candidates)) if len(candidates) else 0
+        if len(candidates) == 0 or not np.isfinite(candidates[j]):
+            open_sets[s] = False
+            continue
+        assign(s, j)
+
+    show = []
+    for s, spec in enumerate(specs):
+        positions = pool[np.array(picked[s], dtype=np.intp)]
+        transition_time = spec["transition_time"]
+        if len(positions) == 0:
+            pass
+        elif spec["encore"]:
+            positions = positions[np.argsort(moods[positions], kind='stable')] # Build up to the strongest song
+        elif optimize_order:
+            keep = np.flatnonzero(library.included[positions])
+            order, transition_time = order_setlist(times[positions], np.asarray(songs["Key"])[positions], np.asarray(songs["Tuning"])[positions],
+                                                   moods[positions], set_time=spec["set_time"], keep=keep, rng=rng)
+            positions = positions[order]
+        else:
+            positions = positions[cluster_order(moods[positions], cluster_size, rng=rng)]
+        show.append(dict(name=spec["name"], positions=positions, song_time=float(times[positions].sum()), transition_time=transition_time,
+                         set_time=spec["set_time"]))
+    return show
+
+# The sets of a planned show as (name, columns) pairs, for renderers.write_show and render_show
+def show_sets(songs, show):
+    columns = {column: np.asarray(songs[column]) for column in songs}
+    return [(planned["name"], {column: values[planned["positions"]] for column, values in columns.items()}) for planned in show]
+
+# Share of the show's time that is used by songs and transitions
+def show_fill(show):
+    return sum(planned["song_time"] + planned["transition_time"] for planned in show) / sum(planned["set_time"] for planned in show)
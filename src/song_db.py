@@ -0,0 +1,246 @@
+# Song DB - Keeps song catalogs in an SQLite database instead of a CSV file, for big repertoires shared by several bands.
+# usage: python song_db.py import songs.csv repertoire.db [--band NAME]
+#        python song_db.py export repertoire.db songs.csv [--band NAME]
+# The database has one songs table with the same columns as the CSV (Song, Artist, Key, Tuning, Time, Mood, Active)
+# plus the band the song belongs to, with indexes on Active, Mood, Tuning, Artist and Song (each after the band).
+# Everywhere a song csv can be given (the GUI's input file, --csv, generation.py), a database can be given instead as
+# "repertoire.db" (the default band, "") or "repertoire.db#band" (see catalog.py). A band's catalog is its songs in the
+# order they were added, so row positions work the same as with a CSV.
+# The database runs in WAL mode, so readers never wait for a writer (or the other way around). Changes are single
+# indexed statements in one transaction each: saving the Active flags only updates the rows that changed (by id), and
+# set_active toggles songs by name. Every change bumps the band's version number, which is how loaded catalogs know
+# they are out of date (so change the songs through this file, not with other tools).
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from contextlib import closing
+import numpy as np
+
+DB_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+COLUMNS = ("Song", "Artist", "Key", "Tuning", "Time", "Mood", "Active")
+TEXT_COLUMNS = ("Song", "Artist", "Key", "Tuning")
+# How long a writer waits for another writer before giving up, in ms
+BUSY_TIMEOUT = 5000
+# Kept in PRAGMA user_version. The schema is only created (or migrated) when a database is older than this
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    band TEXT NOT NULL DEFAULT '',
+    Song TEXT, Artist TEXT, Key TEXT, Tuning TEXT, Time REAL, Mood REAL,
+    Active INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS songs_active ON songs (band, Active);
+CREATE INDEX IF NOT EXISTS songs_mood ON songs (band, Mood);
+CREATE INDEX IF NOT EXISTS songs_tuning ON songs (band, Tuning);
+CREATE INDEX IF NOT EXISTS songs_artist ON songs (band, Artist);
+CREATE INDEX IF NOT EXISTS songs_song ON songs (band, Song);
+CREATE TABLE IF NOT EXISTS bands (
+    band TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Catalogs already loaded in this process: (path, band, "frame" or "columns") -> (version, catalog)
+_loaded = {}
+
+# True if the song file is a database ("repertoire.db" or "repertoire.db#band") rather than a CSV
+def is_database(song_file):
+    return split_band(song_file)[0].lower().endswith(DB_EXTENSIONS)
+
+# "repertoire.db#band" -> ("repertoire.db", "band")
+def split_band(song_file):
+    path, _, band = str(song_file).partition("#")
+    return path, band
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT / 1000, isolation_level=None) # Transactions are started by hand
+    connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT}")
+    connection.execute("PRAGMA synchronous = NORMAL") # Safe in WAL mode, a crash can only lose the last commits
+    if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        _create_schema(connection)
+    return connection
+
+# Creates the tables of a new database (or one made before user_version was set). Every statement is idempotent, so
+# two processes doing this at once is harmless
+def _create_schema(connection):
+    connection.execute("PRAGMA journal_mode = WAL") # Stored in the database file, so once is enough
+    connection.executescript(f"BEGIN IMMEDIATE; {SCHEMA} PRAGMA user_version = {SCHEMA_VERSION}; COMMIT;")
+
+def _bump_version(connection, band):
+    connection.execute("INSERT INTO bands (band, version) VALUES (?, 1) ON CONFLICT (band) DO UPDATE SET version = version + 1", (band,))
+
+def band_version(connection, band):
+    row = connection.execute("SELECT version FROM bands WHERE band = ?", (band,)).fetchone()
+    return row[0] if row else 0
+
+# Identity of a band's catalog, in the same shape as catalog.file_fingerprint. Raises FileNotFoundError if the
+# database does not exist
+def db_fingerprint(song_file):
+    path, band = split_band(song_file)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    with closing(connect(path)) as connection:
+        version = band_version(connection, band)
+    return dict(path=os.path.abspath(path) + "#" + band, size=None, mtime_ns=None, version=version)
+
+def _read_songs(connection, band):
+    rows = connection.execute("SELECT Song, Artist, Key, Tuning, Time, Mood, Active FROM songs WHERE band = ? ORDER BY id", (band,)).fetchall()
+    return dict(zip(COLUMNS, zip(*rows) if rows else [()] * len(COLUMNS)))
+
+# Loads a band's songs as a dataframe (kind "frame") or a dict of numpy columns (kind "columns"), like
+# catalog.load_catalog and catalog.load_catalog_columns. Repeat loads return the same catalog until the band changes
+def load_db_catalog(song_file, kind="frame"):
+    path, band = split_band(song_file)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    key = (os.path.abspath(path), band, kind)
+    with closing(connect(path)) as connection:
+        connection.execute("BEGIN") # The version and the songs come from the same snapshot
+        version = band_version(connection, band)
+        loaded = _loaded.get(key)
+        if loaded is not None and loaded[0] == version:
+            connection.execute("COMMIT")
+            return loaded[1]
+        values = _read_songs(connection, band)
+        connection.execute("COMMIT")
+    columns = {}
+    for column in COLUMNS:
+        if column in TEXT_COLUMNS:
+            text = np.array(values[column], dtype=object)
+            if kind == "columns":
+                text[text == None] = ""
+                text = text.astype(str)
+            columns[column] = text
+        elif column == "Active":
+            columns[column] = np.array(values[column], dtype=bool)
+        else:
+            columns[column] = np.array([np.nan if value is None else value for value in values[column]], dtype=float)
+    from catalog import typed_columns, typed_catalog # The same schema as a CSV catalog
+    if kind == "frame":
+        import pandas as pd
+        catalog = typed_catalog(pd.DataFrame(columns))
+    else:
+        catalog = typed_columns(columns)
+    _loaded[key] = (version, catalog)
+    return catalog
+
+def clear_loaded_catalogs():
+    _loaded.clear()
+
+def _id_list(ids):
+    return json.dumps([int(song_id) for song_id in ids])
+
+# Saves the Active flag of every song of the band (active is a boolean array over the catalog rows). Only the rows
+# that changed are updated, with one statement per flag value. Returns the number of rows that changed
+def save_db_active_flags(song_file, active):
+    path, band = split_band(song_file)
+    active = np.asarray(active, dtype=bool)
+    with closing(connect(path)) as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute("SELECT id, Active FROM songs WHERE band = ? ORDER BY id", (band,)).fetchall()
+            if len(rows) != len(active):
+                raise ValueError(f"The songs of {song_file} changed since they were loaded")
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            changed = np.flatnonzero(np.array([bool(row[1]) for row in rows], dtype=bool) != active)
+            for flag in (True, False):
+                changed_ids = ids[changed[active[changed] == flag]]
+                if len(changed_ids):
+                    connection.execute("UPDATE songs SET Active = ? WHERE id IN (SELECT value FROM json_each(?))", (int(flag), _id_list(changed_ids)))
+            if len(changed):
+                _bump_version(connection, band)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    return len(changed)
+
+# Sets the Active flag of the given songs (by name) in one statement. Returns the number of rows that changed
+def set_active(song_file, songs, active):
+    path, band = split_band(song_file)
+    with closing(connect(path)) as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            changed = connection.execute("UPDATE songs SET Active = ? WHERE band = ? AND Active != ? AND Song IN (SELECT value FROM json_each(?))",
+                                         (int(active), band, int(active), json.dumps([str(song) for song in songs]))).rowcount
+            if changed:
+                _bump_version(connection, band)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    return changed
+
+# Row positions (in the catalog) of the band's Active songs, straight from the Active index
+def active_positions(song_file):
+    path, band = split_band(song_file)
+    with closing(connect(path)) as connection:
+        connection.execute("BEGIN")
+        active_ids = np.array(connection.execute("SELECT id FROM songs WHERE band = ? AND Active = 1", (band,)).fetchall(), dtype=np.int64).reshape(-1)
+        all_ids = np.array(connection.execute("SELECT id FROM songs WHERE band = ? ORDER BY id", (band,)).fetchall(), dtype=np.int64).reshape(-1)
+        connection.execute("COMMIT")
+    return np.searchsorted(all_ids, np.sort(active_ids))
+
+# A column as plain Python values. float32 values go through their shortest text, so a Time of 3.1 is stored as 3.1
+def _plain_values(values):
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        values = values.astype(str).astype(float)
+    return values.tolist()
+
+# Replaces the band's songs with the songs of a CSV (with its Active journal applied). Returns the number of songs
+def import_csv(csv_path, song_file):
+    from catalog import load_catalog, active_values
+    df = load_catalog(csv_path)
+    path, band = split_band(song_file)
+    columns = [_plain_values(df[column]) if column in df else [None] * len(df) for column in COLUMNS[:-1]]
+    columns.append(active_values(df["Active"]).astype(int).tolist() if "Active" in df else [1] * len(df))
+    rows = [(band,) + tuple(None if value != value else value for value in values) for values in zip(*columns)] # NaN -> NULL
+    with closing(connect(path)) as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM songs WHERE band = ?", (band,))
+            connection.executemany("INSERT INTO songs (band, Song, Artist, Key, Tuning, Time, Mood, Active) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            _bump_version(connection, band)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    return len(rows)
+
+# Writes the band's songs to a CSV in the usual format
+def export_csv(song_file, csv_path):
+    df = load_db_catalog(song_file, "frame")
+    df.to_csv(csv_path, index=False)
+    return len(df)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy song catalogs between CSV files and an SQLite database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="replace a band's songs in the database with a csv file")
+    import_parser.add_argument("csv", help="song csv file")
+    import_parser.add_argument("database", help="database file (created if needed)")
+    export_parser = subparsers.add_parser("export", help="write a band's songs to a csv file")
+    export_parser.add_argument("database", help="database file")
+    export_parser.add_argument("csv", help="csv file to write")
+    for subparser in (import_parser, export_parser):
+        subparser.add_argument("--band", default="", help="band the songs belong to (default: none)")
+    args = parser.parse_args(argv)
+    song_file = args.database + "#" + args.band if args.band else args.database
+    try:
+        if args.command == "import":
+            print(f"Imported {import_csv(args.csv, song_file)} songs into {song_file}")
+        else:
+            print(f"Exported {export_csv(song_file, args.csv)} songs to {args.csv}")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# Song Library - Holds a loaded song catalog along with the include/exclude state of every song.
+# The state is kept as boolean masks over the catalog rows, so including, excluding and building the pool of songs
+# that can be picked are single vectorized operations, no matter how many songs are excluded.
+# Songs can be given either by name (every row with that name is affected) or by row position in the catalog.
+# This file has no GUI code, so it can be used by the GUI, setlist_math and scripts alike.
+# The catalog can be a dataframe or a dict of numpy columns (see catalog.load_catalog_columns).
+
+import numpy as np
+from catalog import load_catalog, load_catalog_columns
+
+class SongLibrary:
+    def __init__(self, songs, song_file=""):
+        self.song_file = song_file
+        self.set_catalog(songs)
+
+    # Loads a song CSV (through the catalog cache). Songs that are not Active start out excluded.
+    # With columns=True the catalog is loaded as numpy columns, without pandas
+    @classmethod
+    def from_csv(cls, song_file, columns=False):
+        library = cls(load_catalog_columns(song_file) if columns else load_catalog(song_file), song_file)
+        library.reset_excludes()
+        return library
+
+    def set_catalog(self, songs):
+        self.songs = songs # Shared with the catalog cache, never modified here
+        self.names = np.asarray(songs["Song"])
+        self.included = np.zeros(len(self.names), dtype=bool) # len(songs) would count the columns of a dict catalog
+        self.excluded = np.zeros(len(self.names), dtype=bool)
+
+    # Copy that shares the (read-only) catalog but has its own include/exclude state
+    def copy(self):
+        library = SongLibrary.__new__(SongLibrary)
+        library.song_file = self.song_file
+        library.songs = self.songs
+        library.names = self.names
+        library.included = self.included.copy()
+        library.excluded = self.excluded.copy()
+        return library
+
+    def __len__(self):
+        return len(self.names)
+
+    # Clears all includes and excludes, then excludes the songs that are not Active in the catalog
+    def reset_excludes(self):
+        self.included[:] = False
+        self.excluded = np.array(np.asarray(self.songs["Active"]) == False, dtype=bool)
+
+    # Reloads the catalog if the CSV changed on disk, carrying the includes and excludes over by song name
+    def refresh(self):
+        songs = load_catalog_columns(self.song_file) if isinstance(self.songs, dict) else load_catalog(self.song_file)
+        if songs is self.songs:
+            return False
+        included, excluded = self.included_songs, self.excluded_songs
+        self.set_catalog(songs)
+        self.include(included)
+        self.exclude(excluded)
+        return True
+
+    # Row positions of the given songs (names, or positions which are passed through)
+    def positions(self, songs):
+        songs = np.asarray(songs)
+        if songs.dtype.kind in "iu":
+            return songs.astype(np.intp)
+        if len(songs) == 0:
+            return np.array([], dtype=np.intp)
+        return np.flatnonzero(np.isin(self.names, songs))
+
+    # include, exclude and remove return the positions they changed
+    def include(self, songs):
+        positions = self.positions(songs)
+        self.included[positions] = True
+        self.excluded[positions] = False
+        return positions
+
+    def exclude(self, songs):
+        positions = self.positions(songs)
+        self.excluded[positions] = True
+        self.included[positions] = False
+        return positions
+
+    # The --include and --exclude lists of a headless command. Excludes go first, so a song on both lists is included
+    def apply_lists(self, includes, excludes):
+        self.exclude(excludes)
+        self.include(includes)
+
+    # Takes the songs off both the includes and the excludes
+    def remove(self, songs):
+        positions = self.positions(songs)
+        self.included[positions] = False
+        self.excluded[positions] = False
+        return positions
+
+    # Positions of the songs that can be picked for a setlist (everything that is not excluded)
+    def active_pool(self):
+        return np.flatnonzero(~self.excluded)
+
+    def included_positions(self):
+        return np.flatnonzero(self.included)
+
+    @property
+    def included_songs(self):
+        return self.names[self.included].tolist()
+
+    @property
+    def excluded_songs(self):
+        return self.names[self.excluded].tolist()
@@ -0,0 +1,124 @@
+# Song Search - Type-ahead search and facet filters over a song catalog, for the "Includes/Excludes" tab.
+# The index is built once per loaded catalog (search_index keeps the last few) and answers a search in a few ms even
+# for 100k songs:
+#   Text: Song and Artist are normalized (lowercase, no accents, punctuation as spaces) and split into words. The
+#   distinct words are kept sorted, with the rows of every word stored one word after the other, so the rows of all
+#   words starting with some text are one slice of an array. Every word of a search has to be the start of some word of
+#   the song or artist, so "zep dr" finds "Dream On" by Led Zeppelin but not "Dream On" by Aerosmith.
+#   Facets: a boolean mask over the rows for every value of Key, Tuning, the mood band (MOOD_BANDS), Active and OG.
+#   Values picked in the same facet are ORed, different facets are ANDed.
+# Usage:
+#   index = search_index(library.songs)
+#   positions = index.search("zep", {"Tuning": ["Drop D"], "OG": [True]})   # sorted catalog positions
+
+import re
+import unicodedata
+from itertools import chain
+import numpy as np
+
+# Mood bands for the mood facet: label -> (lowest mood, highest mood)
+MOOD_BANDS = {"Low (1-4)": (1, 4), "Mid (5-7)": (5, 7), "High (8-10)": (8, 10)}
+FACETS = ("Key", "Tuning", "Mood", "Active", "OG")
+# Number of catalogs whose index is kept
+INDEX_CACHE_SIZE = 4
+
+_NOT_WORD = re.compile(r"[^0-9a-z\n]+")
+
+# Lowercase ASCII with anything that is not a letter or digit turned into a space
+def normalize(text):
+    text = str(text).lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return _NOT_WORD.sub(" ", text)
+
+# Normalizes many strings in one pass (joined by newlines, which survive normalize)
+def _normalize_all(values):
+    values = np.asarray(values).astype(str).tolist()
+    text = "\n".join(values)
+    if text.count("\n") != max(len(values) - 1, 0): # Newlines in the values themselves
+        text = "\n".join(value.replace("\n", " ") for value in values)
+    return normalize(text).split("\n")
+
+# Splits normalized strings into words. Returns the words and the number of the string each came from
+def _split_words(texts):
+    split = [text.split() for text in texts]
+    lengths = np.fromiter(map(len, split), dtype=np.int64, count=len(split))
+    return np.array(list(chain.from_iterable(split)), dtype=str), np.repeat(np.arange(len(split)), lengths)
+
+class SongIndex:
+    def __init__(self, songs):
+        names = np.asarray(songs["Song"])
+        artists = np.asarray(songs["Artist"])
+        self.size = len(names)
+        # Artists repeat a lot, so each distinct artist is only split into words once
+        unique_artists, artist_codes = np.unique(artists.astype(str), return_inverse=True)
+        song_words, song_rows = _split_words(_normalize_all(names))
+        artist_words, artist_of_word = _split_words(_normalize_all(unique_artists))
+        # The artist words of every row: the words of its artist, which are one run in artist_words
+        artist_starts = np.searchsorted(artist_of_word, np.arange(len(unique_artists) + 1))
+        lengths = np.diff(artist_starts)[artist_codes]
+        ends = np.cumsum(lengths)
+        picks = np.repeat(artist_starts[artist_codes] - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+        self.words, word_ids = np.unique(np.concatenate([song_words, artist_words]), return_inverse=True)
+        word_ids = np.concatenate([word_ids[:len(song_words)], word_ids[len(song_words):][picks]])
+        rows = np.concatenate([song_rows, np.repeat(np.arange(self.size), lengths)])
+        # One entry per (word, row), sorted by word and then row
+        pairs = np.unique(word_ids * max(self.size, 1) + rows)
+        self.word_rows = pairs % max(self.size, 1)
+        self.word_starts = np.searchsorted(pairs // max(self.size, 1), np.arange(len(self.words) + 1))
+
+        self.facets = {}
+        for column in ("Key", "Tuning"):
+            values = np.asarray(songs[column]).astype(str)
+            self.facets[column] = {str(value): values == value for value in np.unique(values) if value not in ("", "nan")}
+        moods = np.asarray(songs["Mood"], dtype=float)
+        self.facets["Mood"] = {label: (moods >= low) & (moods <= high) for label, (low, high) in MOOD_BANDS.items()}
+        active = np.asarray(songs["Active"]) == True
+        self.facets["Active"] = {True: active, False: ~active}
+        og = artists == "OG"
+        self.facets["OG"] = {True: og, False: ~og}
+
+    # Values of a facet, for the filter controls
+    def facet_values(self, facet):
+        return list(self.facets[facet])
+
+    # Sorted rows with a word that starts with prefix
+    def _prefix_rows(self, prefix):
+        low = np.searchsorted(self.words, prefix, side="left")
+        high = np.searchsorted(self.words, prefix + "\x7f", side="left")
+        return np.unique(self.word_rows[self.word_starts[low]:self.word_starts[high]])
+
+    # Sorted catalog positions of the songs that match the search text and the facets ({facet: [values]})
+    def search(self, text="", facets=None):
+        mask = None
+        for facet, values in (facets or {}).items():
+            if not values:
+                continue
+            picked = np.zeros(self.size, dtype=bool)
+            for value in values:
+                if value in self.facets[facet]:
+                    picked |= self.facets[facet][value]
+            mask = picked if mask is None else mask & picked
+        rows = None
+        # Longest words first, they usually match the fewest songs
+        for word in sorted(normalize(text).split(), key=len, reverse=True):
+            matches = self._prefix_rows(word)
+            rows = matches if rows is None else rows[np.isin(rows, matches, assume_unique=True)]
+            if len(rows) == 0:
+                break
+        if rows is None:
+            return np.flatnonzero(mask) if mask is not None else np.arange(self.size)
+        return rows[mask[rows]] if mask is not None else rows
+
+# Catalog id -> (catalog, index), newest last
+_indexes = {}
+
+# The search index of a catalog, built the first time it is asked for
+def search_index(songs):
+    cached = _indexes.pop(id(songs), None)
+    if cached is None or cached[0] is not songs:
+        cached = (songs, SongIndex(songs))
+    _indexes[id(songs)] = cached
+    while len(_indexes) > INDEX_CACHE_SIZE:
+        del _indexes[next(iter(_indexes))]
+    return cached[1]
@@ -0,0 +1,315 @@
+# Weight Analysis - Shows what the OG Weight and Mood Weight actually do, by simulating lots of setlists at once.
+# usage: python main.py analyze --csv songs.csv [--setlists 100000] [--sweep-setlists 20000] [--og-grid 0.5,1,2]
+#                                [--mood-grid 0,0.8,2] [--best-of N] [--out songs_analysis.csv]
+# For one set of parameters it reports every song's chance of making the set, the expected set length and unused time,
+# and how often each song opens or closes the set (with the mood cluster order, see setlist_math.cluster_order). Then
+# it sweeps the OG Weight over --og-grid (with the Mood Weight fixed) and the Mood Weight over --mood-grid (with the OG
+# Weight fixed) and reports how the set changes and which songs react the most (sensitivity: the change in chance of
+# making the set per unit of weight, a least squares slope over the grid). Every grid point simulates --sweep-setlists
+# setlists with the same seed, so the differences between them are the weights and not the noise.
+# The per-song results go to the --out csv, and the sweep summary next to it (songs_analysis_sweep.csv).
+# Speed: setlists are drawn in batches without a random key for every song of the catalog (see draw_setlists), so a
+# setlist costs a few draws per song of the set instead of one per song of the catalog, and the result has exactly the
+# same distribution as sample_setlist_batch. The whole analysis of a 2k song catalog takes a few seconds.
+# Included songs, excludes, inactive songs and the play history (recency) are used like in a normal run. "Fill Set
+# Time" and "Optimize Order" are not simulated. With --best-of N every simulated setlist is the best scored of N, like
+# the first candidate of a GUI run with Candidates set to N.
+
+import csv
+import os
+import numpy as np
+from setlist_math import catalog_arrays, category_codes, song_weights, place_includes, score_setlist_batch
+from song_library import SongLibrary
+from play_history import recency_multipliers
+from profiling import stage
+
+DEFAULT_SETLISTS = 100000
+DEFAULT_SWEEP_SETLISTS = 20000
+DEFAULT_OG_GRID = (0.5, 0.75, 1.0, 1.2, 1.5, 2.0, 2.5, 3.0)
+DEFAULT_MOOD_GRID = (0.0, 0.25, 0.5, 0.8, 1.0, 1.5, 2.0, 3.0)
+# Songs are only drawn with replacement (see _light_draws) while a set's worth of the biggest weight is at most this share of
+# the weights left, so few draws are repeats
+LIGHT_SHARE = 0.25
+# Setlists simulated together, which bounds the memory used
+BATCH_SIZE = 20000
+# Songs listed in each part of the printed table
+TABLE_ROWS = 15
+
+# Parses a grid like "0.5, 1, 1.5". Raises ValueError for anything else
+def parse_grid(text):
+    values = [float(value) for value in str(text).replace(" ", "").split(",") if value]
+    if not values:
+        raise ValueError(f"Empty grid {text!r}")
+    return tuple(values)
+
+# Walker's alias table for drawing index i with probability weights[i] / sum(weights): draw a column uniformly, then
+# keep it with probability accept[column] or take alias[column]
+def alias_table(weights):
+    size = len(weights)
+    scaled = (np.asarray(weights, dtype=float) * size / np.sum(weights)).tolist()
+    accept = np.ones(size)
+    alias = np.arange(size)
+    small = [i for i, value in enumerate(scaled) if value < 1]
+    large = [i for i, value in enumerate(scaled) if value >= 1]
+    while small and large:
+        low, high = small.pop(), large[-1]
+        accept[low] = scaled[low]
+        alias[low] = high
+        scaled[high] += scaled[low] - 1
+        if scaled[high] < 1:
+            small.append(large.pop())
+    return accept, alias
+
+# Draws n setlists from pool into budget minutes. Returns an (n, max_length) matrix of catalog positions padded with -1,
+# like sample_setlist_batch (without the includes). Like there, the songs are ordered by random keys Exp(1) / weight,
+# but only the few songs with the biggest weights get a key each. The rest come from _light_draws, whose keys are
+# worked out from the order they were drawn in (the keys are an exponential race, so the gap to the next one is
+# Exp(1) / the weight of the songs not drawn yet)
+def draw_setlists(times, weights, budget, n, pool, rng):
+    pool_weights = np.asarray(weights, dtype=float)[pool]
+    pool_weights = np.where(pool_weights > 0, pool_weights, 0.0) # NaN and negative weights are never drawn
+    drawable = int(np.count_nonzero(pool_weights))
+    if budget <= 0 or drawable == 0:
+        return np.full((n, 0), -1, dtype=np.intp)
+    shortest = np.cumsum(np.sort(times[pool][pool_weights > 0]))
+    max_length = min(int(np.searchsorted(shortest, budget, side='right')) + 1, drawable)
+    by_weight = np.argsort(-pool_weights, kind='stable')[:drawable]
+    sorted_weights = pool_weights[by_weight]
+    # Heavy songs: the biggest weights, until a set's worth of the next one is at most LIGHT_SHARE of what is left
+    rest = np.cumsum(sorted_weights[::-1])[::-1]
+    heavy = int(np.argmax(np.append(max_length * sorted_weights <= LIGHT_SHARE * rest, True)))
+    light = by_weight[heavy:]
+    with np.errstate(divide='ignore'):
+        keys = rng.exponential(size=(n, heavy)) / sorted_weights[:heavy]
+    songs = np.broadcast_to(by_weight[:heavy], (n, heavy))
+    if len(light):
+        light_songs, light_keys = _light_draws(pool_weights[light], min(max_length, len(light)), n, rng)
+        keys = np.concatenate([keys, light_keys], axis=1)
+        songs = np.concatenate([songs, light[light_songs]], axis=1)
+    # The first max_length songs by key, in order (the race keys are in order already), cut at the first song that
+    # overflows like sample_setlist_batch
+    if heavy:
+        if max_length < keys.shape[1]:
+            columns = np.argpartition(keys, max_length - 1, axis=1)[:, :max_length]
+        else:
+            columns = np.broadcast_to(np.arange(keys.shape[1]), keys.shape)
+        columns = np.take_along_axis(columns, np.argsort(np.take_along_axis(keys, columns, axis=1), axis=1, kind='stable'), axis=1)
+        songs = np.take_along_axis(songs, columns, axis=1)
+    order = pool[songs]
+    cumulative = np.cumsum(times[order], axis=1)
+    lengths = np.minimum((cumulative <= budget).sum(axis=1), (cumulative < budget).sum(axis=1) + 1)
+    order = np.where(np.arange(order.shape[1]) < lengths[:, None], order, -1)
+    return order[:, :int(lengths.max()) if n else 0]
+
+# Draws the first `needed` songs of n exponential races between songs with these weights (none of them much bigger than
+# the rest, see LIGHT_SHARE): songs are drawn with replacement (with an alias table, a few steps per draw) and repeats
+# are dropped, which gives the same order as drawing without replacement. Returns the songs (indices into weights) and
+# their keys, both (n, needed)
+def _light_draws(weights, needed, n, rng):
+    accept, alias = alias_table(weights)
+    songs = np.empty((n, needed), dtype=np.intp)
+    pending = np.arange(n)
+    draws = np.empty((n, 0), dtype=np.int32)
+    step = needed + 8
+    while len(pending):
+        uniform = rng.random((len(pending), step)) * len(weights)
+        columns = uniform.astype(np.int32)
+        draws = np.concatenate([draws, np.where(uniform - columns < accept[columns], columns, alias[columns]).astype(np.int32)], axis=1) # The fraction is a second uniform
+        first = _first_draws(draws)
+        ranks = np.cumsum(first, axis=1)
+        done = ranks[:, -1] >= needed
+        rows, columns = np.nonzero(first & (ranks <= needed) & done[:, None])
+        songs[pending[rows], ranks[rows, columns] - 1] = draws[rows, columns]
+        pending, draws = pending[~done], draws[~done]
+        step *= 2
+    drawn_weights = weights[songs]
+    left = weights.sum() - np.cumsum(drawn_weights, axis=1) + drawn_weights
+    return songs, np.cumsum(rng.exponential(size=(n, needed)) / np.maximum(left, 1e-300), axis=1)
+
+# Which draws of every row are the first draw of their song. Rows are short, so every column is compared with the
+# ones before it
+def _first_draws(draws):
+    first = np.ones(draws.shape, dtype=bool)
+    for column in range(1, draws.shape[1]):
+        first[:, column] = (draws[:, :column] != draws[:, column:column + 1]).all(axis=1)
+    return first
+
+# Opener and closer (catalog positions, -1 for an empty set) of every setlist of a candidate matrix when it is played in
+# the order of setlist_math.cluster_order, without ordering each one
+def openers_and_closers(candidates, moods, cluster_size, rng):
+    n, width = candidates.shape
+    openers = np.full(n, -1, dtype=np.intp)
+    closers = np.full(n, -1, dtype=np.intp)
+    if width == 0:
+        return openers, closers
+    valid = candidates >= 0
+    lengths = valid.sum(axis=1)
+    set_moods = np.where(valid, moods[np.where(valid, candidates, 0)], np.nan)
+    by_mood = np.argsort(-set_moods, axis=1, kind='stable') # Missing moods (and the padding after them) last
+    songs = np.take_along_axis(candidates, by_mood, axis=1)
+    sorted_moods = np.take_along_axis(set_moods, by_mood, axis=1)
+    rows = np.arange(n)
+    clusters = -(-lengths // cluster_size)
+    last = np.maximum(clusters - 1, 0) * cluster_size # Where the last cluster starts
+    # Cluster j starts at j * cluster_size, so its largest mood is the one at its start
+    cluster_max = sorted_moods[:, ::cluster_size]
+    last_max = sorted_moods[rows, last]
+    # The last cluster is swapped with a high mood cluster if it has none. The middle clusters are shuffled first, so it
+    # is a random one of the middle clusters with a high mood (clusters 1..k), or else the first cluster
+    cluster_numbers = np.arange(cluster_max.shape[1])
+    high_middle = ((cluster_max >= 8) & (cluster_numbers >= 1) & (cluster_numbers < (clusters - 1)[:, None])).sum(axis=1)
+    swap = (clusters > 1) & (last_max < 8)
+    closing = np.where(swap & (high_middle > 0), 1 + (rng.random(n) * np.maximum(high_middle, 1)).astype(np.intp), np.maximum(clusters - 1, 0))
+    swap_first = swap & (high_middle == 0) & (sorted_moods[:, 0] >= 8)
+    closing[swap_first] = 0
+    openers[:] = songs[:, 0]
+    openers[swap_first] = songs[swap_first, last[swap_first]]
+    # The closing cluster is played in ascending mood order: its closer is the last song with its largest mood (or
+    # the last of its songs with a missing mood)
+    start = closing * cluster_size
+    end = np.minimum(start + cluster_size, lengths)
+    in_cluster = (np.arange(width) >= start[:, None]) & (np.arange(width) < end[:, None])
+    ties = (in_cluster & (sorted_moods == sorted_moods[rows, start][:, None])).sum(axis=1)
+    end_missing = np.isnan(sorted_moods[rows, np.maximum(end - 1, 0)])
+    closers[:] = songs[rows, np.where(end_missing, end - 1, start + ties - 1)]
+    # A single cluster is played strongest first, so it closes with its weakest song
+    single = clusters == 1
+    closers[single] = songs[single, lengths[single] - 1]
+    empty = lengths == 0
+    openers[empty] = -1
+    closers[empty] = -1
+    return openers, closers
+
+# Simulates n_setlists setlists from a SongLibrary and counts what is in them. Returns a dict with per-song arrays
+# (inclusion, opener, closer: fractions of the setlists) and per-setlist arrays (songs, minutes, unused)
+def simulate(library, target_time, og_weight, mood_weight, n_setlists=DEFAULT_SETLISTS, cluster_size=2, best_of=1, rng=None, recency=None, seed=0):
+    if rng is None:
+        rng = np.random.default_rng(seed)
+    times, moods, is_og = catalog_arrays(library.songs)
+    weights = song_weights(moods, is_og, og_weight, mood_weight, recency)
+    tunings = category_codes(library.songs['Tuning'])
+    includes, pool = library.included_positions(), library.active_pool()
+    sampled, included_time = place_includes(times, target_time, includes)
+    if len(sampled):
+        pool = pool[~np.isin(pool, sampled)]
+    size = len(times)
+    inclusion = np.zeros(size, dtype=np.int64)
+    opener = np.zeros(size, dtype=np.int64)
+    closer = np.zeros(size, dtype=np.int64)
+    songs, minutes = [], []
+    with stage("analysis_simulate", setlists=n_setlists, best_of=best_of):
+        for start in range(0, n_setlists, BATCH_SIZE):
+            n = min(BATCH_SIZE, n_setlists - start)
+            drawn = draw_setlists(times, weights, target_time - included_time, n * best_of, pool, rng)
+            candidates = np.concatenate([np.broadcast_to(sampled, (n * best_of, len(sampled))), drawn], axis=1)
+            if best_of > 1:
+                scores = score_setlist_batch(candidates, times, moods, tunings, target_time).reshape(n, best_of)
+                candidates = candidates.reshape(n, best_of, -1)[np.arange(n), np.argmax(scores, axis=1)]
+            valid = candidates >= 0
+            inclusion += np.bincount(candidates[valid], minlength=size)
+            openers, closers = openers_and_closers(candidates, moods, cluster_size, rng)
+            opener += np.bincount(openers[openers >= 0], minlength=size)
+            closer += np.bincount(closers[closers >= 0], minlength=size)
+            songs.append(valid.sum(axis=1))
+            minutes.append(np.where(valid, times[np.where(valid, candidates, 0)], 0.0).sum(axis=1))
+    minutes = np.concatenate(minutes) if minutes else np.zeros(0)
+    return dict(inclusion=inclusion / max(n_setlists, 1), opener=opener / max(n_setlists, 1), closer=closer / max(n_setlists, 1),
+                songs=np.concatenate(songs) if songs else np.zeros(0, dtype=np.int64), minutes=minutes, unused=target_time - minutes,
+                og_share=float(inclusion[is_og].sum() / max(inclusion.sum(), 1)),
+                mean_mood=float(np.nansum(inclusion * np.nan_to_num(moods)) / max(inclusion[~np.isnan(moods)].sum(), 1)))
+
+# Least squares slope of every song's inclusion over a grid (rows: grid points)
+def _slopes(grid, inclusions):
+    grid = np.asarray(grid, dtype=float)
+    if len(grid) < 2 or np.ptp(grid) == 0:
+        return np.zeros(inclusions.shape[1])
+    centered = grid - grid.mean()
+    return centered @ (inclusions - inclusions.mean(axis=0)) / (centered @ centered)
+
+# Runs the whole analysis: the base parameters, then the OG and Mood Weight sweeps. Returns a dict with the base
+# simulation ("base"), the sweeps ({"og_weight": [(value, simulation)], "mood_weight": [...]}) and the slopes
+def analyze(library, target_time, og_weight, mood_weight, og_grid=DEFAULT_OG_GRID, mood_grid=DEFAULT_MOOD_GRID, n_setlists=DEFAULT_SETLISTS,
+            sweep_setlists=DEFAULT_SWEEP_SETLISTS, cluster_size=2, best_of=1, recency=None, seed=0):
+    run = lambda og, mood, count=sweep_setlists: simulate(library, target_time, og, mood, count, cluster_size, best_of, recency=recency, seed=seed)
+    base = run(og_weight, mood_weight, n_setlists)
+    sweeps = dict(og_weight=[(value, run(value, mood_weight)) for value in og_grid],
+                  mood_weight=[(value, run(og_weight, value)) for value in mood_grid])
+    slopes = {name: _slopes([value for value, _ in sweep], np.array([result["inclusion"] for _, result in sweep]))
+              for name, sweep in sweeps.items()}
+    return dict(base=base, sweeps=sweeps, slopes=slopes, og_weight=og_weight, mood_weight=mood_weight, target_time=target_time, n_setlists=n_setlists,
+                sweep_setlists=sweep_setlists)
+
+# One line per setlist statistic: mean, 10th and 90th percentile
+def _summary_line(label, values):
+    if len(values) == 0:
+        return f"{label:22} -"
+    return f"{label:22} {np.mean(values):8.2f}   (10%: {np.percentile(values, 10):.1f}, 90%: {np.percentile(values, 90):.1f})"
+
+# The analysis as a plain text table
+def format_analysis(analysis, names, rows=TABLE_ROWS):
+    base = analysis["base"]
+    lines = [f"{analysis['n_setlists']} setlists of {analysis['target_time']:g} minutes, OG Weight {analysis['og_weight']:g}, "
+             f"Mood Weight {analysis['mood_weight']:g}", "",
+             _summary_line("Songs per set", base["songs"]), _summary_line("Minutes played", base["minutes"]),
+             _summary_line("Unused minutes", base["unused"]), f"{'OG share of songs':22} {base['og_share']:8.2%}", ""]
+
+    def song_table(title, values, order):
+        lines.append(title)
+        for position in order[values[order] > 0][:rows]:
+            lines.append(f"  {values[position]:7.2%}  {names[position]}")
+        lines.append("")
+    inclusion = base["inclusion"]
+    song_table("Most likely to make the set:", inclusion, np.argsort(-inclusion, kind='stable'))
+    song_table("Least likely to make the set (of the songs that can):", inclusion, np.argsort(inclusion, kind='stable'))
+    song_table("Most common openers:", base["opener"], np.argsort(-base["opener"], kind='stable'))
+    song_table("Most common closers:", base["closer"], np.argsort(-base["closer"], kind='stable'))
+
+    for name, label in (("og_weight", "OG Weight"), ("mood_weight", "Mood Weight")):
+        lines.append(f"{label} sweep ({analysis['sweep_setlists']} setlists each):")
+        lines.append(f"  {label:>11} {'songs':>7} {'minutes':>8} {'unused':>7} {'OG share':>9} {'avg mood':>9}")
+        for value, result in analysis["sweeps"][name]:
+            lines.append(f"  {value:11g} {np.mean(result['songs']):7.2f} {np.mean(result['minutes']):8.2f} {np.mean(result['unused']):7.2f} "
+                         f"{result['og_share']:9.2%} {result['mean_mood']:9.2f}")
+        slopes = analysis["slopes"][name]
+        lines.append(f"  Most sensitive to the {label} (change in chance per 1.0 of weight):")
+        for position in np.argsort(-np.abs(slopes), kind='stable')[:rows]:
+            if slopes[position] == 0:
+                break
+            lines.append(f"    {slopes[position]:+7.2%}  {names[position]}")
+        lines.append("")
+    return "\n".join(lines)
+
+# Writes the per-song results to path and the sweep summary to <path without .csv>_sweep.csv. Returns both paths
+def write_analysis_csv(analysis, songs, path):
+    base = analysis["base"]
+    sweep_columns = [(name, value, result) for name, sweep in analysis["sweeps"].items() for value, result in sweep]
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Song", "Artist", "Inclusion", "Opener", "Closer", "OG Weight Sensitivity", "Mood Weight Sensitivity"]
+                        + [f"Inclusion {name}={value:g}" for name, value, _ in sweep_columns])
+        for position, (song, artist) in enumerate(zip(np.asarray(songs["Song"]).tolist(), np.asarray(songs["Artist"]).tolist())):
+            writer.writerow([song, artist, f"{base['inclusion'][position]:.6f}", f"{base['opener'][position]:.6f}", f"{base['closer'][position]:.6f}",
+                             f"{analysis['slopes']['og_weight'][position]:.6f}", f"{analysis['slopes']['mood_weight'][position]:.6f}"]
+                            + [f"{result['inclusion'][position]:.6f}" for _, _, result in sweep_columns])
+    sweep_path = os.path.splitext(path)[0] + "_sweep.csv"
+    with open(sweep_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Parameter", "Value", "Songs", "Minutes", "Unused", "OG Share", "Average Mood"])
+        for name, value, result in [("base", None, base)] + sweep_columns:
+            writer.writerow([name, "" if value is None else f"{value:g}", f"{np.mean(result['songs']):.4f}", f"{np.mean(result['minutes']):.4f}",
+                             f"{np.mean(result['unused']):.4f}", f"{result['og_share']:.6f}", f"{result['mean_mood']:.4f}"])
+    return path, sweep_path
+
+# Entry point for `main.py analyze`
+def run_analyze(args):
+    library = SongLibrary.from_csv(args.csv)
+    library.apply_lists(args.includes, args.excludes) # The same pool as main.py generate
+    transition_time = args.transition_time if args.transition_time is not None else args.set_time * 0.1
+    recency = recency_multipliers(args.csv, library.names, args.recency_weight, args.recency_half_life)
+    analysis = analyze(library, args.set_time - transition_time, args.og_weight, args.mood_weight, parse_grid(args.og_grid),
+                       parse_grid(args.mood_grid), args.setlists, args.sweep_setlists, args.cluster_size, args.best_of, recency=recency, seed=args.seed)
+    print(format_analysis(analysis, np.asarray(library.names).tolist()))
+    if args.out:
+        paths = write_analysis_csv(analysis, library.songs, args.out)
+        print(f"Wrote {paths[0]} and {paths[1]}")
+    return 0
@@ -0,0 +1,43 @@
+# Shared fixtures for the tests. The scripts in src/ import each other by module name, so src/ goes on the path.
+# Every test gets its own cache directory and starts with nothing loaded in the process.
+
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import catalog
+import generation
+import play_history
+
+@pytest.fixture(autouse=True)
+def fresh_caches(tmp_path, monkeypatch):
+    monkeypatch.setenv("SETLIST_CACHE_DIR", str(tmp_path / "cache"))
+    catalog.clear_loaded_catalogs()
+    play_history.clear_loaded_history()
+    generation.clear_result_cache()
+    yield
+    catalog.clear_loaded_catalogs()
+    play_history.clear_loaded_history()
+    generation.clear_result_cache()
+
+# A copy of the repo's songs.csv, so tests can change it
+@pytest.fixture
+def songs_csv(tmp_path):
+    path = tmp_path / "songs.csv"
+    shutil.copy(os.path.join(ROOT, "songs.csv"), path)
+    return str(path)
+
+# Writes a song csv from rows of (Song, Artist, Key, Tuning, Time, Mood, Active)
+@pytest.fixture
+def write_csv(tmp_path):
+    def write(rows, name="catalog.csv"):
+        path = tmp_path / name
+        lines = ["Song,Artist,Key,Tuning,Time,Mood,Active"] + [",".join(str(value) for value in row) for row in rows]
+        path.write_text("\n".join(lines) + "\n")
+        return str(path)
+    return write
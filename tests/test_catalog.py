@@ -0,0 +1,67 @@
+import os
+import stat
+
+import numpy as np
+
+import catalog
+
+def test_saved_flags_are_replayed_from_the_journal(songs_csv):
+    before = open(songs_csv).read()
+    active = catalog.active_values(catalog.load_catalog(songs_csv)["Active"])
+    active[[0, 3]] = ~active[[0, 3]]
+    assert catalog.save_active_flags(songs_csv, active) == 2
+    assert open(songs_csv).read() == before # Only the journal was written
+    catalog.clear_loaded_catalogs()
+    assert (catalog.active_values(catalog.load_catalog(songs_csv)["Active"]) == active).all()
+    assert (catalog.load_catalog_columns(songs_csv)["Active"] == active).all()
+
+def test_last_journal_entry_wins_and_half_written_lines_are_ignored(songs_csv):
+    active = catalog.active_values(catalog.load_catalog(songs_csv)["Active"])
+    for flag in (False, True, False):
+        active[0] = flag
+        catalog.save_active_flags(songs_csv, active)
+    with open(catalog.journal_path(songs_csv), "ab") as file:
+        file.write(b'[0, true, "Harder')
+    catalog.clear_loaded_catalogs()
+    assert not catalog.load_catalog(songs_csv)["Active"][0]
+    active[1] = False # Appending after the half-written line still works
+    catalog.save_active_flags(songs_csv, active)
+    catalog.clear_loaded_catalogs()
+    assert (catalog.active_values(catalog.load_catalog(songs_csv)["Active"]) == active).all()
+
+def test_journal_entries_for_renamed_songs_are_skipped(songs_csv):
+    active = catalog.active_values(catalog.load_catalog(songs_csv)["Active"])
+    active[0] = False
+    catalog.save_active_flags(songs_csv, active)
+    text = open(songs_csv).read().replace("Harder to Breathe", "Renamed")
+    with open(songs_csv, "w") as file:
+        file.write(text)
+    catalog.clear_loaded_catalogs()
+    assert catalog.load_catalog(songs_csv)["Active"][0]
+
+def test_compaction_only_rewrites_the_active_field(write_csv):
+    path = write_csv([("A", '"Smith, John"', "E", "E Standard", 3.10, "7.50", "yes"), ("B", "X", "", "Drop D", "abc", "", "no"),
+                      ("C", "X", "Misc", "E Standard", 4, 5, "True")])
+    os.chmod(path, 0o644)
+    before = open(path).read().splitlines()
+    catalog.compact_active_journal(path) # No journal, nothing to do
+    catalog.save_active_flags(path, [False, True, True])
+    catalog.compact_active_journal(path)
+    assert not os.path.exists(catalog.journal_path(path))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    after = open(path).read().splitlines()
+    assert after[0] == before[0]
+    assert after[1] == before[1].rsplit(",", 1)[0] + ",False"
+    assert after[2] == before[2].rsplit(",", 1)[0] + ",True"
+    assert after[3] == before[3]
+    catalog.clear_loaded_catalogs()
+    assert catalog.load_catalog(path)["Active"].tolist() == [False, True, True]
+
+def test_long_journal_is_compacted(songs_csv, monkeypatch):
+    monkeypatch.setattr(catalog, "JOURNAL_COMPACT_ENTRIES", 2)
+    active = catalog.active_values(catalog.load_catalog(songs_csv)["Active"])
+    active[:3] = False
+    catalog.save_active_flags(songs_csv, active)
+    assert not os.path.exists(catalog.journal_path(songs_csv))
+    catalog.clear_loaded_catalogs()
+    assert (catalog.active_values(catalog.load_catalog(songs_csv)["Active"]) == active).all()
@@ -0,0 +1,103 @@
+import os
+
+import catalog
+
+def test_second_load_comes_from_the_cache(songs_csv, monkeypatch):
+    first = catalog.load_catalog(songs_csv)
+    assert os.path.exists(catalog.cache_path(songs_csv))
+    assert catalog.load_catalog(songs_csv) is first # Memoized in the process
+    catalog.clear_loaded_catalogs()
+    import pandas as pd
+    monkeypatch.setattr(pd, "read_csv", None) # The csv must not be parsed again
+    cached = catalog.load_catalog(songs_csv)
+    assert cached.equals(first)
+    assert list(cached.dtypes) == list(first.dtypes)
+
+def test_changed_csv_is_parsed_again(songs_csv):
+    catalog.load_catalog(songs_csv)
+    with open(songs_csv, "a") as file:
+        file.write("New Song,New Artist,E,E Standard,3,5,True\n")
+    assert catalog.load_catalog(songs_csv)["Song"].iloc[-1] == "New Song"
+    catalog.clear_loaded_catalogs()
+    assert len(catalog.load_catalog(songs_csv)) == 12
+
+# A file rewritten with the same size (so only the contents and the modification time differ) must not hit the cache
+def test_same_size_edit_is_noticed(songs_csv):
+    catalog.load_catalog(songs_csv)
+    text = open(songs_csv).read()
+    with open(songs_csv, "w") as file:
+        file.write(text.replace("Althea", "Alteah"))
+    os.utime(songs_csv, ns=(os.stat(songs_csv).st_atime_ns, os.stat(songs_csv).st_mtime_ns + 10**9))
+    catalog.clear_loaded_catalogs()
+    assert "Alteah" in catalog.load_catalog(songs_csv)["Song"].tolist()
+
+def test_touched_csv_keeps_its_cache(songs_csv, monkeypatch):
+    first = catalog.load_catalog(songs_csv)
+    os.utime(songs_csv, ns=(os.stat(songs_csv).st_atime_ns, os.stat(songs_csv).st_mtime_ns + 10**9))
+    catalog.clear_loaded_catalogs()
+    import pandas as pd
+    monkeypatch.setattr(pd, "read_csv", None) # Same contents, so the cache is used
+    assert catalog.load_catalog(songs_csv).equals(first)
+    assert catalog._read_cache_meta(catalog.cache_path(songs_csv))["mtime_ns"] == os.stat(songs_csv).st_mtime_ns
+
+def test_columns_match_the_dataframe(songs_csv):
+    frame = catalog.load_catalog(songs_csv)
+    for cached in (False, True):
+        if cached:
+            catalog.clear_loaded_catalogs()
+        columns = catalog.load_catalog_columns(songs_csv)
+        for column in frame.columns:
+            assert [str(value) for value in columns[column]] == [str(value) for value in frame[column]]
+
+def test_old_cache_version_is_recompiled(songs_csv, monkeypatch):
+    catalog.load_catalog(songs_csv)
+    monkeypatch.setattr(catalog, "CACHE_VERSION", catalog.CACHE_VERSION + 1)
+    assert catalog._read_cache_meta(catalog.cache_path(songs_csv)) is None
+    catalog.clear_loaded_catalogs()
+    catalog.load_catalog(songs_csv)
+    assert catalog._read_cache_meta(catalog.cache_path(songs_csv))["version"] == catalog.CACHE_VERSION
+
+# A truncated or otherwise corrupt cache is a cache miss, and the next load writes a good one again
+def test_corrupt_cache_is_rebuilt(songs_csv):
+    first = catalog.load_catalog(songs_csv)
+    path = catalog.cache_path(songs_csv)
+    data = open(path, "rb").read()
+    for broken in (data[:len(data) // 2], data[:40] + bytes(len(data) - 40), b""):
+        with open(path, "wb") as file:
+            file.write(broken)
+        catalog.clear_loaded_catalogs()
+        assert catalog.load_catalog(songs_csv).equals(first)
+        assert catalog._read_cache_meta(path) is not None
+
+def test_touched_csv_loads_when_the_cache_cannot_be_written(songs_csv, monkeypatch):
+    first = catalog.load_catalog(songs_csv)
+    os.utime(songs_csv, ns=(os.stat(songs_csv).st_atime_ns, os.stat(songs_csv).st_mtime_ns + 10**9))
+    catalog.clear_loaded_catalogs()
+    def read_only(*args):
+        raise PermissionError("read-only cache dir")
+    monkeypatch.setattr(catalog, "_write_cache", read_only)
+    assert catalog.load_catalog(songs_csv).equals(first)
+
+def test_concurrent_cache_writes_do_not_clash(songs_csv, monkeypatch):
+    import threading
+    catalog.load_catalog(songs_csv)
+    replace, temp_paths = os.replace, []
+    def recording_replace(source, target):
+        temp_paths.append(source)
+        replace(source, target)
+    monkeypatch.setattr(os, "replace", recording_replace)
+    path = catalog.cache_path(songs_csv)
+    meta = catalog._read_cache_meta(path)
+    arrays, _ = catalog.compile_catalog(catalog.load_catalog(songs_csv))
+    def write():
+        for _ in range(20):
+            catalog._write_cache(path, meta, arrays)
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(temp_paths)) == len(temp_paths) == 80 # Every write has a temp file of its own
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)] # No temp files left behind
+    catalog.clear_loaded_catalogs()
+    assert catalog._read_cache_meta(path) == meta
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+import catalog
+import song_db
+from setlist_math import category_codes, show_active_songs, sort_sample_into_clusters
+
+def test_columns_get_the_schema_types(songs_csv):
+    for cached in (False, True):
+        catalog.clear_loaded_catalogs()
+        songs = catalog.load_catalog(songs_csv)
+        for column in catalog.CATEGORY_COLUMNS:
+            assert isinstance(songs[column].dtype, pd.CategoricalDtype)
+        assert songs["Song"].dtype == object
+        assert songs["Time"].dtype == np.float32
+        assert songs["Mood"].dtype == np.int8
+        assert songs["Active"].dtype == bool
+        columns = catalog.load_catalog_columns(songs_csv)
+        assert columns["Tuning"].dtype.kind == "U" and columns["Time"].dtype == np.float32 and columns["Mood"].dtype == np.int8
+
+def test_bad_values_are_validated_at_load(write_csv):
+    path = write_csv([("A", "OG", "E", "E Standard", 3.1, 7.5, "yes"), ("B", "X", "", "Drop D", "abc", "", "no"),
+                      ("C", "X", "Misc", "E Standard", 4, "five", "maybe")])
+    songs = catalog.load_catalog(path)
+    assert songs["Mood"].dtype == np.float32 # Some moods are missing or not whole numbers
+    assert np.isnan(songs["Time"][1]) and np.isnan(songs["Mood"][1]) and np.isnan(songs["Mood"][2])
+    assert songs["Time"][0] == np.float32(3.1) and songs["Mood"][0] == 7.5
+    assert songs["Active"].tolist() == [True, False, False]
+    assert songs["Key"].isna().tolist() == [False, True, False]
+    assert catalog.load_catalog_columns(path)["Key"].tolist() == ["E", "", "Misc"]
+
+def test_out_of_range_moods_are_not_squeezed_into_int8():
+    assert catalog.mood_values(np.array([1, 5, 300])).dtype == np.float32
+    assert catalog.mood_values(np.array(["1", "10"], dtype=object)).dtype == np.int8
+
+def test_database_catalogs_get_the_same_schema(songs_csv, tmp_path):
+    db = str(tmp_path / "repertoire.db")
+    song_db.import_csv(songs_csv, db)
+    from_csv, from_db = catalog.load_catalog(songs_csv), catalog.load_catalog(db)
+    assert list(from_db.dtypes) == list(from_csv.dtypes)
+    assert from_db.equals(from_csv)
+
+def test_no_per_call_coercions(songs_csv):
+    songs = catalog.load_catalog(songs_csv)
+    sample = songs.iloc[:6]
+    ordered = sort_sample_into_clusters(sample, 2, rng=np.random.default_rng(0))
+    assert sample["Mood"].dtype == np.int8 # The sample is not changed
+    assert sorted(ordered["Song"]) == sorted(sample["Song"])
+    assert show_active_songs(songs) == songs["Song"][songs["Active"]].tolist()
+    codes = category_codes(songs["Tuning"])
+    text = np.asarray(songs["Tuning"]).astype(str)
+    assert ((codes[:, None] == codes[None, :]) == (text[:, None] == text[None, :])).all()
+
+def test_missing_categories_get_their_own_code():
+    codes = category_codes(pd.Series(["a", None, "b", None], dtype="category"))
+    assert codes[1] == codes[3] and len(set(codes.tolist())) == 3 and codes.min() >= 0
+
+def test_float32_values_keep_their_written_text(write_csv, tmp_path):
+    import sqlite3
+    import server
+    path = write_csv([("A", "OG", "E", "E Standard", 3.1, 2, True), ("B", "X", "A", "Drop D", 4.35, 3, True)])
+    songs = catalog.load_catalog(path)
+    assert [server._plain(value) for value in songs["Time"].to_numpy()] == [3.1, 4.35]
+    db = str(tmp_path / "repertoire.db")
+    song_db.import_csv(path, db)
+    with sqlite3.connect(db) as connection:
+        assert sorted(row[0] for row in connection.execute("SELECT time FROM songs")) == [3.1, 4.35]
@@ -0,0 +1,60 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from setlist_math import FILL_TIME_STEP, fill_remaining_time, sample_setlist_batch, sample_setlist_indices
+
+# Longest total time of any subset of the songs that fits in budget, by trying every subset
+def best_fill(times, budget):
+    best = 0.0
+    for size in range(len(times) + 1):
+        for subset in combinations(times, size):
+            if best < sum(subset) <= budget + 1e-9:
+                best = sum(subset)
+    return best
+
+@pytest.mark.parametrize("seed", range(30))
+def test_fill_is_as_good_as_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    times = rng.integers(2, 16, size=9) * FILL_TIME_STEP
+    weights = rng.uniform(0.5, 10, size=9)
+    budget = float(rng.integers(4, 40)) * FILL_TIME_STEP
+    chosen = fill_remaining_time(times, weights, budget, np.arange(9), rng)
+    assert len(set(chosen.tolist())) == len(chosen)
+    assert times[chosen].sum() == pytest.approx(best_fill(times.tolist(), budget))
+
+def test_tolerance_allows_a_fill_a_little_short_of_the_best():
+    times = np.array([5.0, 4.5, 0.5])
+    weights = np.array([1e-6, 1.0, 1.0])
+    budget = 5.0
+    strict = fill_remaining_time(times, weights, budget, np.arange(3), np.random.default_rng(0))
+    assert times[strict].sum() == 5.0
+    loose = [fill_remaining_time(times, weights, budget, np.arange(3), np.random.default_rng(seed), tolerance=0.5) for seed in range(20)]
+    assert all(times[chosen].sum() >= 4.5 for chosen in loose)
+    assert any(sorted(chosen.tolist()) == [1, 2] or sorted(chosen.tolist()) == [1] for chosen in loose) # The heavy songs usually win
+
+def test_songs_that_do_not_fit_or_have_no_weight_are_never_picked():
+    times = np.array([3.0, 10.0, 2.0, 1.0])
+    weights = np.array([1.0, 1.0, 0.0, np.nan])
+    chosen = fill_remaining_time(times, weights, 6.0, np.arange(4), np.random.default_rng(1))
+    assert chosen.tolist() == [0]
+    assert len(fill_remaining_time(times, weights, 0.0, np.arange(4), np.random.default_rng(1))) == 0
+
+# A filled setlist never runs over, and no song that was left out would still fit in the time that is left
+def assert_filled(times, setlist, budget):
+    assert len(set(setlist.tolist())) == len(setlist)
+    left = budget - times[setlist].sum()
+    assert left >= 0
+    assert not np.any(np.delete(times, setlist) <= left)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_filled_setlists_never_run_over(seed):
+    rng = np.random.default_rng(seed)
+    times = rng.integers(4, 16, size=60) * FILL_TIME_STEP
+    weights = rng.uniform(1, 10, size=60)
+    single = sample_setlist_indices(times, weights, 45, includes=[3], rng=rng, fill=True)
+    assert single[0] == 3
+    assert_filled(times, single, 45)
+    for row in sample_setlist_batch(times, weights, 45, 8, rng=rng, fill=True):
+        assert_filled(times, row[row >= 0], 45)
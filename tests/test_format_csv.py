@@ -0,0 +1,29 @@
+import os
+import stat
+
+import pandas as pd
+
+from format_csv import format_csv
+
+def test_formats_in_place_and_keeps_the_file_mode(tmp_path):
+    path = tmp_path / "songs.csv"
+    path.write_text("Song,Key,Time,Mood,Active\nA,E,3.5,7,yes\n,,abc,,maybe\nC,D,4,7.5,no\n")
+    os.chmod(path, 0o644)
+    rows, counts = format_csv(str(path), chunksize=2)
+    assert rows == 3
+    assert counts == dict(Song=1, Artist=3, Key=1, Tuning=3, Time=1, Mood=1, Active=1)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    df = pd.read_csv(path)
+    assert list(df.columns) == ["Song", "Artist", "Key", "Tuning", "Time", "Mood", "Active"]
+    assert df["Song"].tolist() == ["A", "Unknown Song", "C"]
+    assert df["Time"].tolist() == [3.5, 1.0, 4.0]
+    assert df["Mood"].tolist() == [7, 5, 7.5]
+    assert df["Active"].tolist() == [True, True, False]
+
+def test_new_output_file_gets_the_input_file_mode(tmp_path):
+    path = tmp_path / "songs.csv"
+    path.write_text("Song\nA\n")
+    os.chmod(path, 0o640)
+    output = tmp_path / "out.csv"
+    format_csv(str(path), str(output))
+    assert stat.S_IMODE(os.stat(output).st_mode) == 0o640
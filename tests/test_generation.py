@@ -0,0 +1,35 @@
+import datetime
+
+import generation
+import play_history
+from generation import generate_candidates
+
+PARAMS = dict(og_weight=1.2, mood_weight=0.8, set_time=30, transition_time=3, cluster_size=2, candidates=10, kept_candidates=3, fill=False, seed=3)
+
+# datetime module stand-in whose date.today() is the given day
+def fake_datetime(day):
+    class FakeDate(datetime.date):
+        @classmethod
+        def today(cls):
+            return day
+    return type("FakeDatetime", (), dict(date=FakeDate))
+
+def test_same_run_comes_from_the_result_cache(songs_csv):
+    first = generate_candidates(songs_csv, PARAMS)
+    second = generate_candidates(songs_csv, PARAMS)
+    assert second["candidate_strings"] is first["candidate_strings"]
+
+# The recency weights depend on the date, so a cached run from yesterday must not be reused today
+def test_result_cache_is_per_day(songs_csv, monkeypatch):
+    played = ["Althea", "All My Love", "Burn In Hell", "Harder to Breathe", "All I Wanted"]
+    play_history.record_play(songs_csv, played, datetime.date(2026, 1, 1))
+    params = dict(PARAMS, recency_weight=1.0, recency_half_life=1.0)
+    results = []
+    for day in (datetime.date(2026, 1, 1), datetime.date(2026, 3, 1)):
+        monkeypatch.setattr(generation, "datetime", fake_datetime(day))
+        monkeypatch.setattr(play_history, "datetime", fake_datetime(day))
+        results.append(generate_candidates(songs_csv, params))
+    assert results[1]["candidate_strings"] is not results[0]["candidate_strings"]
+    # On the day they were played the songs are rested completely, two months later they are back
+    assert not any(song in text.split("\n") for text in results[0]["candidate_strings"] for song in played)
+    assert any(song in text.split("\n") for text in results[1]["candidate_strings"] for song in played)
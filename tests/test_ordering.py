@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from cli import SPEC_KEYS, generate_show
+from generation import generate_candidates
+from ordering import fit_order_to_set_time, order_setlist, refill_order, transition_minutes
+
+PARAMS = dict(og_weight=1.2, mood_weight=0.8, cluster_size=2, candidates=5, kept_candidates=3, recency_weight=0, optimize_order=True)
+
+# Rows of (Song, Artist, Key, Tuning, Time, Mood, Active): songs of 4 minutes that all segue into each other
+def segue_rows(n=20):
+    return [(f"Song {i}", "X", "E", "E Standard", 4, 1 + i % 10, True) for i in range(n)]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_order_keeps_the_strongest_songs_at_the_ends(seed):
+    rng = np.random.default_rng(seed)
+    moods = rng.permutation(np.arange(1, 11))
+    keys, tunings = rng.choice(["E", "A", "D"], 10), rng.choice(["E Standard", "Drop D"], 10)
+    order, transition_time = order_setlist(np.full(10, 4.0), keys, tunings, moods, rng=rng)
+    assert sorted(order) == list(range(10))
+    assert moods[order[0]] == 10 and moods[order[-1]] == 9
+    assert transition_time == pytest.approx(transition_minutes(keys, tunings)[order[:-1], order[1:]].sum())
+
+def test_over_budget_order_drops_the_weakest_songs():
+    times = np.full(6, 5.0)
+    keys = np.array(["E", "A", "D", "G", "C", "B"]) # No segues, so every transition takes SONG_GAP_MINUTES
+    tunings = np.array(["E Standard"] * 6)
+    moods = np.array([10, 9, 1, 2, 3, 4])
+    order, transition_time = fit_order_to_set_time(np.array([0, 2, 3, 4, 5, 1]), times, keys, tunings, moods, set_time=21, keep=[2])
+    assert order.tolist() == [0, 2, 5, 1] # Songs 3 and 4 (the weakest that are not kept) are dropped, in order
+    assert times[order].sum() + transition_time <= 21
+
+def test_time_saved_on_transitions_is_filled_again():
+    times, moods = np.full(10, 4.0), np.arange(1.0, 11.0)
+    keys, tunings = np.array(["E"] * 10), np.array(["E Standard"] * 10)
+    positions = np.array([9, 0, 8]) # 12 minutes, all segues
+    refilled, transition_time = refill_order(positions, 0.0, times, keys, tunings, moods, np.ones(10), np.arange(10), set_time=25,
+                                             rng=np.random.default_rng(0))
+    assert set(positions) <= set(refilled) and len(set(refilled)) == len(refilled) == 6
+    assert transition_time == 0.0
+    assert refill_order(positions, 0.0, times, keys, tunings, moods, np.ones(10), np.arange(10), set_time=25, budget=3.5) is None
+    assert refill_order(positions, 0.0, times, keys, tunings, moods, np.ones(10), positions, set_time=25) is None # Nothing left to add
+
+# Reserving 10 minutes for transitions that turn out to be segues used to leave those 10 minutes empty
+def test_optimized_sets_give_the_saved_transition_time_back(write_csv):
+    path = write_csv(segue_rows())
+    result = generate_candidates(path, dict(PARAMS, set_time=30, transition_time=10, fill=False, seed=0))
+    for setlist, transition_time in zip(result["candidate_setlists"], result["candidate_transition_times"]):
+        assert transition_time == 0.0
+        assert setlist["Time"].sum() == 28 # 20 minutes sampled plus two songs in the 10 minutes saved
+        assert setlist["Song"].is_unique
+
+def test_headless_optimized_sets_give_the_saved_transition_time_back(write_csv):
+    spec = dict.fromkeys(SPEC_KEYS)
+    spec.update(PARAMS, name="setlist", csv=write_csv(segue_rows()), set_time=30, transition_time=10, count=3, seed=0, fill=False,
+                includes=[], excludes=[], recency_half_life=30)
+    for setlist in generate_show(spec):
+        assert setlist["Time"].sum() == 28 and len(set(setlist["Song"])) == len(setlist["Song"])
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+import catalog
+from conftest import ROOT
+from parallel_generation import ParallelGenerator, sweep_specs
+
+def test_import_does_not_load_pandas():
+    code = "import sys, parallel_generation; print('pandas' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=f"{ROOT}/src", capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+# Every task has its own seed, so the setlists don't depend on the number of workers
+def test_same_setlists_with_any_number_of_workers(songs_csv):
+    songs = catalog.load_catalog(songs_csv)
+    songs = songs[songs["Active"]]
+    runs = []
+    for workers in (1, 2):
+        with ParallelGenerator(songs, workers=workers) as generator:
+            results = sorted(generator.generate(sweep_specs([1.0, 1.2], [0.8], [20, 30]), seed=7), key=lambda result: result[0])
+            runs.append([generator.render(positions) for _, _, positions in results])
+    assert runs[0] == runs[1]
+    assert all(runs[0])
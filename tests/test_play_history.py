@@ -0,0 +1,40 @@
+import datetime
+import os
+
+import numpy as np
+
+import play_history
+
+DAY = datetime.date(2026, 3, 1)
+
+def test_recent_songs_are_rested(songs_csv):
+    play_history.record_play(songs_csv, ["Althea"], DAY)
+    multipliers = play_history.recency_multipliers(songs_csv, np.array(["Althea", "Other"]), 0.8, 30, today=DAY)
+    assert np.allclose(multipliers, [0.2, 1.0])
+
+# A truncated or otherwise corrupt summary is rebuilt from the log
+def test_corrupt_summary_is_rebuilt(songs_csv):
+    play_history.record_play(songs_csv, ["Althea", "Other"], DAY)
+    expected = play_history.load_history(songs_csv)
+    path = play_history.summary_path(play_history.history_path(songs_csv))
+    data = open(path, "rb").read()
+    for broken in (data[:len(data) // 2], data[:40] + bytes(len(data) - 40), b""):
+        with open(path, "wb") as file:
+            file.write(broken)
+        play_history.clear_loaded_history()
+        summary = play_history.load_history(songs_csv)
+        assert summary["names"].tolist() == expected["names"].tolist()
+        assert summary["play_count"].tolist() == expected["play_count"].tolist()
+        assert play_history._read_summary(path) is not None
+
+def test_summary_writes_use_their_own_temp_file(songs_csv, monkeypatch):
+    replace, temp_paths = os.replace, []
+    def recording_replace(source, target):
+        temp_paths.append(source)
+        replace(source, target)
+    monkeypatch.setattr(os, "replace", recording_replace)
+    for _ in range(3):
+        play_history.record_play(songs_csv, ["Althea"], DAY)
+        play_history.load_history(songs_csv)
+    assert len(set(temp_paths)) == len(temp_paths) == 3
+    assert os.listdir(os.path.dirname(temp_paths[0])) == [os.path.basename(play_history.summary_path(play_history.history_path(songs_csv)))]
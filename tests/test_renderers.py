@@ -0,0 +1,60 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from renderers import RENDERERS, render_show, write_show
+
+def setlist(songs, artists, keys, tunings, times, moods):
+    return dict(Song=np.array(songs, dtype=object), Artist=np.array(artists, dtype=object), Key=np.array(keys, dtype=object),
+                Tuning=np.array(tunings, dtype=object), Time=np.array(times, dtype=np.float32), Mood=np.array(moods, dtype=np.int8))
+
+# A segue, a retune and Misc keys (which never segue)
+SHOW = [("Set 1", setlist(["A", "B", "C"], ["OG", "X", "Y"], ["E", "E", "D"], ["E Standard", "E Standard", "Drop D"], [3.1, 4, 5.5], [9, 7, 8])),
+        ("Set 2", setlist(["D", "E"], ["OG", "OG"], ["Misc", "Misc"], ["E Standard", "E Standard"], [2, 6], [10, 5]))]
+
+def render(sets, format):
+    file = io.StringIO()
+    render_show(sets, file, format)
+    return file.getvalue()
+
+def test_text():
+    assert render(SHOW, "text") == "Set 1\n\nA -->\nB\nC (Drop D)\n\nSet 2\n\nD\nE\n"
+    assert render(SHOW[:1], "text") == "Set 1\n\nA -->\nB\nC (Drop D)\n"
+    assert render([(None, SHOW[0][1])], "text") == "A -->\nB\nC (Drop D)"
+
+def test_markdown():
+    assert render(SHOW, "markdown") == ("# Set 1\n\n1. A -->\n2. B\n3. C (Drop D)\n\nTotal time: 12.6 minutes\n\n"
+                                        "# Set 2\n\n1. D\n2. E\n\nTotal time: 8.0 minutes\n")
+
+def test_json():
+    data = json.loads(render(SHOW, "json"))
+    assert [s["title"] for s in data["sets"]] == ["Set 1", "Set 2"]
+    assert [s["total_time"] for s in data["sets"]] == [12.6, 8.0]
+    assert data["sets"][0]["songs"][0] == dict(position=1, song="A", artist="OG", key="E", tuning="E Standard", time=3.1, mood=9, segue=True, retune=False)
+    assert [song["retune"] for song in data["sets"][0]["songs"]] == [False, False, True]
+    assert json.loads(render(SHOW[:1], "json"))["title"] == "Set 1" # A single set is not wrapped
+
+def test_csv():
+    assert render(SHOW, "csv") == ("Set,Position,Song,Artist,Key,Tuning,Time,Mood,Segue\n"
+                                   "Set 1,1,A,OG,E,E Standard,3.1,9,True\nSet 1,2,B,X,E,E Standard,4.0,7,False\nSet 1,3,C,Y,D,Drop D,5.5,8,False\n"
+                                   "Set 2,1,D,OG,Misc,E Standard,2.0,10,False\nSet 2,2,E,OG,Misc,E Standard,6.0,5,False\n")
+
+def test_stage():
+    page = render(SHOW, "stage")
+    assert "<title>Set 1 / Set 2</title>" in page
+    assert ("<h1>Set 1</h1>\n<ol>\n<li>A &rarr;</li>\n<li>B</li>\n<li class=\"retune\">C <span class=\"tuning\">(Drop D)</span></li>\n</ol>\n"
+            "<h1 class=\"next-set\">Set 2</h1>\n<ol>\n<li>D</li>\n<li>E</li>\n</ol>\n") in page
+
+# Heavy excludes can leave nothing to play
+@pytest.mark.parametrize("format", list(RENDERERS))
+def test_empty_show(format):
+    empty = setlist([], [], [], [], [], [])
+    render([], format)
+    render([("Set 1", empty), ("Set 2", empty)], format)
+    assert render([], "text") == ""
+
+def test_format_comes_from_the_extension(tmp_path):
+    write_show(SHOW, str(tmp_path / "show.md"))
+    assert (tmp_path / "show.md").read_text().startswith("# Set 1")
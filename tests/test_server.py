@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import server
+from server import SetlistServer
+
+# Starts a server for song_files on a free port, runs client(host, port) against it and returns what it returns
+def with_server(song_files, client):
+    async def run():
+        app = SetlistServer(workers=2, song_files=song_files)
+        listener = await asyncio.start_server(app.handle_connection, "127.0.0.1", 0)
+        try:
+            return await client(*listener.sockets[0].getsockname()[:2])
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            app.executor.shutdown()
+    return asyncio.run(run())
+
+# Sends raw request bytes on a new connection. Returns (status, JSON body)
+async def raw_request(host, port, data):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(data)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    length = int(next(line.split(":")[1] for line in lines if line.lower().startswith("content-length")))
+    body = await reader.readexactly(length)
+    writer.close()
+    return int(lines[0].split(" ")[1]), json.loads(body)
+
+def post(path, body):
+    data = json.dumps(body).encode("utf-8")
+    return f"POST {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+
+def test_session_generate_and_modify(songs_csv):
+    async def client(host, port):
+        status, session = await raw_request(host, port, post("/session", dict(song_file=songs_csv)))
+        assert status == 200 and session["songs"] == 11
+        status, changed = await raw_request(host, port, post("/exclude", dict(session=session["session"], songs=["Althea"])))
+        assert changed == dict(changed=1)
+        status, result = await raw_request(host, port, post("/generate", dict(session=session["session"], seed=1, candidates=5, set_time=30)))
+        assert status == 200 and all("Althea" not in candidate["text"] for candidate in result["candidates"])
+        status, saved = await raw_request(host, port, post("/modify", dict(session=session["session"])))
+        assert status == 200 and saved == dict(changed=1)
+    with_server([songs_csv], client)
+
+def test_only_the_served_song_files_can_be_opened(songs_csv, write_csv, tmp_path):
+    other = write_csv([("A", "X", "E", "E Standard", 3, 5, True)], name="other.csv")
+    async def client(host, port):
+        for song_file in (other, str(tmp_path / "missing.csv"), "../../etc/passwd"):
+            status, body = await raw_request(host, port, post("/session", dict(song_file=song_file)))
+            assert status == 404 and "--csv" in body["error"]
+        status, body = await raw_request(host, port, post("/session", dict(song_file=["not", "a", "path"])))
+        assert status == 400
+    with_server([songs_csv], client)
+    assert not (tmp_path / "other.csv.active-journal").exists()
+
+def test_bad_content_length_is_a_bad_request(songs_csv):
+    async def client(host, port):
+        for length in ("abc", "-5"):
+            status, body = await raw_request(host, port, f"POST /health HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode("latin-1"))
+            assert status == 400 and body["error"] == "Bad Content-Length"
+        status, body = await raw_request(host, port, f"POST /health HTTP/1.1\r\nContent-Length: {server.MAX_BODY + 1}\r\n\r\n".encode("latin-1"))
+        assert status == 413
+    with_server([songs_csv], client)
+
+def test_unknown_path_and_bad_json(songs_csv):
+    async def client(host, port):
+        status, _ = await raw_request(host, port, post("/nowhere", {}))
+        assert status == 404
+        status, body = await raw_request(host, port, b"POST /session HTTP/1.1\r\nContent-Length: 1\r\nConnection: close\r\n\r\n[")
+        assert status == 400
+    with_server([songs_csv], client)
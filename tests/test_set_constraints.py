@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from cli import SPEC_KEYS, generate_show
+from generation import generate_candidates
+from set_constraints import ConstraintError, broken_rule, check_constraints, constrained_order
+
+PARAMS = dict(og_weight=1.2, mood_weight=0.8, cluster_size=2, candidates=10, kept_candidates=5,
+              fill=False, recency_weight=0)
+
+def test_order_follows_every_rule():
+    setlist = dict(Song=np.array(["a", "b", "c", "d", "e", "f"]), Artist=np.array(["X", "X", "Y", "Y", "Z", "W"]),
+                   Key=np.array(["E", "E", "Misc", "Misc", "D", "A"]),
+                   Tuning=np.array(["E Standard", "Drop D", "E Standard", "E Standard", "Drop D", "E Standard"]))
+    rules = check_constraints(dict(max_tuning_changes=1, artist_spacing=1, no_misc_segues=True, opener="f"))
+    order = constrained_order(setlist, rules)
+    assert broken_rule({column: values[order] for column, values in setlist.items()}, rules) is None
+
+def test_missing_pinned_song_is_an_error():
+    setlist = dict(Song=np.array(["a", "b"]), Artist=np.array(["X", "Y"]), Key=np.array(["E", "D"]), Tuning=np.array(["E Standard"] * 2))
+    with pytest.raises(ConstraintError) as error:
+        constrained_order(setlist, check_constraints(dict(opener="z")))
+    assert error.value.constraint == "opener"
+
+# A weak, long opener and songs in four tunings: the retunes push an optimized order over the set time, and the opener
+# is the first song trimming would drop
+def pinned_opener_csv(write_csv):
+    tunings = ["E Standard", "Drop D", "D Standard", "Eb Standard"]
+    rows = [("Opener", "A", "E", "E Standard", 6, 1, True)]
+    rows += [(f"Song {i}", f"Artist {i}", "ACDG"[i % 4], tunings[i % 4], 4, 8, True) for i in range(12)]
+    return write_csv(rows)
+
+PINNED_RULES = {"opener": "Opener", "max_tuning_changes": 3}
+
+# Trimming an optimized order to the set time used to drop the pinned opener without any error
+@pytest.mark.parametrize("seed", range(5))
+def test_optimized_order_keeps_the_pinned_opener(write_csv, seed):
+    rules = check_constraints(PINNED_RULES)
+    result = generate_candidates(pinned_opener_csv(write_csv), dict(PARAMS, set_time=34, transition_time=3.4, optimize_order=True, constraints=rules, seed=seed))
+    for setlist in result["candidate_setlists"]:
+        assert broken_rule(setlist, rules) is None
+
+@pytest.mark.parametrize("seed", range(5))
+def test_headless_optimized_order_keeps_the_pinned_opener(write_csv, seed):
+    spec = dict.fromkeys(SPEC_KEYS)
+    spec.update(name="setlist", csv=pinned_opener_csv(write_csv), set_time=34, og_weight=1.2, mood_weight=0.8, cluster_size=2, count=3, seed=seed,
+                fill=False, optimize_order=True, includes=[], excludes=[], recency_weight=0, recency_half_life=30, constraints=check_constraints(PINNED_RULES))
+    for setlist in generate_show(spec):
+        assert setlist["Song"][0] == "Opener"
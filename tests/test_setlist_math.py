@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from setlist_math import (catalog_arrays, category_codes, fitting_prefix_length, make_setlist_candidates, sample_setlist_batch, sample_setlist_indices,
+                          score_setlist_batch, setlist_lines, setlist_segues, song_weights, weighted_order)
+
+def test_weighted_order_draws_every_song_with_a_weight_once():
+    weights = np.array([1.0, 0.0, 2.0, np.nan, 3.0, -1.0])
+    pool = np.array([0, 1, 2, 3, 4, 5])
+    for seed in range(20):
+        assert sorted(weighted_order(weights, pool, np.random.default_rng(seed))) == [0, 2, 4]
+
+# Sorting by Exp(1) / weight picks the first song with probability weight / total, like drawing them one at a time
+def test_weighted_order_follows_the_weights():
+    weights = np.array([1.0, 2.0, 7.0])
+    rng = np.random.default_rng(0)
+    firsts = np.bincount([weighted_order(weights, np.arange(3), rng)[0] for _ in range(20000)], minlength=3) / 20000
+    assert np.allclose(firsts, weights / weights.sum(), atol=0.015)
+
+def test_prefix_stops_at_the_first_song_that_does_not_fit():
+    times = np.array([4.0, 3.0, 5.0, 1.0])
+    order = np.arange(4)
+    assert fitting_prefix_length(times, order, 10) == 2 # 4 + 3 fit, 5 overflows (the 1 after it is not tried)
+    assert fitting_prefix_length(times, order, 12) == 3 # Exactly used up
+    assert fitting_prefix_length(times, order, 3) == 0
+    assert fitting_prefix_length(times, order, 100) == 4
+
+@pytest.mark.parametrize("seed", range(10))
+def test_setlists_keep_the_includes_and_never_run_over(seed):
+    rng = np.random.default_rng(seed)
+    times = rng.choice([2.5, 3.0, 4.0, 5.5, 7.0], 40)
+    weights = rng.random(40) + 0.1
+    includes = np.array([5, 17, 30])
+    for fill in (False, True):
+        setlist = sample_setlist_indices(times, weights, 30, includes=includes, rng=rng, fill=fill)
+        assert setlist[:3].tolist() == includes.tolist()
+        assert len(set(setlist.tolist())) == len(setlist)
+        assert times[setlist].sum() <= 30
+
+def test_includes_that_do_not_fit_are_skipped():
+    times = np.array([20.0, 15.0, 5.0, 5.0])
+    with pytest.warns(UserWarning):
+        setlist = sample_setlist_indices(times, np.ones(4), 30, includes=[0, 1, 2], rng=np.random.default_rng(0))
+    assert setlist.tolist()[:2] == [0, 2] and times[setlist].sum() <= 30
+
+def test_segues_and_tunings_in_the_lines():
+    lines = setlist_lines(["a", "b", "c", "d", "e"], ["E", "E", "D", "Misc", "Misc"], ["E Standard", "E Standard", "Drop D", "Drop D", "Drop D"])
+    assert lines.tolist() == ["a -->", "b", "c (Drop D)", "d (Drop D)", "e (Drop D)"]
+
+# Missing tunings (or keys) never count as the same one, like in the original row by row loop
+def test_missing_tunings_never_segue():
+    tunings = pd.Series(["E Standard", None, None, "Drop D"], dtype="category")
+    assert setlist_lines(["a", "b", "c", "d"], ["E", "E", "E", "E"], tunings).tolist() == ["a", "b (nan)", "c (nan)", "d (Drop D)"]
+    assert not setlist_segues(np.array(["", "", "E", "E"]), np.array(["E Standard", "E Standard", "", ""])).any()
+
+SCORE_TIMES = np.array([5.0, 5.0, 5.0, 5.0, 5.0, 5.0])
+SCORE_MOODS = np.array([8.0, 8.0, 8.0, 8.0, 3.0, 3.0])
+SCORE_TUNINGS = np.array([0, 0, 1, 1, 0, 0])
+
+def test_fuller_sets_rank_higher():
+    scores = score_setlist_batch(np.array([[0, 1, 4, 5], [0, 1, -1, -1]]), SCORE_TIMES, SCORE_MOODS, SCORE_TUNINGS, 20)
+    assert scores[0] > scores[1]
+
+def test_fewer_tuning_changes_rank_higher():
+    scores = score_setlist_batch(np.array([[0, 1], [0, 2]]), SCORE_TIMES, SCORE_MOODS, SCORE_TUNINGS, 10)
+    assert scores[0] > scores[1]
+
+def test_stronger_sets_rank_higher():
+    scores = score_setlist_batch(np.array([[0, 1], [4, 5]]), SCORE_TIMES, SCORE_MOODS, SCORE_TUNINGS, 10)
+    assert scores[0] > scores[1]
+
+# The -1 padding after the end of a setlist doesn't count
+def test_padding_is_ignored():
+    padded = score_setlist_batch(np.array([[0, 4, -1, -1], [0, 1, 2, 3]]), SCORE_TIMES, SCORE_MOODS, SCORE_TUNINGS, 20)
+    alone = score_setlist_batch(np.array([[0, 4]]), SCORE_TIMES, SCORE_MOODS, SCORE_TUNINGS, 20)
+    assert padded[0] == pytest.approx(alone[0])
+    assert np.isfinite(score_setlist_batch(np.array([[-1, -1]]), SCORE_TIMES, SCORE_MOODS, SCORE_TUNINGS, 20)).all()
+
+def test_candidates_come_best_first(songs_csv):
+    from catalog import load_catalog
+    df = load_catalog(songs_csv)
+    ranked = make_setlist_candidates(df, 20, 1.2, 0.8, ["Althea"], n_candidates=50, top_k=5, rng=np.random.default_rng(0))
+    scores = [score for score, _ in ranked]
+    assert len(ranked) == 5 and scores == sorted(scores, reverse=True)
+    times, moods, _ = catalog_arrays(df)
+    candidates = sample_setlist_batch(times, song_weights(moods, np.asarray(df["Artist"] == "OG"), 1.2, 0.8), 20, 50,
+                                      includes=np.flatnonzero(df["Song"] == "Althea"), rng=np.random.default_rng(0))
+    best = score_setlist_batch(candidates, times, moods, category_codes(df["Tuning"]), 20).max()
+    assert scores[0] == pytest.approx(best) # Same seed, same candidates
+    for _, setlist in ranked:
+        assert "Althea" in setlist["Song"].tolist()
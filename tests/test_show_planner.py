@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from show_planner import ENCORE_MIN_MOOD, parse_sets, plan_show, show_fill, show_sets
+from song_library import SongLibrary
+
+def catalog(n=80, seed=0):
+    rng = np.random.default_rng(seed)
+    songs = pd.DataFrame(dict(Song=[f"Song {i}" for i in range(n)], Artist=rng.choice(["OG", "X", "Y"], n), Key=rng.choice(["E", "A", "D", "Misc"], n),
+                              Tuning=rng.choice(["E Standard", "Drop D", "Eb Standard"], n), Time=rng.choice([3.0, 4.0, 5.5, 7.0], n),
+                              Mood=rng.integers(1, 11, n), Active=rng.random(n) > 0.1))
+    library = SongLibrary(songs)
+    library.reset_excludes()
+    return library
+
+def test_parse_sets():
+    assert parse_sets("60, 45 mood 1.5, encore 15") == [dict(set_time=60.0), dict(mood_weight=1.5, set_time=45.0), dict(encore=True, name="Encore", set_time=15.0)]
+    with pytest.raises(ValueError):
+        parse_sets("60, 45 minutes")
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("optimize_order", [False, True])
+def test_no_song_is_played_twice(seed, optimize_order):
+    library = catalog(seed=seed)
+    library.include(["Song 3", "Song 40"])
+    show = plan_show(library, parse_sets("40, 40, encore 12"), 1.2, 0.8, rng=np.random.default_rng(seed), optimize_order=optimize_order)
+    positions = np.concatenate([planned["positions"] for planned in show])
+    assert len(set(positions.tolist())) == len(positions)
+    assert not library.excluded[positions].any() # Only songs from the active pool
+    assert set(library.included_positions().tolist()) <= set(positions.tolist())
+    for planned in show:
+        assert planned["song_time"] + (planned["transition_time"] if optimize_order else 0) <= planned["set_time"]
+
+@pytest.mark.parametrize("seed", range(10))
+def test_encore_is_strong_and_builds_up(seed):
+    library = catalog(seed=seed)
+    songs = library.songs
+    show = plan_show(library, parse_sets("30, encore 15"), 1.2, 0.8, rng=np.random.default_rng(seed))
+    encore = show[-1]
+    moods = songs["Mood"].to_numpy()[encore["positions"]]
+    assert len(moods) and (moods >= ENCORE_MIN_MOOD).all()
+    assert (np.diff(moods) >= 0).all() # From the weakest to the strongest
+    assert encore["name"] == "Encore"
+
+def test_show_sets_and_fill():
+    library = catalog()
+    show = plan_show(library, [dict(name="Early", set_time=20), dict(set_time=20, min_mood=6)], 1.2, 0.8, rng=np.random.default_rng(1))
+    sets = show_sets(library.songs, show)
+    assert [name for name, _ in sets] == ["Early", "Set 2"]
+    assert (sets[1][1]["Mood"] >= 6).all()
+    assert sets[0][1]["Song"].tolist() == library.names[show[0]["positions"]].tolist()
+    assert 0 < show_fill(show) <= 1
@@ -0,0 +1,43 @@
+import sqlite3
+
+import numpy as np
+
+import catalog
+import song_db
+
+def test_import_load_and_save_round_trip(songs_csv, tmp_path):
+    db = str(tmp_path / "repertoire.db") + "#band"
+    assert song_db.import_csv(songs_csv, db) == 11
+    songs = catalog.load_catalog(db)
+    assert songs["Song"].tolist() == catalog.load_catalog(songs_csv)["Song"].tolist()
+    active = catalog.active_values(songs["Active"])
+    active[0] = False
+    assert catalog.save_active_flags(db, active) == 1
+    assert (catalog.load_catalog(db)["Active"] == active).all() # The band's version changed, so it is loaded again
+    assert (catalog.load_catalog_columns(db)["Active"] == active).all()
+
+# The schema script only runs when the database is created, not on every connection
+def test_schema_is_only_created_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "repertoire.db")
+    song_db.connect(path).close()
+    statements = []
+    real_connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        connection = real_connect(*args, **kwargs)
+        connection.set_trace_callback(statements.append)
+        return connection
+    monkeypatch.setattr(song_db.sqlite3, "connect", traced_connect)
+    connection = song_db.connect(path)
+    assert not any("CREATE" in statement or "journal_mode" in statement for statement in statements)
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == song_db.SCHEMA_VERSION
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    connection.close()
+
+def test_old_database_is_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as connection:
+        connection.executescript(song_db.SCHEMA)
+    connection = song_db.connect(path)
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == song_db.SCHEMA_VERSION
+    connection.close()
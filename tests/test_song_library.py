@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from song_library import SongLibrary
+
+def library():
+    songs = pd.DataFrame(dict(Song=["a", "b", "c", "d", "b"], Active=[True, True, False, True, True]))
+    library = SongLibrary(songs)
+    library.reset_excludes()
+    return library
+
+def test_inactive_songs_start_out_excluded():
+    songs = library()
+    assert songs.excluded_songs == ["c"] and songs.included_songs == []
+    assert songs.active_pool().tolist() == [0, 1, 3, 4]
+
+# Including, excluding and removing move a song between the three states, and a song is never on both lists
+def test_state_transitions():
+    songs = library()
+    assert songs.include(["a", "c"]).tolist() == [0, 2]
+    assert songs.included_songs == ["a", "c"] and songs.excluded_songs == []
+    assert songs.exclude(["a"]).tolist() == [0]
+    assert songs.included_songs == ["c"] and songs.excluded_songs == ["a"]
+    assert songs.remove(["a", "c"]).tolist() == [0, 2]
+    assert songs.included_songs == [] and songs.excluded_songs == []
+    assert not (songs.included & songs.excluded).any()
+    assert songs.active_pool().tolist() == [0, 1, 2, 3, 4] and songs.included_positions().tolist() == []
+
+def test_songs_by_name_or_position():
+    songs = library()
+    assert songs.include(["b"]).tolist() == [1, 4] # Every row with that name
+    assert songs.exclude(np.array([4])).tolist() == [4]
+    assert songs.included_positions().tolist() == [1] and songs.excluded_songs == ["c", "b"]
+    assert songs.include([]).tolist() == [] and songs.include(["nope"]).tolist() == []
+
+def test_copies_have_their_own_state():
+    songs = library()
+    copy = songs.copy()
+    copy.include(["a"])
+    copy.exclude(["d"])
+    assert songs.included_songs == [] and songs.excluded_songs == ["c"]
+    assert copy.songs is songs.songs and len(copy) == 5
+
+def test_reset_excludes_starts_over():
+    songs = library()
+    songs.include(["a", "c"])
+    songs.exclude(["d"])
+    songs.reset_excludes()
+    assert songs.included_songs == [] and songs.excluded_songs == ["c"]
+
+def test_lists_of_a_headless_run():
+    songs = library()
+    songs.apply_lists(["a", "d"], ["d", "b"])
+    assert songs.included_songs == ["a", "d"] and songs.excluded_songs == ["b", "c", "b"]
+
+# A changed csv is loaded again with the includes and excludes carried over by name
+def test_refresh_keeps_the_lists(write_csv):
+    path = write_csv([("a", "X", "E", "E Standard", 3, 5, True), ("b", "X", "E", "E Standard", 3, 5, True)])
+    songs = SongLibrary.from_csv(path)
+    songs.include(["b"])
+    songs.exclude(["a"])
+    assert not songs.refresh()
+    with open(path, "a") as file:
+        file.write("c,X,E,E Standard,3,5,True\n")
+    assert songs.refresh()
+    assert songs.names.tolist() == ["a", "b", "c"]
+    assert songs.included_songs == ["b"] and songs.excluded_songs == ["a"]
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from song_search import MOOD_BANDS, SongIndex, normalize, search_index
+
+SONGS = pd.DataFrame(dict(Song=["Dream On", "Dream On", "Black Dog", "Beyoncé's Halo", "Dreamer"],
+                          Artist=["Led Zeppelin", "Aerosmith", "Led Zeppelin", "Beyoncé", "OG"],
+                          Key=["E", "A", "A", "Misc", np.nan], Tuning=["Drop D", "E Standard", "E Standard", "E Standard", "Drop D"],
+                          Mood=[7, 8, 9, 3, np.nan], Active=[True, True, False, True, True]))
+
+def test_every_word_is_the_start_of_a_song_or_artist_word():
+    index = SongIndex(SONGS)
+    assert index.search("zep dr").tolist() == [0]
+    assert index.search("dream").tolist() == [0, 1, 4]
+    assert index.search("DREAM ON aero").tolist() == [1]
+    assert index.search("ream").tolist() == [] # Only prefixes of words
+    assert index.search("led dog zzz").tolist() == []
+
+def test_accents_and_punctuation_are_ignored():
+    index = SongIndex(SONGS)
+    assert normalize("Beyoncé's Halo!") == "beyonce s halo "
+    assert index.search("beyonce halo").tolist() == [3]
+    assert index.search("Beyoncé's").tolist() == [3]
+
+def test_empty_search_matches_everything():
+    index = SongIndex(SONGS)
+    assert index.search().tolist() == [0, 1, 2, 3, 4]
+    assert index.search("  ", {"Key": []}).tolist() == [0, 1, 2, 3, 4]
+
+# Values of one facet are ORed, different facets ANDed, and the text search on top
+def test_facet_combinations():
+    index = SongIndex(SONGS)
+    assert index.search(facets={"Key": ["E", "A"]}).tolist() == [0, 1, 2]
+    assert index.search(facets={"Key": ["A"], "Active": [True]}).tolist() == [1]
+    assert index.search(facets={"Tuning": ["Drop D"], "OG": [True]}).tolist() == [4]
+    assert index.search(facets={"Mood": ["High (8-10)", "Low (1-4)"]}).tolist() == [1, 2, 3]
+    assert index.search("dream", {"Tuning": ["Drop D"]}).tolist() == [0, 4]
+    assert index.search("dream", {"Key": ["Nope"]}).tolist() == []
+
+def test_facet_values():
+    index = SongIndex(SONGS)
+    assert index.facet_values("Key") == ["A", "E", "Misc"] # Missing keys are not a value
+    assert index.facet_values("Mood") == list(MOOD_BANDS)
+    assert index.facet_values("Active") == [True, False]
+
+# Same results as checking every song one by one
+def test_matches_a_plain_search():
+    rng = np.random.default_rng(0)
+    words = ["love", "lovely", "dog", "black", "night", "nightmare", "sun", "rise"]
+    songs = pd.DataFrame(dict(Song=[" ".join(rng.choice(words, rng.integers(1, 4))) for _ in range(300)],
+                              Artist=rng.choice(["The Suns", "Night Band", "OG"], 300), Key=rng.choice(["E", "A"], 300),
+                              Tuning=rng.choice(["E Standard", "Drop D"], 300), Mood=rng.integers(1, 11, 300), Active=rng.random(300) > 0.5))
+    index = SongIndex(songs)
+    text = (songs["Song"] + " " + songs["Artist"]).map(normalize).str.split()
+    for query in ["lov", "night", "sun ri", "dog bl", "night band love", "x"]:
+        expected = [i for i, song_words in enumerate(text) if all(any(word.startswith(part) for word in song_words) for part in query.split())]
+        assert index.search(query).tolist() == expected
+        expected_a = [i for i in expected if songs["Key"][i] == "A" and songs["Active"][i]]
+        assert index.search(query, {"Key": ["A"], "Active": [True]}).tolist() == expected_a
+
+def test_index_is_built_once_per_catalog():
+    assert search_index(SONGS) is search_index(SONGS)
+    assert search_index(SONGS.copy()) is not search_index(SONGS)
@@ -0,0 +1,43 @@
+import argparse
+import csv
+
+import numpy as np
+
+from cli import SPEC_KEYS, generate_show
+from setlist_math import catalog_arrays, song_weights, sample_setlist_batch
+from song_library import SongLibrary
+from weight_analysis import run_analyze, simulate
+
+def analyze_args(csv_path, out, **options):
+    args = dict(csv=csv_path, out=out, set_time=20, transition_time=2, og_weight=1.2, mood_weight=0.8, cluster_size=2, setlists=4000,
+                sweep_setlists=500, og_grid="1,2", mood_grid="0,1", best_of=1, seed=0, recency_weight=0, recency_half_life=30, includes=[], excludes=[])
+    return argparse.Namespace(**dict(args, **options))
+
+def inclusion_column(path):
+    with open(path, newline="") as file:
+        return {row["Song"]: float(row["Inclusion"]) for row in csv.DictReader(file)}
+
+# The simulation draws its setlists differently, but must pick songs as often as the real sampler
+def test_simulation_matches_the_sampler(songs_csv):
+    library = SongLibrary.from_csv(songs_csv)
+    library.apply_lists(["Althea"], ["All My Love"])
+    simulated = simulate(library, 18, 1.2, 0.8, n_setlists=20000, seed=0)["inclusion"]
+    times, moods, is_og = catalog_arrays(library.songs)
+    candidates = sample_setlist_batch(times, song_weights(moods, is_og, 1.2, 0.8), 18, 20000, includes=library.included_positions(),
+                                      pool=library.active_pool(), rng=np.random.default_rng(0))
+    sampled = np.bincount(candidates[candidates >= 0], minlength=len(times)) / 20000
+    assert np.abs(simulated - sampled).max() < 0.02
+    assert simulated[library.positions(["Althea"])] == 1.0 and simulated[library.positions(["All My Love"])] == 0.0
+
+# A song on both lists is included by generate, so analyze must count it in every set too
+def test_analyze_uses_the_same_pool_as_generate(songs_csv, tmp_path, capsys):
+    out = str(tmp_path / "analysis.csv")
+    assert run_analyze(analyze_args(songs_csv, out, includes=["Althea", "All My Love"], excludes=["Althea", "Burn In Hell"])) == 0
+    inclusion = inclusion_column(out)
+    assert inclusion["Althea"] == 1.0 and inclusion["All My Love"] == 1.0 and inclusion["Burn In Hell"] == 0.0
+    spec = dict.fromkeys(SPEC_KEYS)
+    spec.update(name="setlist", csv=songs_csv, set_time=20, transition_time=2, og_weight=1.2, mood_weight=0.8, cluster_size=2, count=20, seed=0,
+                fill=False, optimize_order=False, includes=["Althea", "All My Love"], excludes=["Althea", "Burn In Hell"], recency_weight=0,
+                recency_half_life=30)
+    for setlist in generate_show(spec):
+        assert {"Althea", "All My Love"} <= set(setlist["Song"]) and "Burn In Hell" not in set(setlist["Song"])